@@ -0,0 +1,56 @@
+"""Benchmark: pd.read_fwf vs lector vectorizado (modules.lector_fwf) sobre un R1 sintético.
+
+Uso: python benchmarks/bench_lector_fwf.py [n_registros]
+"""
+
+import io
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from modules.lector_fwf import leer_fwf
+from modules.layouts_snc import LAYOUTS
+
+
+def generar_r1(n, seed=0):
+    """Genera un PRN R1 de n registros de 312 bytes (latin-1, CRLF)."""
+    rng = np.random.default_rng(seed)
+    nombres = np.array([n.ljust(100).encode('latin-1') for n in ['PEREZ GOMEZ JUAN', 'MUÑOZ ANA', 'RAMÍREZ LUIS', 'DE LA OSSA MARIA']])
+    direcciones = np.array([d.ljust(100).encode('latin-1') for d in ['CL 10 # 5-20', 'KR 25 # 18-03', 'LOTE EL PROGRESO', 'VDA LAS PEÑITAS']])
+    lineas = []
+    for i in range(n):
+        predial = f"{rng.integers(0, 3):02d}{i // 3:023d}"
+        lineas.append(
+            b'70' + b'215' + predial.encode() + b'1' + f"{i % 3 + 1:03d}".encode() + b'003'
+            + nombres[i % 4] + b'N' + b'C' + f"{rng.integers(1, 10**9):12d}".encode()
+            + direcciones[i % 4] + b'1' + b'A' + f"{rng.integers(0, 10**6):15d}".encode()
+            + f"{rng.integers(0, 10**4):6d}".encode() + f"{rng.integers(0, 10**9):15d}".encode()
+            + b'01012024' + b' ' * 15
+        )
+    return b'\r\n'.join(lineas) + b'\r\n'
+
+
+def cronometrar(func, repeticiones=3):
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        resultado = func()
+        mejor = min(mejor, time.perf_counter() - t0)
+    return mejor, resultado
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    data = generar_r1(n)
+    colspecs = LAYOUTS['R1'].colspecs
+
+    t_pandas, df_pandas = cronometrar(lambda: pd.read_fwf(io.BytesIO(data), colspecs=colspecs, header=None, encoding='latin-1', dtype=str), repeticiones=1)
+    t_np, df_np = cronometrar(lambda: leer_fwf(data, colspecs, encoding='latin-1'))
+
+    pd.testing.assert_frame_equal(df_pandas, df_np)
+    print(f"Registros: {n:,} ({len(data) / 1e6:.1f} MB)")
+    print(f"pd.read_fwf : {t_pandas:8.3f} s")
+    print(f"leer_fwf    : {t_np:8.3f} s  (x{t_pandas / t_np:.1f})")
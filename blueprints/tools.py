@@ -1,10 +1,14 @@
 """Blueprint: Herramientas existentes del portal (SNC, Avaluos, Auditoria, Renumeracion, GIS)."""
 
 from flask import Blueprint, render_template, request, send_file, flash, redirect, url_for, session, Response, jsonify
-from modules.snc_processor import procesar_dataframe
+from modules.snc_processor import procesar_dataframe, procesar_dataframe_streaming, procesar_csv_streaming, procesar_lote_zip, procesar_predios, FORMATOS_SALIDA, OPCION_PREDIOS
 from modules.db_logger import registrar_visita
-from modules.avaluo_analisis import procesar_incremento_web
-from modules.auditoria_maestra import procesar_auditoria, generar_pdf_auditoria
+from modules.avaluo_analisis import (procesar_incremento_web, procesar_barrido_web, procesar_departamento_zip, grilla_escenarios, consultar_resultados,
+                                     ruta_resultados, ruta_universo, ruta_exportacion, exportar_csv, exportar_resultados,
+                                     FILTROS_RESULTADO, POR_PAGINA, FORMATOS_EXPORTACION)
+from modules.avaluo_streaming import procesar_incremento_streaming
+from modules.auditoria_maestra import (procesar_auditoria, generar_pdf_auditoria, consultar_auditoria, variaciones_auditoria,
+                                       ruta_resultados_auditoria, ruta_resumen_auditoria, POR_PAGINA_AUDITORIA)
 from modules.renumeracion_auditor import procesar_renumeracion, generar_excel_renumeracion, procesar_geografica, generar_pdf_renumeracion
 from modules.renumeracion_informales import procesar_informales
 from modules.gis_converter import process_gdb_conversion
@@ -21,6 +25,29 @@ UPLOAD_FOLDER = 'temp_uploads'
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
+# Caché de parseo (Parquet por hash del contenido) para repetir análisis con otros parámetros
+CACHE_FOLDER = os.path.join(UPLOAD_FOLDER, 'cache')
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def enviar_y_borrar(path, download_name, mimetype, chunk_size=64 * 1024):
+    """Envía un archivo temporal al cliente por bloques y lo elimina al terminar."""
+    def generar():
+        try:
+            with open(path, 'rb') as f:
+                while True:
+                    data = f.read(chunk_size)
+                    if not data: break
+                    yield data
+        finally:
+            try: os.remove(path)
+            except: pass
+    return Response(generar(), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{download_name}"',
+        'Content-Length': str(os.path.getsize(path))
+    })
+
 
 # --- SNC ---
 @tools_bp.route('/snc', methods=['GET', 'POST'])
@@ -37,12 +64,74 @@ def snc_tool():
             return redirect(request.url)
         if file and opcion:
             try:
-                output_stream, new_filename = procesar_dataframe(file, opcion, file.filename)
+                formato = request.form.get('formato', 'xlsx')
+                if formato not in FORMATOS_SALIDA:
+                    flash('ERROR_FLUJO :: FORMATO_SALIDA_NO_ADMITIDO')
+                    return redirect(request.url)
+                if opcion == OPCION_PREDIOS:
+                    # R1 + R2: ambos archivos a disco y una fila por predio en un solo archivo
+                    file_r2 = request.files.get('archivo_r2')
+                    if not file_r2 or file_r2.filename == '':
+                        flash('ERROR_FLUJO :: ARCHIVO_R2_REQUERIDO_PARA_PREDIOS')
+                        return redirect(request.url)
+                    paths = [os.path.join(UPLOAD_FOLDER, f"snc_{tag}_{uuid.uuid4().hex}.txt") for tag in ('r1', 'r2')]
+                    file.save(paths[0])
+                    file_r2.save(paths[1])
+                    try:
+                        output_stream, new_filename = procesar_predios(paths[0], paths[1], file.filename, formato=formato)
+                    finally:
+                        for path in paths:
+                            if os.path.exists(path): os.remove(path)
+                    return send_file(output_stream, as_attachment=True, download_name=new_filename, mimetype=FORMATOS_SALIDA[formato][1])
+                if file.filename.lower().endswith('.zip'):
+                    # Lote: un archivo por proceso, ZIP de salidas + RESUMEN_LOTE.csv
+                    out_path = os.path.join(UPLOAD_FOLDER, f"snc_lote_{uuid.uuid4().hex}.zip")
+                    try:
+                        procesar_lote_zip(file.stream, opcion, out_path, formato=formato, directorio_trabajo=UPLOAD_FOLDER)
+                    except Exception:
+                        if os.path.exists(out_path): os.remove(out_path)
+                        raise
+                    base_name = os.path.splitext(file.filename)[0]
+                    return enviar_y_borrar(out_path, f"{base_name}_convertidos.zip", 'application/zip')
+                if request.form.get('modo') == 'streaming' and formato == 'xlsx':
+                    out_path = os.path.join(UPLOAD_FOLDER, f"snc_{uuid.uuid4().hex}.xlsx")
+                    try:
+                        new_filename, _ = procesar_dataframe_streaming(file.stream, opcion, file.filename, out_path)
+                    except Exception:
+                        if os.path.exists(out_path): os.remove(out_path)
+                        raise
+                    return enviar_y_borrar(out_path, new_filename, XLSX_MIMETYPE)
+                if request.form.get('modo') == 'streaming' and formato == 'csv.gz':
+                    # CSV comprimido enviado mientras se lee: la descarga empieza con el primer bloque
+                    in_path = os.path.join(UPLOAD_FOLDER, f"snc_in_{uuid.uuid4().hex}.txt")
+                    file.save(in_path)
+                    try:
+                        bloques, new_filename = procesar_csv_streaming(in_path, opcion, file.filename)
+                    except Exception:
+                        os.remove(in_path)
+                        raise
+
+                    def generar():
+                        try:
+                            yield from bloques
+                        finally:
+                            try: os.remove(in_path)
+                            except OSError: pass
+                    return Response(generar(), mimetype=FORMATOS_SALIDA[formato][1],
+                                    headers={'Content-Disposition': f'attachment; filename="{new_filename}"'})
+                # Guardar en disco: el lector mapea el archivo (mmap) en lugar de copiarlo a memoria
+                in_path = os.path.join(UPLOAD_FOLDER, f"snc_in_{uuid.uuid4().hex}.txt")
+                file.save(in_path)
+                try:
+                    output_stream, new_filename = procesar_dataframe(in_path, opcion, file.filename, formato=formato,
+                                                                     integridad=request.form.get('integridad') == '1')
+                finally:
+                    if os.path.exists(in_path): os.remove(in_path)
                 return send_file(
                     output_stream,
                     as_attachment=True,
                     download_name=new_filename,
-                    mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+                    mimetype='application/zip' if new_filename.endswith('.zip') else FORMATOS_SALIDA[formato][1]
                 )
             except Exception as e:
                 flash(f"Error al procesar: {str(e)}")
@@ -81,15 +170,120 @@ def avaluos_tool():
         try:
             sample_pct = request.form.get('sample_pct', 100)
             zona_filter = request.form.get('zona_filter', 'TODOS')
-            resultados = procesar_incremento_web(f_pre_final, f_post_final, pct_u, pct_r, sample_pct=sample_pct, zona_filter=zona_filter)
+            if request.form.get('modo') == 'streaming':
+                # Cruce por bloques de archivos ordenados por NPN: memoria acotada, sin muestreo ni outliers
+                resultados = procesar_incremento_streaming(f_pre_final, f_post_final, pct_u, pct_r, zona_filter=zona_filter,
+                                                           directorio_resultados=UPLOAD_FOLDER)
+            else:
+                resultados = procesar_incremento_web(f_pre_final, f_post_final, pct_u, pct_r, sample_pct=sample_pct,
+                                                     zona_filter=zona_filter, directorio_cache=CACHE_FOLDER,
+                                                     directorio_resultados=UPLOAD_FOLDER)
+            # La tabla detallada queda en Parquet: la vista la pide por páginas a /avaluos/resultados
+            borrar_resultados_avaluo()
+            session['avaluo_resultado_id'] = resultados['resultado_id']
             return render_template('avaluo_tool.html', resultados=resultados, session_data=session)
         except Exception as e:
             flash(f"Error en análisis: {str(e)}")
             return redirect(request.url)
     return render_template('avaluo_tool.html', resultados=None, session_data=session)
 
+@tools_bp.route('/avaluos/resultados')
+def avaluos_resultados():
+    """Página JSON de la tabla de resultados: ?pagina, por_pagina, orden, desc, estado, zona, destino, cambio, q."""
+    resultado_id = session.get('avaluo_resultado_id')
+    if not resultado_id or not os.path.exists(ruta_resultados(UPLOAD_FOLDER, resultado_id)):
+        return jsonify({'error': 'No hay resultados de análisis en la sesión.'}), 404
+    args = request.args
+    try:
+        pagina = int(args.get('pagina', 1))
+        por_pagina = int(args.get('por_pagina', POR_PAGINA))
+    except ValueError:
+        return jsonify({'error': 'Parámetros de paginación inválidos.'}), 400
+    filtros = {col: args.getlist(param) for param, col in FILTROS_RESULTADO.items()}
+    try:
+        return jsonify(consultar_resultados(ruta_resultados(UPLOAD_FOLDER, resultado_id), pagina, por_pagina,
+                                            orden=args.get('orden'), descendente=args.get('desc') == '1',
+                                            filtros=filtros, busqueda=args.get('q'), cambio=args.get('cambio')))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@tools_bp.route('/avaluos/barrido', methods=['POST'])
+def avaluos_barrido():
+    """Conteos y totales por escenario para la grilla pcts_urbano x pcts_rural (listas separadas por coma)."""
+    f_pre, f_post = session.get('path_pre'), session.get('path_post')
+    if not f_pre or not f_post or not os.path.exists(f_pre) or not os.path.exists(f_post):
+        return jsonify({'error': 'Debe cargar ambos archivos (Base y Sistema) para realizar el barrido.'}), 404
+    try:
+        listas = [[float(v) for v in request.form.get(key, '').replace(';', ',').split(',') if v.strip()]
+                  for key in ('pcts_urbano', 'pcts_rural')]
+        escenarios = grilla_escenarios(*listas)
+    except ValueError as e:
+        return jsonify({'error': f"Escenarios inválidos: {str(e)}"}), 400
+    try:
+        return jsonify(procesar_barrido_web(f_pre, f_post, escenarios, zona_filter=request.form.get('zona_filter', 'TODOS'),
+                                            directorio_cache=CACHE_FOLDER))
+    except Exception as e:
+        return jsonify({'error': f"Error en barrido: {str(e)}"}), 500
+
+@tools_bp.route('/avaluos/exportar')
+def avaluos_exportar():
+    """Universo completo de la comparación: ?formato=csv|xlsx|parquet&zona=TODOS|URBANO|RURAL|CORREG."""
+    resultado_id = session.get('avaluo_resultado_id')
+    if not resultado_id or not os.path.exists(ruta_resultados(UPLOAD_FOLDER, resultado_id)):
+        return jsonify({'error': 'No hay resultados de análisis en la sesión.'}), 404
+    formato = request.args.get('formato', 'csv')
+    zona = request.args.get('zona', 'TODOS')
+    if formato not in FORMATOS_EXPORTACION or zona not in ('TODOS', 'URBANO', 'RURAL', 'CORREG'):
+        return jsonify({'error': 'Formato o zona de exportación inválidos.'}), 400
+    ruta = ruta_exportacion(UPLOAD_FOLDER, resultado_id)
+    extension, mimetype = FORMATOS_EXPORTACION[formato]
+    nombre = f"comparacion_avaluos_{zona.lower()}{extension}"
+    if formato == 'csv':
+        # CSV directo al cliente lote a lote, sin archivo intermedio
+        return Response(exportar_csv(ruta, zona), mimetype=mimetype,
+                        headers={'Content-Disposition': f'attachment; filename="{nombre}"'})
+    out_path = os.path.join(UPLOAD_FOLDER, f"avaluo_export_{uuid.uuid4().hex}{extension}")
+    try:
+        exportar_resultados(ruta, formato, out_path, zona)
+    except Exception:
+        if os.path.exists(out_path): os.remove(out_path)
+        raise
+    return enviar_y_borrar(out_path, nombre, mimetype)
+
+def borrar_resultados_avaluo():
+    resultado_id = session.pop('avaluo_resultado_id', None)
+    if resultado_id:
+        for ruta in (ruta_resultados(UPLOAD_FOLDER, resultado_id), ruta_universo(UPLOAD_FOLDER, resultado_id)):
+            try: os.remove(ruta)
+            except OSError: pass
+
+@tools_bp.route('/avaluos/departamento', methods=['GET', 'POST'])
+def avaluos_departamento():
+    registrar_visita('/avaluos/departamento')
+    if request.method == 'POST':
+        zip_pre = request.files.get('zip_pre')
+        zip_post = request.files.get('zip_post')
+        if not zip_pre or not zip_pre.filename or not zip_post or not zip_post.filename:
+            flash('Debe cargar ambos ZIP (Base y Sistema) con un archivo por municipio.')
+            return redirect(request.url)
+        def get_float_param(key):
+             val = request.form.get(key, '')
+             try: return float(val) if val else 0.0
+             except: return 0.0
+        try:
+            # Un par de archivos (municipio) por proceso; el resultado es solo el consolidado
+            resultados = procesar_departamento_zip(zip_pre.stream, zip_post.stream, get_float_param('pct_urbano'),
+                                                   get_float_param('pct_rural'), zona_filter=request.form.get('zona_filter', 'TODOS'),
+                                                   directorio_trabajo=UPLOAD_FOLDER, directorio_cache=CACHE_FOLDER)
+            return render_template('avaluo_departamento.html', resultados=resultados)
+        except Exception as e:
+            flash(f"Error en análisis departamental: {str(e)}")
+            return redirect(request.url)
+    return render_template('avaluo_departamento.html', resultados=None)
+
 @tools_bp.route('/clear_analysis')
 def clear_analysis():
+    borrar_resultados_avaluo()
     for key in ['path_pre', 'path_post']:
         path = session.get(key)
         if path and os.path.exists(path):
@@ -104,6 +298,24 @@ def clear_analysis():
 
 
 # --- AUDITORIA ---
+def borrar_resultados_auditoria():
+    audit_id = session.pop('audit_id', None)
+    if audit_id:
+        for ruta in (ruta_resumen_auditoria(UPLOAD_FOLDER, audit_id), ruta_resultados_auditoria(UPLOAD_FOLDER, audit_id)):
+            try: os.remove(ruta)
+            except OSError: pass
+
+def cargar_resumen_auditoria(audit_id):
+    """KPIs de la auditoría guardados junto a la tabla, o None si expiraron o son de una versión anterior."""
+    ruta = ruta_resumen_auditoria(UPLOAD_FOLDER, audit_id)
+    if not os.path.exists(ruta) or not os.path.exists(ruta_resultados_auditoria(UPLOAD_FOLDER, audit_id)):
+        return None
+    with open(ruta, 'r', encoding='utf-8') as f:
+        resultados = json.load(f)
+    if 'avaluo_precierre' not in resultados.get('totales', {}):
+        return None
+    return resultados
+
 @tools_bp.route('/auditoria', methods=['GET', 'POST'])
 def auditoria_tool():
     registrar_visita('/auditoria')
@@ -117,47 +329,58 @@ def auditoria_tool():
         try:
             files_dict = {f_prop.filename: f_prop, f_calc.filename: f_calc}
             zona = request.form.get('zona', 'General')
-            res = procesar_auditoria(files_dict, incremento, zona_filtro=zona)
-            audit_id = str(uuid.uuid4())
-            audit_path = os.path.join(UPLOAD_FOLDER, f"audit_{audit_id}.json")
-            with open(audit_path, 'w', encoding='utf-8') as f:
+            # La tabla por predio queda en Parquet; aquí solo se guarda el resumen
+            res = procesar_auditoria(files_dict, incremento, zona_filtro=zona, directorio_resultados=UPLOAD_FOLDER)
+            borrar_resultados_auditoria()
+            with open(ruta_resumen_auditoria(UPLOAD_FOLDER, res['resultado_id']), 'w', encoding='utf-8') as f:
                 json.dump(res, f, ensure_ascii=False)
-            session['audit_id'] = audit_id
+            session['audit_id'] = res['resultado_id']
             return render_template('auditoria_tool.html', resultados=res)
         except Exception as e:
             traceback.print_exc()
             flash(f"Error procesando auditoría: {str(e)}")
             return redirect(request.url)
-    audit_id = session.get('audit_id')
     resultados = None
+    audit_id = session.get('audit_id')
     if audit_id:
-        audit_path = os.path.join(UPLOAD_FOLDER, f"audit_{audit_id}.json")
-        if os.path.exists(audit_path):
-            try:
-                with open(audit_path, 'r', encoding='utf-8') as f:
-                    resultados = json.load(f)
-                if resultados and 'totales' in resultados and 'avaluo_precierre' not in resultados['totales']:
-                    resultados = None
-                    session.pop('audit_id', None)
-            except:
-                resultados = None
-                session.pop('audit_id', None)
+        try:
+            resultados = cargar_resumen_auditoria(audit_id)
+        except Exception:
+            resultados = None
+        if resultados is None:
+            session.pop('audit_id', None)
     return render_template('auditoria_tool.html', resultados=resultados)
 
+@tools_bp.route('/auditoria/resultados')
+def auditoria_resultados():
+    """Página JSON de la tabla de auditoría: ?pagina, por_pagina, q."""
+    audit_id = session.get('audit_id')
+    if not audit_id or not os.path.exists(ruta_resultados_auditoria(UPLOAD_FOLDER, audit_id)):
+        return jsonify({'error': 'No hay resultados de auditoría en la sesión.'}), 404
+    try:
+        pagina = int(request.args.get('pagina', 1))
+        por_pagina = int(request.args.get('por_pagina', POR_PAGINA_AUDITORIA))
+    except ValueError:
+        return jsonify({'error': 'Parámetros de paginación inválidos.'}), 400
+    return jsonify(consultar_auditoria(ruta_resultados_auditoria(UPLOAD_FOLDER, audit_id), pagina, por_pagina,
+                                       busqueda=request.args.get('q')))
+
 @tools_bp.route('/auditoria/pdf')
 def auditoria_pdf():
     audit_id = session.get('audit_id')
     if not audit_id:
         flash('No hay resultados para generar PDF. Ejecute la auditoría primero.')
         return redirect(url_for('tools.auditoria_tool'))
-    audit_path = os.path.join(UPLOAD_FOLDER, f"audit_{audit_id}.json")
-    if not os.path.exists(audit_path):
+    try:
+        resultados = cargar_resumen_auditoria(audit_id)
+    except Exception:
+        resultados = None
+    if resultados is None:
         flash('La sesión de auditoría ha expirado o el archivo fue borrado.')
         return redirect(url_for('tools.auditoria_tool'))
     try:
-        with open(audit_path, 'r', encoding='utf-8') as f:
-            resultados = json.load(f)
-        if 'full_data' in resultados: del resultados['full_data']
+        # Del Parquet solo se lee la columna de variaciones para el boxplot
+        resultados['variaciones_all'] = variaciones_auditoria(ruta_resultados_auditoria(UPLOAD_FOLDER, audit_id))
         pdf_bytes = generar_pdf_auditoria(resultados)
         return Response(pdf_bytes, mimetype="application/pdf", headers={"Content-disposition": "attachment; filename=Reporte_Auditoria.pdf"})
     except Exception as e:
@@ -166,13 +389,7 @@ def auditoria_pdf():
 
 @tools_bp.route('/clear_auditoria')
 def clear_auditoria():
-    audit_id = session.get('audit_id')
-    if audit_id:
-        audit_path = os.path.join(UPLOAD_FOLDER, f"audit_{audit_id}.json")
-        if os.path.exists(audit_path):
-            try: os.remove(audit_path)
-            except: pass
-    session.pop('audit_id', None)
+    borrar_resultados_auditoria()
     session.pop('last_auditoria', None)
     for key in ['path_pre', 'path_post']:
         path = session.get(key)
@@ -0,0 +1,335 @@
+"""Línea de comandos para correr las herramientas del portal sin pasar por HTTP.
+
+Cada subcomando recibe archivos o carpetas, escribe los resultados en --salida y
+deja un tiempos.json con la duración y el estado de cada tarea. Con --jobs N las
+tareas independientes (un archivo o un par de archivos) se reparten en N procesos.
+
+Ejemplos:
+    python cli.py snc entregas/sucre/ --opcion 1 --formato parquet --jobs 4 --salida out/
+    python cli.py predios R1.txt R2.txt --formato parquet --salida out/
+    python cli.py avaluos base/ sistema/ --pct-urbano 3 --pct-rural 4 --salida out/
+    python cli.py avaluos R1_base.txt R1_sistema.txt --pct-urbano 3 --streaming --salida out/
+    python cli.py departamento base/ sistema/ --pct-urbano 3 --pct-rural 4 --jobs 4 --salida out/
+    python cli.py auditoria R1.xlsx LISTADO.xlsx --incremento 3 --pdf --salida out/
+    python cli.py renumeracion reportes/ --tipo 1 --jobs 2 --salida out/
+    python cli.py informales --informal inf.zip --formal formal.zip --salida out/
+    python cli.py gis gdbs/ --jobs 2 --salida out/
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+EXTENSIONES_SNC = ('.txt', '.prn')
+EXTENSIONES_EXCEL = ('.xlsx', '.xls')
+EXTENSIONES_AVALUO = ('.txt', '.prn', '.csv', '.xlsx', '.xls')
+
+
+def expandir_entradas(entradas, extensiones):
+    """Lista los archivos dados y los de las carpetas dadas (sin recursión) con esas extensiones."""
+    archivos = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            for nombre in sorted(os.listdir(entrada)):
+                ruta = os.path.join(entrada, nombre)
+                if os.path.isfile(ruta) and nombre.lower().endswith(extensiones):
+                    archivos.append(ruta)
+        elif os.path.isfile(entrada):
+            archivos.append(entrada)
+        else:
+            raise FileNotFoundError(f"No existe: {entrada}")
+    return archivos
+
+
+def prefijos_salida(rutas):
+    """
+    Prefijo para el nombre de salida de cada ruta: vacío si su nombre sin extensión es único
+    en el lote; si se repite (mun_a/R1.txt y mun_b/R1.txt, o R1.txt y R1.prn), la carpeta y,
+    si también se repite, un consecutivo. Así ninguna tarea sobrescribe la salida de otra.
+    """
+    conteo = Counter(_base(r) for r in rutas)
+    repetidos = {n for n, veces in conteo.items() if veces > 1}
+    usados = set()
+    prefijos = []
+    for ruta in rutas:
+        nombre = _base(ruta)
+        if nombre not in repetidos:
+            prefijos.append('')
+            continue
+        carpeta = os.path.basename(os.path.dirname(os.path.abspath(ruta))) or 'raiz'
+        prefijo, i = f"{carpeta}_", 2
+        while (prefijo, nombre) in usados:
+            prefijo, i = f"{carpeta}_{i}_", i + 1
+        usados.add((prefijo, nombre))
+        prefijos.append(prefijo)
+    return prefijos
+
+
+def emparejar(pre, post, extensiones):
+    """Pares (pre, post): dos archivos, o dos carpetas emparejadas por nombre de archivo."""
+    if os.path.isdir(pre) and os.path.isdir(post):
+        por_nombre = {os.path.basename(r): r for r in expandir_entradas([post], extensiones)}
+        return [(r, por_nombre[os.path.basename(r)]) for r in expandir_entradas([pre], extensiones)
+                if os.path.basename(r) in por_nombre]
+    return [(pre, post)]
+
+
+def guardar_json(datos, ruta):
+    with open(ruta, 'w', encoding='utf-8') as f:
+        json.dump(datos, f, ensure_ascii=False, default=str, indent=1)
+    return ruta
+
+
+def _base(ruta):
+    return os.path.splitext(os.path.basename(ruta))[0]
+
+
+# =============================================================================
+# TAREAS (funciones de módulo para poder enviarlas a otros procesos)
+# =============================================================================
+def tarea_snc(ruta, opcion, formato, salida, prefijo=''):
+    from modules.snc_processor import convertir_archivo_lote
+    temporal = os.path.join(salida, f".{prefijo}{_base(ruta)}.{os.getpid()}.tmp")
+    resumen = convertir_archivo_lote(ruta, os.path.basename(ruta), opcion, formato, temporal)
+    if resumen['estado'] != 'OK':
+        if os.path.exists(temporal): os.remove(temporal)
+        raise RuntimeError(resumen['error'])
+    destino = os.path.join(salida, prefijo + resumen['salida'])
+    os.replace(temporal, destino)
+    return {'salidas': [destino], 'filas': resumen['filas'], 'anomalias_longitud': resumen['anomalias_longitud'],
+            'predios_inconsistentes': resumen['predios_inconsistentes'], 'duplicados': resumen['duplicados']}
+
+
+def tarea_predios(ruta_r1, ruta_r2, formato, salida, prefijo=''):
+    from modules.snc_processor import procesar_predios
+    output, nombre = procesar_predios(ruta_r1, ruta_r2, os.path.basename(ruta_r1), formato=formato)
+    destino = os.path.join(salida, prefijo + nombre)
+    with open(destino, 'wb') as f:
+        f.write(output.getbuffer())
+    return {'salidas': [destino]}
+
+
+def tarea_avaluos(ruta_pre, ruta_post, pct_urbano, pct_rural, zona, outliers_por_municipio, streaming, salida, prefijo=''):
+    if streaming:
+        # Tabla de resultados en Parquet junto al JSON de KPIs (el JSON no trae filas)
+        from modules.avaluo_streaming import procesar_incremento_streaming
+        from modules.avaluo_analisis import ruta_resultados
+        res = procesar_incremento_streaming(ruta_pre, ruta_post, pct_urbano, pct_rural, zona_filter=zona, directorio_resultados=salida)
+        tabla = os.path.join(salida, f"{prefijo}{_base(ruta_post)}_avaluos.parquet")
+        os.replace(ruta_resultados(salida, res['resultado_id']), tabla)
+        destino = guardar_json(res, os.path.join(salida, f"{prefijo}{_base(ruta_post)}_avaluos.json"))
+        return {'salidas': [destino, tabla], 'filas': res['stats']['total_registros_universo']}
+    from modules.avaluo_analisis import procesar_incremento_web
+    res = procesar_incremento_web(ruta_pre, ruta_post, pct_urbano, pct_rural, zona_filter=zona,
+                                  outliers_por_municipio=outliers_por_municipio)
+    destino = guardar_json(res, os.path.join(salida, f"{prefijo}{_base(ruta_post)}_avaluos.json"))
+    return {'salidas': [destino], 'filas': res['stats']['total_registros_universo']}
+
+
+def tarea_departamento(ruta_pre, ruta_post, pct_urbano, pct_rural, zona, jobs, salida):
+    from modules.avaluo_analisis import procesar_departamento
+    pares = [(os.path.basename(a), a, b) for a, b in emparejar(ruta_pre, ruta_post, EXTENSIONES_AVALUO)]
+    res = procesar_departamento(pares, pct_urbano, pct_rural, zona, max_workers=jobs)
+    destino = guardar_json(res, os.path.join(salida, "departamento_avaluos.json"))
+    return {'salidas': [destino], 'filas': res['stats']['total_registros_universo']}
+
+
+def tarea_auditoria(ruta_prop, ruta_calc, incremento, zona, pdf, salida):
+    from modules.auditoria_maestra import procesar_auditoria, generar_pdf_auditoria
+    with open(ruta_prop, 'rb') as f_prop, open(ruta_calc, 'rb') as f_calc:
+        res = procesar_auditoria({os.path.basename(ruta_prop): f_prop, os.path.basename(ruta_calc): f_calc}, incremento, zona_filtro=zona)
+    salidas = [guardar_json(res, os.path.join(salida, f"{_base(ruta_prop)}_auditoria.json"))]
+    if pdf:
+        resumen = {k: v for k, v in res.items() if k != 'full_data'}
+        ruta_pdf = os.path.join(salida, f"{_base(ruta_prop)}_auditoria.pdf")
+        with open(ruta_pdf, 'wb') as f:
+            f.write(generar_pdf_auditoria(resumen))
+        salidas.append(ruta_pdf)
+    return {'salidas': salidas, 'filas': res['total_predios']}
+
+
+def tarea_renumeracion(ruta, tipo, col_snc, col_ant, col_estado, salida, prefijo=''):
+    from modules.renumeracion_auditor import procesar_renumeracion, generar_excel_renumeracion
+    with open(ruta, 'rb') as f:
+        res = procesar_renumeracion(f, tipo, col_snc_manual=col_snc, col_ant_manual=col_ant, col_estado_manual=col_estado)
+    salidas = [guardar_json(res, os.path.join(salida, f"{prefijo}{_base(ruta)}_renumeracion.json"))]
+    ruta_excel = os.path.join(salida, f"{prefijo}{_base(ruta)}_REPORTE_RENUMERACION.xlsx")
+    with open(ruta_excel, 'wb') as f:
+        f.write(generar_excel_renumeracion(res['errores']).getvalue())
+    salidas.append(ruta_excel)
+    return {'salidas': salidas, 'filas': res['total_auditado']}
+
+
+def tarea_informales(ruta_informal, ruta_formal, prefijo, salida):
+    from modules.renumeracion_informales import procesar_informales
+    res = procesar_informales({'zip_inf': ruta_informal, 'zip_formal': ruta_formal}, salida, prefijo)
+    if res['status'] == 'error':
+        raise RuntimeError(res.get('message'))
+    return {'salidas': [res['zip_path']], 'filas': res.get('total_procesados', 0)}
+
+
+def tarea_gis(ruta, salida, prefijo=''):
+    from modules.gis_converter import process_gdb_conversion
+    destino = process_gdb_conversion(ruta, salida)
+    if prefijo:
+        # El GeoPackage ya lleva un id de tarea; el prefijo indica de qué carpeta vino el ZIP
+        destino_final = os.path.join(os.path.dirname(destino), prefijo + os.path.basename(destino))
+        os.replace(destino, destino_final)
+        destino = destino_final
+    return {'salidas': [destino]}
+
+
+def _cronometrar(funcion, args):
+    """Corre una tarea y arma su registro para tiempos.json (los errores no detienen el lote)."""
+    t0 = time.perf_counter()
+    registro = {'tarea': funcion.__name__, 'entradas': [a for a in args if isinstance(a, str) and os.path.isfile(a)]}
+    try:
+        registro.update(funcion(*args))
+        registro['estado'] = 'OK'
+    except Exception as e:
+        registro['estado'] = 'ERROR'
+        registro['error'] = str(e)
+    registro['segundos'] = round(time.perf_counter() - t0, 3)
+    return registro
+
+
+def ejecutar(funcion, tareas, jobs, salida):
+    """Ejecuta las tareas en serie o en `jobs` procesos y escribe tiempos.json en `salida`."""
+    inicio = datetime.now().isoformat(timespec='seconds')
+    t0 = time.perf_counter()
+    jobs = max(1, min(jobs, len(tareas)))
+    if jobs == 1:
+        registros = [_cronometrar(funcion, args) for args in tareas]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            registros = list(pool.map(_cronometrar, [funcion] * len(tareas), tareas))
+    resumen = {
+        'inicio': inicio,
+        'jobs': jobs,
+        'tareas': len(registros),
+        'errores': sum(1 for r in registros if r['estado'] != 'OK'),
+        'segundos_total': round(time.perf_counter() - t0, 3),
+        'detalle': registros,
+    }
+    guardar_json(resumen, os.path.join(salida, 'tiempos.json'))
+    for r in registros:
+        estado = r['estado'] if r['estado'] == 'OK' else f"{r['estado']}: {r.get('error')}"
+        print(f"[{r['segundos']:8.2f}s] {', '.join(r['entradas']) or r['tarea']} -> {estado}")
+    print(f"{resumen['tareas']} tareas, {resumen['errores']} con error, {resumen['segundos_total']} s. Resumen: {os.path.join(salida, 'tiempos.json')}")
+    return resumen
+
+
+# =============================================================================
+# ARGUMENTOS
+# =============================================================================
+def crear_parser():
+    parser = argparse.ArgumentParser(prog='cli.py', description="Herramientas del portal IGAC por línea de comandos.")
+    comunes = argparse.ArgumentParser(add_help=False)
+    comunes.add_argument('--salida', '-o', default='salida_cli', help="Carpeta de resultados (se crea si no existe)")
+    comunes.add_argument('--jobs', '-j', type=int, default=1, help="Procesos en paralelo (por defecto 1)")
+    sub = parser.add_subparsers(dest='herramienta', required=True)
+
+    p = sub.add_parser('snc', parents=[comunes], help="Convertidor de archivos planos SNC")
+    p.add_argument('entradas', nargs='+', help="Archivos .txt/.prn o carpetas")
+    p.add_argument('--opcion', required=True, choices=['1', '2', '3', '4', '5', '6'], help="1=R1, 2=R2, 3=T1, 4=T2, 5=T3, 6=T1+T2+T3")
+    p.add_argument('--formato', default='xlsx', choices=['xlsx', 'parquet', 'csv.gz', 'feather'])
+
+    p = sub.add_parser('predios', parents=[comunes], help="R1 + R2 unidos en una fila por predio")
+    p.add_argument('r1', help="Archivo R1 (o carpeta, emparejada por nombre con 'r2')")
+    p.add_argument('r2', help="Archivo R2 (o carpeta)")
+    p.add_argument('--formato', default='parquet', choices=['xlsx', 'parquet', 'csv.gz', 'feather'])
+
+    p = sub.add_parser('avaluos', parents=[comunes], help="Comparación de avalúos Base vs Sistema")
+    p.add_argument('pre', help="Archivo base (o carpeta, emparejada por nombre con 'post')")
+    p.add_argument('post', help="Archivo sistema (o carpeta)")
+    p.add_argument('--pct-urbano', type=float, default=0.0)
+    p.add_argument('--pct-rural', type=float, default=0.0)
+    p.add_argument('--zona', default='TODOS', choices=['TODOS', 'URBANO', 'RURAL', 'CORREG'])
+    p.add_argument('--outliers-por-municipio', action='store_true', help="Límites de outliers por zona, destino y municipio")
+    p.add_argument('--streaming', action='store_true',
+                   help="Cruce por bloques con memoria acotada (planos ordenados por NPN, sin outliers)")
+
+    p = sub.add_parser('departamento', parents=[comunes], help="Comparación de avalúos de varios municipios con consolidado")
+    p.add_argument('pre', help="Carpeta de archivos base (uno por municipio)")
+    p.add_argument('post', help="Carpeta de archivos sistema, emparejados por nombre")
+    p.add_argument('--pct-urbano', type=float, default=0.0)
+    p.add_argument('--pct-rural', type=float, default=0.0)
+    p.add_argument('--zona', default='TODOS', choices=['TODOS', 'URBANO', 'RURAL', 'CORREG'])
+
+    p = sub.add_parser('auditoria', parents=[comunes], help="Auditoría maestra de cierre")
+    p.add_argument('propietarios', help="Excel de propietarios (R1)")
+    p.add_argument('listado', help="Excel del listado de cierre")
+    p.add_argument('--incremento', type=float, default=3)
+    p.add_argument('--zona', default='General')
+    p.add_argument('--pdf', action='store_true', help="Genera también el reporte PDF")
+
+    p = sub.add_parser('renumeracion', parents=[comunes], help="Auditoría de renumeración (fase 1)")
+    p.add_argument('entradas', nargs='+', help="Reportes Excel o carpetas")
+    p.add_argument('--tipo', default='1')
+    p.add_argument('--col-snc')
+    p.add_argument('--col-ant')
+    p.add_argument('--col-estado')
+
+    p = sub.add_parser('informales', parents=[comunes], help="Renumeración de predios informales")
+    p.add_argument('--informal', help="ZIP con la GDB informal")
+    p.add_argument('--formal', help="ZIP con la GDB formal")
+    p.add_argument('--prefijo', default='200000')
+
+    p = sub.add_parser('gis', parents=[comunes], help="Conversión GDB (.zip) a GeoPackage")
+    p.add_argument('entradas', nargs='+', help="ZIPs con GDB o carpetas")
+    return parser
+
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+    salida = os.path.abspath(args.salida)
+    os.makedirs(salida, exist_ok=True)
+
+    if args.herramienta == 'snc':
+        funcion = tarea_snc
+        rutas = expandir_entradas(args.entradas, EXTENSIONES_SNC)
+        tareas = [(r, args.opcion, args.formato, salida, p) for r, p in zip(rutas, prefijos_salida(rutas))]
+    elif args.herramienta == 'predios':
+        funcion = tarea_predios
+        pares = emparejar(args.r1, args.r2, EXTENSIONES_SNC)
+        tareas = [(a, b, args.formato, salida, p) for (a, b), p in zip(pares, prefijos_salida([a for a, _ in pares]))]
+    elif args.herramienta == 'avaluos':
+        funcion = tarea_avaluos
+        pares = emparejar(args.pre, args.post, EXTENSIONES_AVALUO)
+        tareas = [(a, b, args.pct_urbano, args.pct_rural, args.zona, args.outliers_por_municipio, args.streaming, salida, p)
+                  for (a, b), p in zip(pares, prefijos_salida([b for _, b in pares]))]
+    elif args.herramienta == 'departamento':
+        # Una sola tarea: los pares se reparten en --jobs procesos dentro de procesar_departamento
+        funcion = tarea_departamento
+        tareas = [(args.pre, args.post, args.pct_urbano, args.pct_rural, args.zona, args.jobs, salida)]
+    elif args.herramienta == 'auditoria':
+        funcion = tarea_auditoria
+        tareas = [(args.propietarios, args.listado, args.incremento, args.zona, args.pdf, salida)]
+    elif args.herramienta == 'renumeracion':
+        funcion = tarea_renumeracion
+        rutas = expandir_entradas(args.entradas, EXTENSIONES_EXCEL)
+        tareas = [(r, args.tipo, args.col_snc, args.col_ant, args.col_estado, salida, p) for r, p in zip(rutas, prefijos_salida(rutas))]
+    elif args.herramienta == 'informales':
+        if not args.informal and not args.formal:
+            crear_parser().error("informales requiere --informal y/o --formal")
+        funcion = tarea_informales
+        tareas = [(args.informal, args.formal, args.prefijo, salida)]
+    else:
+        funcion = tarea_gis
+        rutas = expandir_entradas(args.entradas, ('.zip',))
+        tareas = [(r, salida, p) for r, p in zip(rutas, prefijos_salida(rutas))]
+
+    if not tareas:
+        print("No se encontraron archivos para procesar.")
+        return 1
+    resumen = ejecutar(funcion, tareas, args.jobs, salida)
+    return 1 if resumen['errores'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
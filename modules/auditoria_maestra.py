@@ -1,11 +1,16 @@
 import pandas as pd
 import numpy as np
 import io
-from decimal import Decimal, ROUND_HALF_UP
+import os
+import uuid
 from fpdf import FPDF
 import matplotlib.pyplot as plt
 import matplotlib
 matplotlib.use('Agg') # Modo no interactivo para el servidor
+from modules.llave_npn import agregar_llave, columnas_llave, cruzar_por_npn, COLUMNAS_LLAVE
+from modules.tipos_compactos import compactar_dataframe, rellenar_categorica
+from modules.redondeo import redondear_miles, redondear_miles_decimal
+from modules.cache_parquet import guardar_parquet, leer_parquet
 
 # ==========================================
 # 0. MAPEO DE MUNICIPIOS (SUCRE)
@@ -43,17 +48,15 @@ MUNICIPIOS_SUCRE = {
 # 1. LÓGICA DE NEGOCIO
 # ==========================================
 
+# Tabla de auditoría guardada en Parquet y consultada por páginas (el resumen va aparte, en JSON)
+POR_PAGINA_AUDITORIA = 100
+MAX_POR_PAGINA_AUDITORIA = 1000
+COLUMNAS_TABLA_AUDITORIA = ['Numero_Predial', 'Zona', 'Base_Usada', 'Valor_Cierre_Listado', 'Cierre_Calculado',
+                            'Pct_Variacion', 'Estado']
+
 def calcular_avaluo_excel(valor_base, pct_incremento):
-    """Redondeo idéntico a Excel: =REDONDEAR(numero * (1+pct); -3)"""
-    if pd.isna(valor_base) or valor_base == 0:
-        return 0
-    # Usamos Decimal para precisión financiera exacta
-    val = Decimal(str(valor_base))
-    factor = Decimal("1") + (Decimal(str(pct_incremento)) / Decimal("100"))
-    incrementado = val * factor
-    # Redondeado a miles (1E3) hacia arriba desde .5 (ROUND_HALF_UP)
-    final = incrementado.quantize(Decimal("1E3"), rounding=ROUND_HALF_UP)
-    return int(final)
+    """Redondeo idéntico a Excel: =REDONDEAR(numero * (1+pct); -3) (un valor; para columnas, redondear_miles)"""
+    return redondear_miles_decimal(valor_base, pct_incremento)
 
 def obtener_zona(id_obj):
     """Obtiene la zona del código catastral (posiciones 5 y 6)"""
@@ -75,7 +78,7 @@ def obtener_zona(id_obj):
         return 'Desc.'
     except: return 'Error'
 
-def procesar_auditoria(files_dict, pct_incremento, zona_filtro='General'):
+def procesar_auditoria(files_dict, pct_incremento, zona_filtro='General', directorio_resultados=None):
     """Procesa los archivos subidos y genera la auditoría"""
     df_prop = None
     df_calc = None
@@ -134,9 +137,13 @@ def procesar_auditoria(files_dict, pct_incremento, zona_filtro='General'):
             if nombre_municipio in MUNICIPIOS_SUCRE:
                 nombre_municipio = f"{nombre_municipio} - {MUNICIPIOS_SUCRE[nombre_municipio]}"
 
-            df_prop = df_prop.drop_duplicates(subset=['ID_Unico'], keep='first')
+            # Duplicados y cruce sobre la llave entera del NPN (si todos son NPN válidos)
+            df_prop = df_prop.drop_duplicates(subset=agregar_llave(df_prop, 'ID_Unico'), keep='first')
             df_prop['Zona'] = df_prop['ID_Unico'].apply(obtener_zona)
             df_prop['Muni_Name'] = nombre_municipio
+            # Solo se conservan las columnas que usa la auditoría, con tipado compacto
+            df_prop = compactar_dataframe(df_prop[[c for c in ['ID_Unico', 'Valor_Base_R1', 'Zona', 'Muni_Name'] + COLUMNAS_LLAVE if c in df_prop.columns]].copy(),
+                                          categoricas=['Zona', 'Muni_Name'], textos=['ID_Unico'], numericas=['Valor_Base_R1'])
 
         # Detección Listado Avalúos
         elif any(k in ' '.join(cols) for k in ['valor avaluo', 'valor_calculado']):
@@ -178,6 +185,11 @@ def procesar_auditoria(files_dict, pct_incremento, zona_filtro='General'):
             df_calc['Condicion_Propiedad'] = pd.to_numeric(df_calc['Condicion_Propiedad'], errors='coerce').fillna(-1)
             
             df_calc['Zona'] = df_calc['ID_Unico'].apply(obtener_zona)
+            agregar_llave(df_calc, 'ID_Unico')
+            df_calc = compactar_dataframe(
+                df_calc[['ID_Unico', 'Valor_Base_Listado', 'Valor_Cierre_Listado', 'Condicion_Propiedad', 'Zona'] + columnas_llave(df_calc)].copy(),
+                categoricas=['Zona'], textos=['ID_Unico'],
+                numericas=['Valor_Base_Listado', 'Valor_Cierre_Listado', 'Condicion_Propiedad'])
 
     if df_prop is None or df_calc is None:
         raise ValueError("Se requieren ambos archivos (Propietarios y Listado de Avalúos) para la auditoría.")
@@ -191,17 +203,17 @@ def procesar_auditoria(files_dict, pct_incremento, zona_filtro='General'):
             df_prop = df_prop[df_prop['Zona'] == zona_filtro].copy()
             df_calc = df_calc[df_calc['Zona'] == zona_filtro].copy()
 
-    # 1. Estadísticas de Zona
-    stats_r1 = df_prop['Zona'].value_counts().rename('R1')
-    stats_calc = df_calc['Zona'].value_counts().rename('Listado')
+    # 1. Estadísticas de Zona (sin las categorías que el filtro dejó vacías)
+    stats_r1 = df_prop['Zona'].astype(str).value_counts().rename('R1')
+    stats_calc = df_calc['Zona'].astype(str).value_counts().rename('Listado')
     tabla_zonas = pd.concat([stats_r1, stats_calc], axis=1).fillna(0).astype(int)
     tabla_zonas['Dif'] = tabla_zonas['R1'] - tabla_zonas['Listado']
     
     # 2. Cruce y Auditoría
-    full = pd.merge(
-        df_prop[['ID_Unico', 'Valor_Base_R1', 'Zona']],
-        df_calc[['ID_Unico', 'Valor_Base_Listado', 'Valor_Cierre_Listado', 'Condicion_Propiedad']],
-        on='ID_Unico',
+    full = cruzar_por_npn(
+        df_prop[['ID_Unico', 'Valor_Base_R1', 'Zona'] + columnas_llave(df_prop)],
+        df_calc[['ID_Unico', 'Valor_Base_Listado', 'Valor_Cierre_Listado', 'Condicion_Propiedad'] + columnas_llave(df_calc)],
+        'ID_Unico',
         how='outer',
         indicator=True
     )
@@ -211,7 +223,8 @@ def procesar_auditoria(files_dict, pct_incremento, zona_filtro='General'):
 
     full['Base_Usada'] = np.where(full['Valor_Base_R1'] > 0, full['Valor_Base_R1'], full['Valor_Base_Listado'])
     full['Diff_Base'] = full['Valor_Base_R1'] - full['Valor_Base_Listado']
-    full['Cierre_Calculado'] = full['Base_Usada'].apply(lambda x: calcular_avaluo_excel(x, pct_incremento))
+    # Mismo redondeo de calcular_avaluo_excel, sobre la columna completa
+    full['Cierre_Calculado'] = redondear_miles(full['Base_Usada'].to_numpy(), pct_incremento)
     full['Diff_Calculo'] = full['Valor_Cierre_Listado'] - full['Cierre_Calculado']
     
     # % de Variación Real (Cierre Listado vs Precierre)
@@ -240,6 +253,8 @@ def procesar_auditoria(files_dict, pct_incremento, zona_filtro='General'):
     # Otros ceros (ej: Condicion 1 o no encontrada)
     full.loc[full['Avaluo_Zero'] & (full['Zero_Category'] == 'Ninguna'), 'Zero_Category'] = 'Otros $0'
 
+    full['Estado'] = full['Estado'].astype('category')
+    full['Zero_Category'] = full['Zero_Category'].astype('category')
     predios_zero = full[full['Avaluo_Zero']].copy()
     
     # Renombrar para mayor claridad en el reporte y UI
@@ -249,9 +264,8 @@ def procesar_auditoria(files_dict, pct_incremento, zona_filtro='General'):
     # Limpieza final de NaNs para evitar errores de serialización JSON
     for col in full.columns:
         if str(full[col].dtype) == 'category':
-            full[col] = full[col].astype(object)
-            
-        if full[col].dtype == object:
+            full[col] = rellenar_categorica(full[col], '')
+        elif full[col].dtype == object or isinstance(full[col].dtype, pd.StringDtype):
             full[col] = full[col].fillna('')
         else:
             full[col] = full[col].fillna(0)
@@ -281,7 +295,7 @@ def procesar_auditoria(files_dict, pct_incremento, zona_filtro='General'):
     inconsistencias = full[full['Estado'] != 'OK'].head(200).to_dict(orient='records')
     municipio_detectado = df_prop['Muni_Name'].iloc[0] if df_prop is not None and not df_prop.empty else "Desconocido"
 
-    return {
+    res = {
         'municipio': municipio_detectado,
         'stats_zonas': tabla_zonas.reset_index().to_dict(orient='records'),
         'resumen_estados': full['Estado'].value_counts().to_dict(),
@@ -290,11 +304,45 @@ def procesar_auditoria(files_dict, pct_incremento, zona_filtro='General'):
         'totales': totales,
         'outliers': {'top': top_5_var, 'bottom': bottom_5_var},
         'predios_zero': predios_zero.head(100).to_dict(orient='records'),
-        'variaciones_all': full[full['_merge'] == 'both']['Pct_Variacion'].tolist(),
-        'full_data': full.to_dict(orient='records'),
         'pct_incremento': pct_incremento,
         'zona_filtro': zona_filtro
     }
+    if directorio_resultados is None:
+        res['variaciones_all'] = full[full['_merge'] == 'both']['Pct_Variacion'].tolist()
+        res['full_data'] = full.to_dict(orient='records')
+        return res
+    # La tabla completa queda en Parquet: la vista la pide por páginas y el PDF lee solo las variaciones
+    res['resultado_id'] = uuid.uuid4().hex
+    full['_merge'] = full['_merge'].astype(str)
+    guardar_parquet(full, ruta_resultados_auditoria(directorio_resultados, res['resultado_id']))
+    return res
+
+def ruta_resultados_auditoria(directorio, resultado_id):
+    return os.path.join(directorio, f"audit_{resultado_id}.parquet")
+
+def ruta_resumen_auditoria(directorio, resultado_id):
+    return os.path.join(directorio, f"audit_{resultado_id}.json")
+
+def variaciones_auditoria(ruta):
+    """% de variación de los predios presentes en ambos archivos (para el boxplot del PDF)."""
+    return leer_parquet(ruta, [('_merge', '==', 'both')], columnas=['Pct_Variacion'])['Pct_Variacion'].tolist()
+
+def consultar_auditoria(ruta, pagina=1, por_pagina=POR_PAGINA_AUDITORIA, busqueda=None):
+    """Una página de la tabla de auditoría; `busqueda` filtra por fragmento del número predial o del estado."""
+    df = leer_parquet(ruta, columnas=COLUMNAS_TABLA_AUDITORIA)
+    if busqueda and busqueda.strip():
+        termino = busqueda.strip().lower()
+        coincide = df['Numero_Predial'].str.lower().str.contains(termino, regex=False) | \
+                   df['Estado'].astype(str).str.lower().str.contains(termino, regex=False)
+        df = df[coincide.fillna(False).to_numpy(dtype=bool)]
+
+    total = len(df)
+    por_pagina = min(max(int(por_pagina), 1), MAX_POR_PAGINA_AUDITORIA)
+    paginas = max((total + por_pagina - 1) // por_pagina, 1)
+    pagina = min(max(int(pagina), 1), paginas)
+    inicio = (pagina - 1) * por_pagina
+    filas = df.iloc[inicio:inicio + por_pagina].to_dict(orient='records')
+    return {'total': total, 'pagina': pagina, 'paginas': paginas, 'por_pagina': por_pagina, 'filas': filas}
 
 class AuditoriaPDF(FPDF):
     def header(self):
@@ -1,5 +1,31 @@
+import io
+import math
+import os
+import posixpath
+import time
+import uuid
+import tempfile
+import zipfile
+from collections import Counter, OrderedDict
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pc = pacsv = pq = None
+from modules.lector_fwf import leer_fwf, leer_bytes, detectar_encoding
+from modules.layouts_snc import obtener_layout
+from modules.tipos_compactos import compactar_dataframe, combinar_columnas, valores_distintos, TIPO_TEXTO
+from modules.cache_parquet import cargar_con_cache, guardar_parquet, leer_parquet, leer_filas_parquet
+from modules.llave_npn import agregar_llave, columnas_llave, cruzar_por_npn
+from modules.redondeo import redondear_miles
+from modules.snc_processor import HojaStreaming
+from modules.auditoria_maestra import MUNICIPIOS_SUCRE
 
 # Intentar importar ftfy para arreglar encoding
 try:
@@ -8,59 +34,149 @@ except ImportError:
     ftfy = None
 
 
-# Configuración de cortes Registro 1 (SNC Estándar)
-CORTES_R1 = [0, 2, 5, 30, 31, 34, 37, 137, 138, 139, 151, 251, 252, 253, 268, 274, 289, 297, 312]
-COLS_R1 = ["Departamento", "Municipio", "NoPredial", "TipoRegistro", "NoOrden", "TotalRegistro", "Nombre", "EstadoCivil", "TipoDocumento", "NoDocumento", "Direccion", "Comuna", "DestinoEconomico", "AreaTerreno", "AreaConstruida", "Avaluo", "Vigencia", "NoPredialAnterior", "Espacio_Final"]
+# Estructura Registro 1 (SNC Estándar) desde el registro de layouts, con nombres cortos
+LAYOUT_R1 = obtener_layout('R1')
+COLS_R1 = LAYOUT_R1.columnas_cortas
+
+# Cambia cuando cambie lo que retorna cargar_snc (invalida la caché de parseo)
+VERSION_CACHE_SNC = 'v4'
 
-def generar_colspecs(cortes):
-    colspecs = []
-    for i in range(len(cortes) - 1):
-        colspecs.append((cortes[i], cortes[i+1]))
-    colspecs.append((cortes[-1], None))
-    return colspecs
+# Tabla de resultados guardada del lado del servidor (Parquet) y consultada por páginas
+POR_PAGINA = 100
+MAX_POR_PAGINA = 1000
+COLUMNAS_ORDEN = ('Predial_Nacional', 'Nombre', 'Destino', 'Zona', 'Municipio', 'Base', 'Calculado',
+                  'Sistema', 'Estado', 'Pct_Teorico', 'Pct_Real', 'Diferencia')
+# Filas por row group del Parquet de resultados: una página lee solo los grupos que la contienen
+FILAS_GRUPO_RESULTADOS = 50000
+# Permutaciones de orden guardadas por (archivo, columna, sentido) para no reordenar en cada página
+MAX_ORDENES_CACHE = 16
+# Parámetro de la consulta -> columna filtrable
+FILTROS_RESULTADO = {'estado': 'Estado', 'zona': 'Zona', 'destino': 'Destino'}
+# Columnas de la tabla de resultados y su origen en el universo cruzado cuando cambian de nombre
+COLUMNAS_RESULTADOS = ['Predial_Nacional', 'Nombre', 'Destino', 'Zona', 'Municipio', 'Base', 'Calculado', 'Sistema',
+                       'Estado', 'Pct_Teorico', 'Pct_Real', 'Diferencia', 'Cambios']
+ORIGEN_RESULTADOS = {'Base': 'Avaluo_pre', 'Sistema': 'Avaluo_post'}
 
+# Filtro zonal por código de zona (posiciones 5:7 del NPN); CORREG toma las zonas distintas de sus códigos
+CODIGOS_ZONA = {'URBANO': ['01'], 'RURAL': ['00'], 'CORREG': ['00', '01']}
 
+# Exportación del universo comparado: formato -> (extensión, mimetype) y filas por lote
+FORMATOS_EXPORTACION = {
+    'csv': ('.csv', 'text/csv'),
+    'xlsx': ('.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+}
+FILAS_LOTE_EXPORTACION = 100000
 
-    return df[['Predial_Nacional', 'Avaluo', 'Nombre', 'DestinoEconomico']]
+# Comparación departamental: archivos admitidos en los ZIP y columnas que se suman por municipio
+EXTENSIONES_AVALUO = ('.txt', '.prn', '.csv', '.xlsx', '.xls')
+CONTEOS_MUNICIPIO = ['predios', 'ok', 'sin_aumento', 'inconsistencias', 'nuevos', 'desaparecidos',
+                     'total_base', 'total_calculado', 'total_sistema', 'total_diferencia', 'base_comun', 'sistema_comun']
 
-    return df[['Predial_Nacional', 'Avaluo', 'Nombre', 'DestinoEconomico']]
+# Detección de cambios entre vigencias: campo -> columna de cargar_snc. El bit i de 'Cambios' marca el campo i
+CAMPOS_CAMBIO = {'Nombre': 'Nombre', 'Destino': 'DestinoEconomico', 'AreaTerreno': 'AreaTerreno', 'AreaConstruida': 'AreaConstruida'}
+CUALQUIER_CAMBIO = 'CUALQUIERA'
 
-def cargar_snc(stream):
-    """Carga data desde archivo plano (Fixed Width), CSV o Excel (.xlsx) con detección de encoding"""
+# Outliers: predios mínimos por grupo para estimar cuartiles, top global y top por grupo
+MIN_PREDIOS_OUTLIERS = 6
+TOP_OUTLIERS = 10
+TOP_OUTLIERS_GRUPO = 5
+
+# Celdas (predios x escenarios) por bloque en el barrido de incrementos
+BLOQUE_BARRIDO = 1 << 22
+MAX_ESCENARIOS = 400
+
+# REPARACIÓN DE ENCODING (MojiBake)
+def fix_mojibake(text):
+    if not text or not isinstance(text, str): return text
+    if ftfy:
+        try: return ftfy.fix_text(text)
+        except: pass
+    
+    # Fallback manual robusto
+    replacements = {
+        'Ã‘': 'Ñ', 'Ã±': 'ñ', 'Ã ': 'Á', 'Ã¡': 'á', 'Ã‰': 'É', 'Ã©': 'é',
+        'Ã ': 'Í', 'Ãid': 'í', 'Ã“': 'Ó', 'Ã³': 'ó', 'Ãš': 'Ú', 'Ãº': 'ú',
+        'Ãœ': 'Ü', 'Ã¼': 'ü', 'â€“': '-', 'â€”': '-', 'Âº': 'º', 'Âª': 'ª',
+        '\xc3\x91': 'Ñ', '\xc3\xb1': 'ñ', # Raw bytes cases
+    }
+    for bad, good in replacements.items():
+        text = text.replace(bad, good)
+    return text
+
+def limpiar_columna_texto(serie):
+    """
+    strip + reparación de mojibake sobre los valores distintos de la columna (factorize)
+    y de vuelta a cada fila. Nombres y direcciones se repiten mucho, y el mojibake
+    solo aparece en texto no ASCII: los valores ASCII no pasan por ftfy.
+    """
+    codigos, unicos = pd.factorize(serie)
+    valores = np.array([v.strip() if isinstance(v, str) else v for v in unicos], dtype=object)
+    no_ascii = np.fromiter((isinstance(v, str) and not v.isascii() for v in valores), dtype=bool, count=len(valores))
+    if no_ascii.any():
+        valores[no_ascii] = [fix_mojibake(v) for v in valores[no_ascii]]
+    if (codigos < 0).any():
+        # Faltantes (factorize los marca con -1) se conservan como NaN
+        valores = np.append(valores, np.nan)
+        codigos = np.where(codigos < 0, len(valores) - 1, codigos)
+    return pd.Series(valores[codigos], index=serie.index, name=serie.name)
+
+def filtro_zona_fwf(zona_filter):
+    """
+    Filtro de leer_fwf: descarta por los bytes crudos de la zona los registros de otra zona.
+    Solo decide sobre NoPredial de 25 dígitos (ahí el NPN armado conserva las posiciones);
+    los demás pasan y los resuelve el filtro de cargar_universo sobre el NPN.
+    """
+    inicio, fin = LAYOUT_R1.colspecs[COLS_R1.index('NoPredial')]
+    codigos = CODIGOS_ZONA[zona_filter]
+    def filtro(registros):
+        en_codigos = registros.campo_en(inicio, inicio + 2, codigos)
+        return ~registros.campo_numerico(inicio, fin) | (~en_codigos if zona_filter == 'CORREG' else en_codigos)
+    return filtro
+
+def _en_zona_no_predial(serie, zona_filter):
+    """Máscara de zona sobre NoPredial normalizado como en la construcción de Predial_Nacional."""
+    zona = serie.fillna('').astype(str).str.strip().str.replace(r'\.0$', '', regex=True).str.zfill(25).str.slice(0, 2)
+    en_codigos = zona.isin(CODIGOS_ZONA[zona_filter]).to_numpy()
+    return ~en_codigos if zona_filter == 'CORREG' else en_codigos
+
+def cargar_snc(stream, zona_filter='TODOS'):
+    """
+    Carga data desde archivo plano (Fixed Width), CSV o Excel (.xlsx) con detección de encoding.
+    Con `zona_filter` (URBANO, RURAL o CORREG) los predios de otras zonas se descartan antes
+    de la limpieza: en ancho fijo, sobre los bytes crudos y sin extraer sus columnas.
+    """
+    filtrar = zona_filter in CODIGOS_ZONA
     # Detectar el nombre del archivo si es un path o un objeto de Flask
     if isinstance(stream, str):
         filename = stream.lower()
     else:
         filename = getattr(stream, 'filename', '').lower()
     
-    # helper for reading with encoding fallback
-    def read_with_fallback(func, **kwargs):
-        encodings = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
-        pos = stream.tell() if hasattr(stream, 'tell') else 0
-        for enc in encodings:
-            try:
-                if hasattr(stream, 'seek'): stream.seek(pos)
-                return func(stream, encoding=enc, **kwargs)
-            except (UnicodeDecodeError, Exception):
-                continue
-        # Last resort: let pandas decide
-        if hasattr(stream, 'seek'): stream.seek(pos)
-        return func(stream, **kwargs)
-
-    # 1. Carga segun formato
+    # 1. Carga segun formato (el encoding se detecta una vez sobre los bytes y el parseo corre una sola vez)
+    encoding = None
     if filename.endswith(('.xlsx', '.xls')):
         try:
             df = pd.read_excel(stream, dtype=str)
         except Exception as e:
             raise ValueError(f"Error leyendo Excel: {str(e)}")
     elif filename.endswith('.csv'):
+        datos = leer_bytes(stream)
+        encoding = detectar_encoding(datos)
         # Detectar delimitador (coma o punto y coma)
-        df = read_with_fallback(pd.read_csv, sep=None, engine='python', dtype=str)
+        df = pd.read_csv(io.BytesIO(datos), sep=None, engine='python', dtype=str, encoding=encoding)
     else:
-        # FWF (Fixed Width File)
-        colspecs = generar_colspecs(CORTES_R1)
-        df = read_with_fallback(pd.read_fwf, colspecs=colspecs, header=None, dtype=str)
+        # FWF (Fixed Width File): detección sobre el mismo buffer (mmap) que se parsea
+        df = leer_fwf(stream, LAYOUT_R1.colspecs, encoding='auto', filtro=filtro_zona_fwf(zona_filter) if filtrar else None)
+        encoding = df.attrs['encoding']
+        filtrar = False
+    return normalizar_snc(df, encoding, zona_filter if filtrar else 'TODOS')
 
+def normalizar_snc(df, encoding=None, zona_filter='TODOS'):
+    """
+    Paso común de cargar_snc sobre las columnas leídas: nombres del R1, filtro zonal sobre
+    NoPredial (Excel y CSV), limpieza de texto, NPN de 30 dígitos, deduplicación y tipado compacto.
+    """
     # Normalización de Columnas
     if len(df.columns) >= len(COLS_R1):
         df.columns = COLS_R1[:len(df.columns)]
@@ -69,36 +185,24 @@ def cargar_snc(stream):
         new_cols = list(COLS_R1[:len(df.columns)])
         df.columns = new_cols
 
+    # Excel y CSV: filtro zonal sobre NoPredial antes de limpiar todas las columnas
+    if zona_filter in CODIGOS_ZONA and 'NoPredial' in df.columns:
+        df = df[_en_zona_no_predial(df['NoPredial'], zona_filter)].reset_index(drop=True)
+
     # 2. Procesamiento Común y Limpieza de Encoding
     df = df.fillna('')
-    df = df.apply(lambda x: x.str.strip() if x.dtype == "object" else x)
-    
-    # REPARACIÓN DE ENCODING (MojiBake)
-    def fix_mojibake(text):
-        if not text or not isinstance(text, str): return text
-        if ftfy:
-            try: return ftfy.fix_text(text)
-            except: pass
-        
-        # Fallback manual robusto
-        replacements = {
-            'Ã‘': 'Ñ', 'Ã±': 'ñ', 'Ã ': 'Á', 'Ã¡': 'á', 'Ã‰': 'É', 'Ã©': 'é',
-            'Ã ': 'Í', 'Ãid': 'í', 'Ã“': 'Ó', 'Ã³': 'ó', 'Ãš': 'Ú', 'Ãº': 'ú',
-            'Ãœ': 'Ü', 'Ã¼': 'ü', 'â€“': '-', 'â€”': '-', 'Âº': 'º', 'Âª': 'ª',
-            '\xc3\x91': 'Ñ', '\xc3\xb1': 'ñ', # Raw bytes cases
-        }
-        for bad, good in replacements.items():
-            text = text.replace(bad, good)
-        return text
-
     for col in df.columns:
         if df[col].dtype == 'object':
-            df[col] = df[col].apply(fix_mojibake)
+            df[col] = limpiar_columna_texto(df[col])
     
     # Limpieza de Avalúo
     if 'Avaluo' in df.columns:
         df['Avaluo'] = df['Avaluo'].astype(str).str.replace(r'[$,]', '', regex=True)
         df['Avaluo'] = pd.to_numeric(df['Avaluo'], errors='coerce').fillna(0)
+
+    # Áreas (para la detección de cambios); vacías si el archivo no las trae
+    for col in ['AreaTerreno', 'AreaConstruida']:
+        df[col] = pd.to_numeric(df[col], errors='coerce') if col in df.columns else np.nan
     
     # Construcción Llave 30 Dígitos
     # Aseguramos que existan las columnas necesarias
@@ -121,19 +225,171 @@ def cargar_snc(stream):
         df['NoPredial'].astype(str).str.replace(r'\.0$', '', regex=True).str.zfill(25)
     )
     
-    # Eliminar duplicados
-    df = df.drop_duplicates(subset=['Predial_Nacional'], keep='first')
-    
-    # Retornar columnas clave y el NoPredial limpio para filtrar
-    return df[['Predial_Nacional', 'Avaluo', 'Nombre', 'DestinoEconomico', 'Municipio']]
-
-def procesar_incremento_web(file_pre, file_post, pct_urbano, pct_rural, sample_pct=100, zona_filter='TODOS'):
-    # Leer Dataframes
-    df_pre = cargar_snc(file_pre)
-    df_post = cargar_snc(file_post) # Aquí sample_pct y zona_filter se aplican DESPUÉS para simplificar, 
-                                    # o podemos inyectar el filtro antes si cargamos todo.
-                                    # Dado que cargar_snc retorna todo, filtramos en memoria.
+    # Eliminar duplicados (sobre la llave entera del NPN cuando todos son válidos)
+    llave = agregar_llave(df, 'Predial_Nacional')
+    df = df.drop_duplicates(subset=llave, keep='first')
     
+    # Retornar columnas clave y el NoPredial limpio para filtrar (tipado compacto)
+    df = df[['Predial_Nacional', 'Avaluo', 'Nombre', 'DestinoEconomico', 'Municipio', 'AreaTerreno', 'AreaConstruida'] + columnas_llave(df)].copy()
+    df = compactar_dataframe(df, categoricas=['DestinoEconomico', 'Municipio'],
+                             textos=['Predial_Nacional', 'Nombre'], numericas=['Avaluo', 'AreaTerreno', 'AreaConstruida'])
+    df.attrs['encoding'] = encoding
+    return df
+
+def cargar_snc_cache(ruta, directorio_cache=None, zona_filter='TODOS'):
+    """cargar_snc con caché Parquet por hash del contenido (solo para rutas en disco)."""
+    if directorio_cache is None or not isinstance(ruta, str):
+        return cargar_snc(ruta, zona_filter)
+    # La extensión decide el lector (Excel, CSV o ancho fijo) y la zona las filas: ambas forman parte de la llave
+    extension = os.path.splitext(ruta)[1].lower().lstrip('.') or 'fwf'
+    prefijo = f"snc_{VERSION_CACHE_SNC}_{extension}"
+    if zona_filter in CODIGOS_ZONA:
+        prefijo += f"_{zona_filter.lower()}"
+    return cargar_con_cache(ruta, partial(cargar_snc, zona_filter=zona_filter), directorio_cache, prefijo)
+
+def ruta_resultados(directorio, resultado_id):
+    return os.path.join(directorio, f"avaluo_{resultado_id}.parquet")
+
+def ruta_universo(directorio, resultado_id):
+    """Parquet con el universo completo: solo se guarda aparte cuando la tabla de resultados es una muestra."""
+    return os.path.join(directorio, f"avaluo_{resultado_id}_universo.parquet")
+
+def ruta_exportacion(directorio, resultado_id):
+    ruta = ruta_universo(directorio, resultado_id)
+    return ruta if os.path.exists(ruta) else ruta_resultados(directorio, resultado_id)
+
+def _filtrar_zona(lote, zona_filter):
+    """Filas del lote Arrow cuya zona (posiciones 5:7 del NPN) corresponde al filtro, como en cargar_universo."""
+    if zona_filter == 'TODOS':
+        return lote
+    codigos = CODIGOS_ZONA[zona_filter]
+    zona = pc.utf8_slice_codeunits(lote.column('Predial_Nacional'), 5, 7)
+    dentro = pc.fill_null(pc.is_in(zona, value_set=pa.array(codigos)), False)
+    return lote.filter(pc.invert(dentro) if zona_filter == 'CORREG' else dentro)
+
+def lotes_universo(ruta, zona_filter='TODOS', filas_lote=FILAS_LOTE_EXPORTACION):
+    """Lotes Arrow (RecordBatch) del Parquet en `ruta` filtrados por zona, sin cargar el archivo completo."""
+    if zona_filter not in ('TODOS', 'URBANO', 'RURAL', 'CORREG'):
+        raise ValueError(f"Filtro de zona no válido: {zona_filter}")
+    for lote in pq.ParquetFile(ruta).iter_batches(batch_size=filas_lote):
+        lote = _filtrar_zona(lote, zona_filter)
+        if lote.num_rows:
+            yield lote
+
+def exportar_csv(ruta, zona_filter='TODOS', filas_lote=FILAS_LOTE_EXPORTACION):
+    """Generador de bytes CSV (encabezado y luego un bloque por lote) para enviar en streaming."""
+    lotes = lotes_universo(ruta, zona_filter, filas_lote)
+    buffer = io.BytesIO()
+    escritor = pacsv.CSVWriter(buffer, pq.ParquetFile(ruta).schema_arrow)
+    for lote in lotes:
+        escritor.write_batch(lote)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    escritor.close()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def exportar_resultados(ruta, formato, ruta_salida, zona_filter='TODOS', filas_lote=FILAS_LOTE_EXPORTACION):
+    """
+    Escribe el universo de `ruta` en `ruta_salida` lote a lote (CSV, Parquet o Excel en modo
+    `constant_memory`) y retorna el número de filas. La memoria queda acotada por `filas_lote`.
+    """
+    if formato not in FORMATOS_EXPORTACION:
+        raise ValueError(f"Formato de exportación no válido: {formato}")
+    esquema = pq.ParquetFile(ruta).schema_arrow
+    if formato in ('csv', 'parquet'):
+        total = 0
+        escritor = pacsv.CSVWriter(ruta_salida, esquema) if formato == 'csv' else pq.ParquetWriter(ruta_salida, esquema)
+        with escritor:
+            for lote in lotes_universo(ruta, zona_filter, filas_lote):
+                escritor.write_batch(lote)
+                total += lote.num_rows
+        return total
+    import xlsxwriter
+    workbook = xlsxwriter.Workbook(ruta_salida, {'constant_memory': True})
+    try:
+        formato_plano = workbook.add_format({'bold': False, 'border': 0, 'align': 'left'})
+        hoja = HojaStreaming(workbook, 'Avaluos', esquema.names, formato_plano)
+        for lote in lotes_universo(ruta, zona_filter, filas_lote):
+            hoja.escribir(lote.to_pandas())
+    finally:
+        workbook.close()
+    return hoja.total
+
+def consultar_resultados(ruta, pagina=1, por_pagina=POR_PAGINA, orden=None, descendente=False, filtros=None, busqueda=None,
+                         cambio=None):
+    """
+    Una página de la tabla de resultados guardada en `ruta`. `filtros` mapea columna -> valores
+    aceptados, `busqueda` filtra por fragmento del NPN y `cambio` (campo de CAMPOS_CAMBIO o
+    CUALQUIER_CAMBIO) deja los predios con ese cambio. Los filtros solo leen sus columnas, el
+    orden sale de una permutación en caché y de las demás columnas solo se leen las filas de la página.
+    """
+    condiciones = {col: list(valores) for col, valores in (filtros or {}).items() if valores}
+    if cambio:
+        condiciones['Cambios'] = valores_con_cambio(cambio)
+    columnas = list(condiciones) + (['Predial_Nacional'] if busqueda else [])
+    seleccion = None
+    if columnas:
+        df = leer_parquet(ruta, columnas=list(dict.fromkeys(columnas)))
+        seleccion = np.ones(len(df), dtype=bool)
+        for col, valores in condiciones.items():
+            seleccion &= df[col].isin(valores).to_numpy()
+        if busqueda:
+            seleccion &= df['Predial_Nacional'].str.contains(busqueda.strip(), regex=False).fillna(False).to_numpy(dtype=bool)
+    if orden in COLUMNAS_ORDEN:
+        posiciones = permutacion_orden(ruta, orden, descendente)
+        if seleccion is not None:
+            posiciones = posiciones[seleccion[posiciones]]
+    elif seleccion is not None:
+        posiciones = np.flatnonzero(seleccion)
+    else:
+        posiciones = np.arange(pq.ParquetFile(ruta).metadata.num_rows)
+
+    total = len(posiciones)
+    por_pagina = min(max(int(por_pagina), 1), MAX_POR_PAGINA)
+    paginas = max((total + por_pagina - 1) // por_pagina, 1)
+    pagina = min(max(int(pagina), 1), paginas)
+    inicio = (pagina - 1) * por_pagina
+    filas = leer_filas_parquet(ruta, posiciones[inicio:inicio + por_pagina]).to_dict(orient='records')
+    return {'total': total, 'pagina': pagina, 'paginas': paginas, 'por_pagina': por_pagina, 'filas': filas}
+
+_ORDENES = OrderedDict()
+
+def permutacion_orden(ruta, orden, descendente=False):
+    """
+    Posiciones de las filas de `ruta` ordenadas por `orden` (estable, faltantes al final).
+    Se calcula leyendo solo esa columna y queda en caché mientras el archivo no cambie.
+    """
+    info = os.stat(ruta)
+    llave = (os.path.abspath(ruta), info.st_mtime_ns, orden, bool(descendente))
+    if llave in _ORDENES:
+        _ORDENES.move_to_end(llave)
+        return _ORDENES[llave]
+    columna = leer_parquet(ruta, columnas=[orden])[orden].reset_index(drop=True)
+    posiciones = columna.sort_values(ascending=not descendente, kind='stable', na_position='last').index.to_numpy()
+    _ORDENES[llave] = posiciones
+    while len(_ORDENES) > MAX_ORDENES_CACHE:
+        _ORDENES.popitem(last=False)
+    return posiciones
+
+def cargar_universo(file_pre, file_post, zona_filter='TODOS', directorio_cache=None):
+    """Carga ambos archivos, aplica el filtro zonal y retorna (outer join por NPN, encodings)."""
+    # Leer Dataframes (desde la caché de parseo si ya se cargaron antes)
+    # El filtro zonal se aplica en la lectura (cargar_snc): solo se parsean y limpian los predios de la zona
+    df_pre = cargar_snc_cache(file_pre, directorio_cache, zona_filter)
+    df_post = cargar_snc_cache(file_post, directorio_cache, zona_filter)
+    encodings = {'pre': df_pre.attrs.get('encoding'), 'post': df_post.attrs.get('encoding')}
+    df_pre = filtrar_zona_npn(df_pre, zona_filter)
+    df_post = filtrar_zona_npn(df_post, zona_filter)
+
+    # 1.2 MUESTREO (MOVED AFTER MERGE/CALCS to allow Universe Stats)
+    # Anteriormente aquí se hacía sampling antes del merge.
+    # AHORA: Haremos merge del universo filtrado, calculamos todo, y al final hacemos sampling para la vista 'data'.
+    return cruzar_universo(df_pre, df_post), encodings
+
+def filtrar_zona_npn(df, zona_filter):
+    """Filtro zonal sobre el NPN armado; resuelve los registros que la lectura no pudo decidir."""
     # 1.1 FILTRO ZONAL
     # Zona está en posiciones 5:7 del Predial Nacional (30 char).
     # 0-2 (Depto), 2-5 (Mun), 5-7 (ZONA). 
@@ -147,22 +403,19 @@ def procesar_incremento_web(file_pre, file_post, pct_urbano, pct_rural, sample_p
         # Filtramos DF Pre y Post
         # slice(5,7) toma caracteres 5 y 6.
         if zona_filter in ['URBANO', 'RURAL']:
-            df_pre = df_pre[df_pre['Predial_Nacional'].str.slice(5, 7).isin(target_zones)]
-            df_post = df_post[df_post['Predial_Nacional'].str.slice(5, 7).isin(target_zones)]
+            df = df[df['Predial_Nacional'].str.slice(5, 7).isin(target_zones)]
         elif zona_filter == 'CORREG':
              # Todo lo que NO sea 00 ni 01
-             df_pre = df_pre[~df_pre['Predial_Nacional'].str.slice(5, 7).isin(['00', '01'])]
-             df_post = df_post[~df_post['Predial_Nacional'].str.slice(5, 7).isin(['00', '01'])]
+             df = df[~df['Predial_Nacional'].str.slice(5, 7).isin(['00', '01'])]
+    return df
 
-    # 1.2 MUESTREO (MOVED AFTER MERGE/CALCS to allow Universe Stats)
-    # Anteriormente aquí se hacía sampling antes del merge.
-    # AHORA: Haremos merge del universo filtrado, calculamos todo, y al final hacemos sampling para la vista 'data'.
-    
+def cruzar_universo(df_pre, df_post):
+    """Outer join por NPN de Base y Sistema con los campos combinados (Nombre, Destino, Municipio)."""
     # 2. Unión Total (Outer Join) del Universo Filtrado
-    df_final = pd.merge(
+    df_final = cruzar_por_npn(
         df_pre, 
         df_post, 
-        on='Predial_Nacional', 
+        'Predial_Nacional', 
         how='outer', 
         suffixes=('_pre', '_post'), 
         indicator=True
@@ -173,10 +426,82 @@ def procesar_incremento_web(file_pre, file_post, pct_urbano, pct_rural, sample_p
     df_final['Avaluo_post'] = df_final['Avaluo_post'].fillna(0)
     
     # Si es nuevo, toma nombre del post; si es viejo, del pre
-    df_final['Nombre'] = df_final['Nombre_pre'].combine_first(df_final['Nombre_post']).fillna('SIN NOMBRE')
-    df_final['Destino'] = df_final['DestinoEconomico_pre'].combine_first(df_final['DestinoEconomico_post']).fillna('-')
-    df_final['Municipio'] = df_final['Municipio_pre'].combine_first(df_final['Municipio_post']).fillna('000')
+    df_final['Nombre'] = combinar_columnas(df_final['Nombre_pre'], df_final['Nombre_post'], 'SIN NOMBRE')
+    df_final['Destino'] = combinar_columnas(df_final['DestinoEconomico_pre'], df_final['DestinoEconomico_post'], '-')
+    df_final['Municipio'] = combinar_columnas(df_final['Municipio_pre'], df_final['Municipio_post'], '000')
+    return df_final
+
+def barrido_incrementos(df_final, escenarios, bloque=BLOQUE_BARRIDO):
+    """
+    Evalúa varios escenarios (pct_urbano, pct_rural) sobre el universo de cargar_universo en
+    una sola pasada: los porcentajes se difunden como matriz predios x escenarios, con la misma
+    aritmética de procesar_incremento_web. Retorna por escenario los conteos de estado y los
+    totales de Calculado y Diferencia. `bloque` limita las celdas de cada matriz intermedia.
+    """
+    pcts = np.asarray(escenarios, dtype=float).reshape(-1, 2)
+
+    merge = df_final['_merge'].to_numpy()
+    izq, der = merge == 'left_only', merge == 'right_only'
+    ambos = ~izq & ~der
+    is_urbano = (df_final['Predial_Nacional'].astype(str).str.slice(5, 7) == '01').to_numpy()
+    base = df_final['Avaluo_pre'].to_numpy(dtype=np.float64)
+    sistema = df_final['Avaluo_post'].to_numpy(dtype=np.float64)
 
+    n_esc = len(pcts)
+    ok = np.zeros(n_esc, dtype=np.int64)
+    sin_aumento = np.zeros(n_esc, dtype=np.int64)
+    total_calculado = np.zeros(n_esc, dtype=np.int64)
+    total_diferencia = np.zeros(n_esc, dtype=np.int64)
+    filas = max(bloque // max(n_esc, 1), 1)
+    for inicio in range(0, len(base), filas):
+        sl = slice(inicio, inicio + filas)
+        pcts_fila = np.where(is_urbano[sl, None], pcts[:, 0], pcts[:, 1])
+        calculado = redondear_miles(base[sl, None], pcts_fila).astype(np.float64)
+        calculado[der[sl]] = 0
+        diferencia = np.where(izq[sl, None], -calculado, calculado - sistema[sl, None])
+        diferencia[der[sl]] = sistema[sl, None][der[sl]]
+
+        es_ok = ambos[sl, None] & (diferencia == 0)
+        ok += es_ok.sum(axis=0)
+        sin_aumento += (ambos[sl, None] & ~es_ok & (base[sl, None] == calculado)).sum(axis=0)
+        total_calculado += calculado.astype(np.int64).sum(axis=0)
+        total_diferencia += diferencia.astype(np.int64).sum(axis=0)
+
+    n_ambos = int(ambos.sum())
+    return [{
+        'pct_urbano': float(pcts[i, 0]),
+        'pct_rural': float(pcts[i, 1]),
+        'ok': int(ok[i]),
+        'sin_aumento': int(sin_aumento[i]),
+        'inconsistencias': n_ambos - int(ok[i]) - int(sin_aumento[i]),
+        'nuevos': int(der.sum()),
+        'desaparecidos': int(izq.sum()),
+        'total_calculado': int(total_calculado[i]),
+        'total_diferencia': int(total_diferencia[i]),
+    } for i in range(n_esc)]
+
+def grilla_escenarios(pcts_urbano, pcts_rural):
+    """
+    Todas las combinaciones (pct_urbano, pct_rural) de ambas listas. ValueError si algún porcentaje
+    no es finito o es <= -100, o si la grilla no tiene entre 1 y MAX_ESCENARIOS escenarios
+    (se valida antes de armar el producto).
+    """
+    if not 0 < len(pcts_urbano) * len(pcts_rural) <= MAX_ESCENARIOS:
+        raise ValueError(f"El barrido admite entre 1 y {MAX_ESCENARIOS} escenarios.")
+    for pct in list(pcts_urbano) + list(pcts_rural):
+        if not math.isfinite(pct) or pct <= -100:
+            raise ValueError(f"porcentaje fuera de rango: {pct}")
+    return [(u, r) for u in pcts_urbano for r in pcts_rural]
+
+def procesar_barrido_web(file_pre, file_post, escenarios, zona_filter='TODOS', directorio_cache=None):
+    if not 0 < len(escenarios) <= MAX_ESCENARIOS:
+        raise ValueError(f"El barrido admite entre 1 y {MAX_ESCENARIOS} escenarios.")
+    df_final, _ = cargar_universo(file_pre, file_post, zona_filter, directorio_cache)
+    return {'zona_filter': zona_filter, 'total_registros_universo': int(len(df_final)),
+            'escenarios': barrido_incrementos(df_final, escenarios)}
+
+def calcular_comparacion(df_final, pct_urbano, pct_rural):
+    """Agrega al universo de cargar_universo: Zona, Pct_Teorico, Calculado, Diferencia, Pct_Real y Estado."""
     pct_urb_decimal = float(pct_urbano) / 100
     pct_rur_decimal = float(pct_rural) / 100
     
@@ -187,24 +512,16 @@ def procesar_incremento_web(file_pre, file_post, pct_urbano, pct_rural, sample_p
     zona_vals = df_final['Predial_Nacional'].astype(str).str.slice(5, 7)
     is_urbano = (zona_vals == '01')
     
-    df_final['Zona'] = np.where(is_urbano, 'URBANO', 'RURAL')
+    df_final['Zona'] = pd.Categorical(np.where(is_urbano, 'URBANO', 'RURAL'))
     
     # 2. Factores y Pct Teorico
     # Si es urbano: pct_urb_decimal, sino (rural/correg): pct_rur_decimal
     df_final['Pct_Teorico'] = np.where(is_urbano, pct_urb_decimal, pct_rur_decimal)
     
-    # factor n = 1 + pct
-    factors = 1 + df_final['Pct_Teorico']
-    
     # 3. Calculado
-    # Logica: redondear_excel(avaluo_base * factor)
-    # redondear_excel usa ROUND_HALF_UP a miles (1E3).
-    # En numpy: floor(x/1000 + 0.5) * 1000 imita ROUND_HALF_UP para positivos.
-    
-    vals_teoricos = df_final['Avaluo_pre'] * factors
-    # Evitar problemas con float, sumamos un epsilon muy pequeño si fuera necesario, 
-    # pero +0.5 suele bastar para "half up".
-    df_final['Calculado'] = np.floor((vals_teoricos / 1000) + 0.5) * 1000
+    # Logica: REDONDEAR(avaluo_base * factor; -3) con ROUND_HALF_UP exacto (el mismo de la auditoría)
+    pcts_zona = np.where(is_urbano, float(pct_urbano), float(pct_rural))
+    df_final['Calculado'] = redondear_miles(df_final['Avaluo_pre'].to_numpy(dtype=np.float64), pcts_zona).astype(np.float64)
     
     # Caso 'right_only' (NUEVO) -> Calculado = 0
     df_final['Calculado'] = np.where(df_final['_merge'] == 'right_only', 0, df_final['Calculado'])
@@ -260,13 +577,106 @@ def procesar_incremento_web(file_pre, file_post, pct_urbano, pct_rural, sample_p
         'SIN_AUMENTO'
     ]
     
-    df_final['Estado'] = np.select(conds_estado, choices_estado, default='INCONSISTENCIA')
+    df_final['Estado'] = pd.Categorical(np.select(conds_estado, choices_estado, default='INCONSISTENCIA'))
     
     # Limpieza final de columnas numéricas
     df_final['Calculado'] = df_final['Calculado'].astype(int)
     df_final['Diferencia'] = df_final['Diferencia'].astype(int)
+    return df_final
+
+def marcar_cambios(df_final):
+    """
+    Agrega 'Cambios' (uint8): bit i encendido si el campo i de CAMPOS_CAMBIO difiere entre
+    Base y Sistema. Solo aplica a predios presentes en ambos archivos (los demás quedan en 0).
+    Retorna el conteo de predios por campo cambiado.
+    """
+    ambos = (df_final['_merge'] == 'both').to_numpy()
+    cambios = np.zeros(len(df_final), dtype=np.uint8)
+    conteos = {}
+    for bit, (campo, columna) in enumerate(CAMPOS_CAMBIO.items()):
+        distintos = valores_distintos(df_final[f'{columna}_pre'], df_final[f'{columna}_post']) & ambos
+        cambios |= distintos.astype(np.uint8) << bit
+        conteos[campo] = int(distintos.sum())
+    df_final['Cambios'] = cambios
+    return conteos
+
+def valores_con_cambio(campo):
+    """Valores de 'Cambios' con el bit de `campo` encendido (CUALQUIER_CAMBIO: cualquier bit), para filtrar con 'in'."""
+    if campo == CUALQUIER_CAMBIO:
+        bits = (1 << len(CAMPOS_CAMBIO)) - 1
+    elif campo in CAMPOS_CAMBIO:
+        bits = 1 << list(CAMPOS_CAMBIO).index(campo)
+    else:
+        raise ValueError(f"Campo de cambio desconocido: {campo}")
+    return [m for m in range(1 << len(CAMPOS_CAMBIO)) if m & bits]
+
+def tipo_zona(npn):
+    """URBANO (01), RURAL (00) o CORREGIMIENTO (02-99) desde las posiciones 5:7 del NPN."""
+    if pc is not None:
+        # Directo en Arrow: str.slice de pandas recorre los valores en Python
+        codigo = pc.utf8_slice_codeunits(pa.array(npn.astype(TIPO_TEXTO)), 5, 7)
+        urbano, rural = (pc.fill_null(pc.equal(codigo, c), False).to_numpy(zero_copy_only=False) for c in ('01', '00'))
+    else:
+        codigo = npn.astype(str).str.slice(5, 7)
+        urbano, rural = (codigo == '01').to_numpy(), (codigo == '00').to_numpy()
+    return pd.Categorical.from_codes(np.where(urbano, 0, np.where(rural, 1, 2)), ['URBANO', 'RURAL', 'CORREGIMIENTO'])
+
+def detectar_outliers(df_final, por_municipio=False, top=TOP_OUTLIERS, top_grupo=TOP_OUTLIERS_GRUPO, min_predios=MIN_PREDIOS_OUTLIERS):
+    """
+    Outliers de Pct_Real por IQR (fuera de Q1 - 1.5*IQR, Q3 + 1.5*IQR) con los cuartiles de
+    cada grupo zona x destino económico (y municipio con `por_municipio`), en una sola pasada
+    de groupby. Solo predios con base > 0 y grupos con al menos `min_predios`.
+    Retorna (top global por desviación respecto a la mediana del grupo, resumen por grupo
+    con su conteo de outliers y su top).
+    """
+    df = df_final.loc[df_final['Avaluo_pre'] > 0, ['Predial_Nacional', 'Nombre', 'Zona', 'Destino', 'Municipio',
+                                                   'Avaluo_pre', 'Avaluo_post', 'Pct_Real']]
+    if df.empty:
+        return [], []
+    df['Tipo_Zona'] = tipo_zona(df['Predial_Nacional'])
+    claves = ['Tipo_Zona', 'Destino'] + (['Municipio'] if por_municipio else [])
+
+    grupos = df.groupby(claves, observed=True, sort=True)['Pct_Real']
+    ids = grupos.ngroup().to_numpy()
+    resumen = grupos.quantile([0.25, 0.5, 0.75]).unstack()
+    resumen.columns = ['Q1', 'Mediana', 'Q3']
+    resumen['Predios'] = grupos.size()
+    iqr = resumen['Q3'] - resumen['Q1']
+    resumen['Limite_Inferior'] = resumen['Q1'] - 1.5 * iqr
+    resumen['Limite_Superior'] = resumen['Q3'] + 1.5 * iqr
+
+    # Límites del grupo llevados a cada fila por el número de grupo
+    pct = df['Pct_Real'].to_numpy()
+    lim_inf = resumen['Limite_Inferior'].to_numpy()[ids]
+    lim_sup = resumen['Limite_Superior'].to_numpy()[ids]
+    es_outlier = (resumen['Predios'].to_numpy()[ids] >= min_predios) & ((pct < lim_inf) | (pct > lim_sup))
+    resumen['Outliers'] = np.bincount(ids[es_outlier], minlength=len(resumen))
+
+    outliers = df[es_outlier].rename(columns={'Avaluo_pre': 'Base', 'Avaluo_post': 'Sistema'})
+    outliers['Limite_Inferior'] = lim_inf[es_outlier]
+    outliers['Limite_Superior'] = lim_sup[es_outlier]
+    outliers['Desviacion'] = np.abs(pct - resumen['Mediana'].to_numpy()[ids])[es_outlier]
+    outliers = outliers.sort_values('Desviacion', ascending=False, kind='stable')
+
+    tops = {llave if isinstance(llave, tuple) else (llave,): grupo.to_dict(orient='records')
+            for llave, grupo in outliers.groupby(claves, observed=True, sort=False).head(top_grupo).groupby(claves, observed=True, sort=False)}
+    resumen = resumen[resumen['Predios'] >= min_predios].reset_index()
+    resumen_grupos = resumen.to_dict(orient='records')
+    for fila, llave in zip(resumen_grupos, resumen[claves].itertuples(index=False, name=None)):
+        fila['Top'] = tops.get(llave, [])
+    return outliers.head(top).to_dict(orient='records'), resumen_grupos
+
+def tabla_resultados(df_final):
+    """Columnas de la tabla de resultados (las que se guardan en Parquet y se exportan)."""
+    cols = [ORIGEN_RESULTADOS.get(c, c) for c in COLUMNAS_RESULTADOS]
+    return df_final[cols].rename(columns={v: k for k, v in ORIGEN_RESULTADOS.items()})
+
+def procesar_incremento_web(file_pre, file_post, pct_urbano, pct_rural, sample_pct=100, zona_filter='TODOS', directorio_cache=None,
+                            directorio_resultados=None, outliers_por_municipio=False):
+    df_final, encodings = cargar_universo(file_pre, file_post, zona_filter, directorio_cache)
+    df_final = calcular_comparacion(df_final, pct_urbano, pct_rural)
+    conteos_cambios = marcar_cambios(df_final)
     
-    # 4. Estadísticas Generales (KPIs)
     # 4. Estadísticas Generales (KPIs)
     
     # 4. Estadísticas Generales (KPIs) (Sobre el Universo para cálculos globales)
@@ -282,15 +692,9 @@ def procesar_incremento_web(file_pre, file_post, pct_urbano, pct_rural, sample_p
     desaparecidos_full = df_final[df_final['_merge'] == 'left_only'][['Predial_Nacional', 'Nombre', 'Zona', 'Avaluo_pre']].rename(columns={'Avaluo_pre': 'Base'}).to_dict(orient='records')
 
     # 6. Preparar Data Detallada
-    cols = ['Predial_Nacional', 'Nombre', 'Destino', 'Zona', 'Municipio',
-            'Avaluo_pre', 'Calculado', 'Avaluo_post', 
-            'Estado', 'Pct_Teorico', 'Pct_Real', 'Diferencia']
-            
-    df_export = df_final[cols].rename(columns={
-        'Avaluo_pre': 'Base',
-        'Avaluo_post': 'Sistema'
-    })
-    
+    df_export = tabla_resultados(df_final)
+    df_universo = df_export
+
     # APLICAR MUESTREO AQUÍ (SOLO PARA LA VISTA DE TABLA)
     sample_pct_val = float(sample_pct)
     if sample_pct_val < 100:
@@ -314,53 +718,186 @@ def procesar_incremento_web(file_pre, file_post, pct_urbano, pct_rural, sample_p
         'mean': float(mean_val) if not np.isnan(mean_val) else 0,
         'median': float(median_val) if not np.isnan(median_val) else 0,
         'mode': float(mode_val) if not np.isnan(mode_val) else 0,
-        'std': float(std_val) if not np.isnan(std_val) else 0
+        'std': float(std_val) if not np.isnan(std_val) else 0,
+        'total_monto': float(avaluos_sist_full.sum()),
+        # Cambios de campo entre vigencias (universo, predios en ambos archivos)
+        'cambios': conteos_cambios,
+        'predios_con_cambios': int((df_final['Cambios'] > 0).sum()),
+        # Encoding detectado en cada archivo plano (None para Excel)
+        'encoding_pre': encodings['pre'],
+        'encoding_post': encodings['post']
     }
 
-    records = df_export.to_dict(orient='records')
+    # Con `directorio_resultados` la tabla queda en Parquet y la vista la pide por páginas
+    # (consultar_resultados); sin él se retorna completa en 'data'
+    resultado_id = None
+    opciones_filtro = {col: sorted(str(v) for v in df_export[col].dropna().unique()) for col in FILTROS_RESULTADO.values()}
+    if directorio_resultados is not None:
+        os.makedirs(directorio_resultados, exist_ok=True)
+        resultado_id = uuid.uuid4().hex
+        guardar_parquet(df_export, ruta_resultados(directorio_resultados, resultado_id), FILAS_GRUPO_RESULTADOS)
+        if df_export is not df_universo:
+            # La tabla es una muestra: la exportación lee el universo completo de otro Parquet
+            guardar_parquet(df_universo, ruta_universo(directorio_resultados, resultado_id))
+        records = []
+    else:
+        records = df_export.to_dict(orient='records')
 
-    # 7. OUTLIERS (Análisis Estadístico)
-    # Definición: Usaremos IQR (Rango Intercuartílico) sobre 'Pct_Real'.
-    # Q1 = p25, Q3 = p75
-    # IQR = Q3 - Q1
-    # Lower Bound = Q1 - 1.5 * IQR
-    # Upper Bound = Q3 + 1.5 * IQR
-    # Solo consideramos outliers aquellos que tengan Base > 0 (para evitar división por cero infinita afectando)
-    
-    outliers_list = []
-    
-    # Filtramos data con Base > 0 para análisis de outliers
-    df_analysis = df_final[df_final['Avaluo_pre'] > 0].copy()
-    
-    if len(df_analysis) > 5: # Mínimo de datos para estadística robusta
-        try:
-            Q1 = df_analysis['Pct_Real'].quantile(0.25)
-            Q3 = df_analysis['Pct_Real'].quantile(0.75)
-            IQR = Q3 - Q1
-            
-            lower_bound = Q1 - 1.5 * IQR
-            upper_bound = Q3 + 1.5 * IQR
-            
-            # Identificar outliers
-            # Nos interesan principalmente los aumentos EXTREMOS (Upper Bound) o disminuciones extremas (Lower Bound)
-            outliers_df = df_analysis[
-                (df_analysis['Pct_Real'] < lower_bound) | 
-                (df_analysis['Pct_Real'] > upper_bound)
-            ]
-            
-            # Ordenar por magnitud de desviación (absoluta)
-            outliers_df['deviation_mag'] = (outliers_df['Pct_Real'] - df_analysis['Pct_Real'].median()).abs()
-            outliers_df = outliers_df.sort_values('deviation_mag', ascending=False).head(10) # Top 10 outliers
-            
-            # Seleccionar columnas
-            cols_out = ['Predial_Nacional', 'Nombre', 'Zona', 'Avaluo_pre', 'Avaluo_post', 'Pct_Real']
-            outliers_list = outliers_df[cols_out].rename(columns={
-                'Avaluo_pre': 'Base', 
-                'Avaluo_post': 'Sistema'
-            }).to_dict(orient='records')
-            
-        except Exception as e:
-            print(f"Error calculando outliers: {e}")
-            outliers_list = []
+    # 7. OUTLIERS (Análisis Estadístico): IQR de Pct_Real dentro de cada grupo zona x destino
+    try:
+        outliers_list, outliers_grupos = detectar_outliers(df_final, por_municipio=outliers_por_municipio)
+    except Exception as e:
+        print(f"Error calculando outliers: {e}")
+        outliers_list, outliers_grupos = [], []
+
+    return {'stats': stats, 'ade_stats': [], 'data': records, 'resultado_id': resultado_id, 'opciones_filtro': opciones_filtro,
+            'campos_cambio': list(CAMPOS_CAMBIO), 'outliers': outliers_list, 'outliers_grupos': outliers_grupos, 'nuevos_full': nuevos_full, 'desaparecidos_full': desaparecidos_full}
+
+
+# =============================================================================
+# COMPARACIÓN DEPARTAMENTAL (un par de archivos por proceso)
+# =============================================================================
+def _agregados_municipio(grupo):
+    estados = grupo['Estado'].value_counts()
+    ambos = (grupo['_merge'] == 'both').to_numpy()
+    return {
+        'predios': len(grupo),
+        'ok': int(estados.get('OK', 0)),
+        'sin_aumento': int(estados.get('SIN_AUMENTO', 0)),
+        'inconsistencias': int(estados.get('INCONSISTENCIA', 0)),
+        'nuevos': int(estados.get('NUEVO', 0)),
+        'desaparecidos': int(estados.get('DESAPARECIDO', 0)),
+        'total_base': int(round(grupo['Avaluo_pre'].sum())),
+        'total_calculado': int(grupo['Calculado'].sum()),
+        'total_sistema': int(round(grupo['Avaluo_post'].sum())),
+        'total_diferencia': int(grupo['Diferencia'].sum()),
+        # Predios en ambos archivos: base de la variación real del municipio
+        'base_comun': int(round(grupo['Avaluo_pre'].to_numpy()[ambos].sum())),
+        'sistema_comun': int(round(grupo['Avaluo_post'].to_numpy()[ambos].sum())),
+    }
+
+def comparar_municipios(archivo, file_pre, file_post, pct_urbano, pct_rural, zona_filter='TODOS', directorio_cache=None):
+    """Tarea de un proceso: compara un par de archivos y agrega por municipio (5 primeros dígitos del NPN)."""
+    t0 = time.perf_counter()
+    try:
+        df_final, encodings = cargar_universo(file_pre, file_post, zona_filter, directorio_cache)
+        df_final = calcular_comparacion(df_final, pct_urbano, pct_rural)
+        codigos = df_final['Predial_Nacional'].astype(str).str.slice(0, 5)
+        municipios = [dict(codigo=codigo, archivo=archivo, **_agregados_municipio(grupo))
+                      for codigo, grupo in df_final.groupby(codigos, sort=True)]
+        return {'archivo': archivo, 'estado': 'OK', 'error': '', 'municipios': municipios,
+                'avaluos_sistema': df_final['Avaluo_post'].to_numpy(dtype=np.float64),
+                'encoding_pre': encodings['pre'], 'encoding_post': encodings['post'],
+                'segundos': round(time.perf_counter() - t0, 3)}
+    except Exception as e:
+        return {'archivo': archivo, 'estado': 'ERROR', 'error': str(e), 'municipios': [],
+                'avaluos_sistema': np.empty(0), 'encoding_pre': None, 'encoding_post': None,
+                'segundos': round(time.perf_counter() - t0, 3)}
+
+def procesar_departamento(pares, pct_urbano, pct_rural, zona_filter='TODOS', directorio_cache=None, max_workers=None):
+    """
+    Compara en paralelo los pares (nombre, pre, post) de varios municipios y consolida:
+    'stats' del departamento (mismas llaves que procesar_incremento_web), 'municipios'
+    (desglose por código DANE) y 'archivos' (estado y tiempo de cada par).
+    """
+    tareas = [(nombre, pre, post, pct_urbano, pct_rural, zona_filter, directorio_cache) for nombre, pre, post in pares]
+    if not tareas:
+        raise ValueError("No hay pares de archivos (Base y Sistema) para comparar.")
+    workers = min(len(tareas), max_workers or os.cpu_count() or 1)
+    if workers == 1:
+        resultados = [comparar_municipios(*t) for t in tareas]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            resultados = list(pool.map(comparar_municipios, *zip(*tareas)))
+
+    # Un municipio repartido en varios archivos se suma en una sola fila
+    municipios = {}
+    for fila in (m for r in resultados for m in r['municipios']):
+        if fila['codigo'] not in municipios:
+            municipios[fila['codigo']] = dict(fila)
+            continue
+        actual = municipios[fila['codigo']]
+        for col in CONTEOS_MUNICIPIO:
+            actual[col] += fila[col]
+        actual['archivo'] += ', ' + fila['archivo']
+    filas = []
+    for codigo, fila in sorted(municipios.items()):
+        fila['nombre'] = MUNICIPIOS_SUCRE.get(codigo, '')
+        fila['variacion_pct'] = (fila['sistema_comun'] / fila['base_comun'] - 1) * 100 if fila['base_comun'] else 0.0
+        filas.append(fila)
+    filas.sort(key=lambda f: f['inconsistencias'], reverse=True)
+
+    avaluos = np.concatenate([r['avaluos_sistema'] for r in resultados])
+    totales = {col: sum(f[col] for f in filas) for col in CONTEOS_MUNICIPIO}
+    stats = {
+        'pct_urbano': pct_urbano,
+        'pct_rural': pct_rural,
+        'zona_filter': zona_filter,
+        'municipios': len(filas),
+        'total_registros_universo': totales['predios'],
+        'ok': totales['ok'],
+        'sin_aumento': totales['sin_aumento'],
+        'nuevos': totales['nuevos'],
+        'desaparecidos': totales['desaparecidos'],
+        'inconsistencias': totales['inconsistencias'],
+        'total_calculado': totales['total_calculado'],
+        'total_diferencia': totales['total_diferencia'],
+        'variacion_pct': (totales['sistema_comun'] / totales['base_comun'] - 1) * 100 if totales['base_comun'] else 0.0,
+        'mean': float(avaluos.mean()) if len(avaluos) else 0,
+        'median': float(np.median(avaluos)) if len(avaluos) else 0,
+        'std': float(avaluos.std(ddof=1)) if len(avaluos) > 1 else 0,
+        'total_monto': float(avaluos.sum()),
+        'workers': workers,
+    }
+    archivos = [{k: r[k] for k in ('archivo', 'estado', 'error', 'encoding_pre', 'encoding_post', 'segundos')} for r in resultados]
+    return {'stats': stats, 'municipios': filas, 'archivos': archivos}
+
+def _nombres_zip(rutas_zip):
+    """
+    Nombre con que se empareja cada archivo del ZIP: el nombre base si es único; si se repite
+    (mun_a/R1.txt y mun_b/R1.txt), la ruta dentro del ZIP sin la carpeta raíz común.
+    """
+    partes = [r.split('/') for r in rutas_zip]
+    if partes and all(len(p) > 1 and p[0] == partes[0][0] for p in partes):
+        partes = [p[1:] for p in partes]
+    conteo = Counter(p[-1] for p in partes)
+    return [p[-1] if conteo[p[-1]] == 1 else '/'.join(p) for p in partes]
+
+def _extraer_zip(zip_stream, destino):
+    """
+    Extrae los archivos de avalúo del ZIP con nombres internos. Retorna ({nombre: ruta}, repetidos):
+    `repetidos` son las entradas omitidas por aparecer con la misma ruta más de una vez en el ZIP.
+    """
+    os.makedirs(destino)
+    rutas, repetidos = {}, []
+    with zipfile.ZipFile(zip_stream) as z:
+        infos = [info for info in z.infolist() if not info.is_dir() and not info.filename.startswith('__MACOSX/')
+                 and info.filename.lower().endswith(EXTENSIONES_AVALUO)]
+        for info, nombre in zip(infos, _nombres_zip([i.filename for i in infos])):
+            if nombre in rutas:
+                repetidos.append(info.filename)
+                continue
+            # La extensión se conserva: decide el lector (ancho fijo, CSV o Excel)
+            ruta = os.path.join(destino, f"in_{len(rutas):04d}{posixpath.splitext(nombre)[1].lower()}")
+            with z.open(info) as src, open(ruta, 'wb') as dst:
+                while True:
+                    bloque = src.read(1024 * 1024)
+                    if not bloque: break
+                    dst.write(bloque)
+            rutas[nombre] = ruta
+    return rutas, repetidos
 
-    return {'stats': stats, 'ade_stats': [], 'data': records, 'outliers': outliers_list, 'nuevos_full': nuevos_full, 'desaparecidos_full': desaparecidos_full}
\ No newline at end of file
+def procesar_departamento_zip(zip_pre, zip_post, pct_urbano, pct_rural, zona_filter='TODOS', directorio_trabajo=None,
+                              directorio_cache=None, max_workers=None):
+    """procesar_departamento sobre dos ZIP (Base y Sistema) emparejados por nombre de archivo."""
+    with tempfile.TemporaryDirectory(dir=directorio_trabajo) as tmp:
+        pre, repetidos_pre = _extraer_zip(zip_pre, os.path.join(tmp, 'pre'))
+        post, repetidos_post = _extraer_zip(zip_post, os.path.join(tmp, 'post'))
+        comunes = sorted(set(pre) & set(post))
+        if not comunes:
+            raise ValueError("Los ZIP no tienen archivos con el mismo nombre para emparejar (Base y Sistema).")
+        res = procesar_departamento([(n, pre[n], post[n]) for n in comunes], pct_urbano, pct_rural, zona_filter,
+                                    directorio_cache, max_workers)
+    res['sin_pareja'] = sorted(set(pre) ^ set(post))
+    res['repetidos'] = sorted(repetidos_pre + repetidos_post)
+    return res
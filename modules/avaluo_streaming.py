@@ -0,0 +1,308 @@
+"""Comparación de avalúos por mezcla ordenada (merge-join) con memoria acotada.
+
+Los extractos R1 del SNC vienen ordenados por número predial. En lugar de cargar
+ambos archivos y cruzarlos con un `pd.merge` en memoria, se leen por bloques y se
+avanza sobre los dos flujos a la vez: en cada paso se cruzan los predios hasta la
+menor de las últimas llaves leídas (ninguno de los dos archivos puede traer después
+un predio anterior a ella). Cada parte se compara, se escribe al Parquet de
+resultados y se acumula en los KPIs, así la memoria depende del tamaño del bloque
+y no del departamento."""
+
+import math
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from modules.lector_fwf import registros_por_bloques, detectar_encoding_archivo
+from modules.llave_npn import columnas_llave, COLUMNAS_LLAVE
+from modules.avaluo_analisis import (normalizar_snc, filtro_zona_fwf, filtrar_zona_npn, cruzar_universo, calcular_comparacion,
+                                     marcar_cambios, tabla_resultados, ruta_resultados, LAYOUT_R1, CODIGOS_ZONA,
+                                     CAMPOS_CAMBIO, FILTROS_RESULTADO, COLUMNAS_RESULTADOS, FILAS_GRUPO_RESULTADOS)
+
+BYTES_BLOQUE_STREAMING = 16 * 1024 * 1024
+# Error relativo de la mediana estimada y candidatos que se conservan para la moda
+ERROR_RELATIVO_MEDIANA = 0.005
+CANDIDATOS_MODA = 1000
+EXTENSIONES_STREAMING = ('.txt', '.prn')
+
+# Tipos fijos de los montos en todos los bloques (los mismos del Parquet en memoria):
+# Base y Sistema pueden traer NaN en un bloque y no en otro; los redondeados son enteros
+_TIPOS_MONTO = {'Base': np.float64, 'Sistema': np.float64, 'Calculado': np.int64, 'Diferencia': np.int64}
+# Montos que en memoria quedan enteros (int32/int64 de reducir_numerica) si el cruce no dejó
+# faltantes: se escriben en float64 y al final se convierten si todas las partes fueron enteras
+_MONTOS_REDUCIBLES = ['Base', 'Sistema']
+
+
+class SketchCuantiles:
+    """Histograma de cubetas logarítmicas (como DDSketch) para cuantiles de valores >= 0.
+
+    Cada valor positivo cae en la cubeta ceil(log_gamma(x)); el cuantil estimado tiene
+    error relativo menor a `error_relativo` y el tamaño solo depende del rango de valores."""
+
+    def __init__(self, error_relativo=ERROR_RELATIVO_MEDIANA):
+        self.gamma = (1 + error_relativo) / (1 - error_relativo)
+        self.log_gamma = math.log(self.gamma)
+        self.ceros = 0
+        self.conteos = np.zeros(0, dtype=np.int64)
+
+    def agregar(self, valores):
+        valores = np.asarray(valores, dtype=np.float64)
+        positivos = valores[valores > 0]
+        self.ceros += len(valores) - len(positivos)
+        if len(positivos):
+            cubetas = np.maximum(np.ceil(np.log(positivos) / self.log_gamma), 0).astype(np.int64)
+            conteo = np.bincount(cubetas)
+            if len(conteo) > len(self.conteos):
+                self.conteos = np.pad(self.conteos, (0, len(conteo) - len(self.conteos)))
+            self.conteos[:len(conteo)] += conteo
+
+    def __len__(self):
+        return int(self.ceros + self.conteos.sum())
+
+    def _valor(self, rango, acumulado):
+        """Valor estimado del elemento en la posición `rango` (0..n-1) del orden."""
+        if rango < self.ceros:
+            return 0.0
+        cubeta = int(np.searchsorted(acumulado, rango - self.ceros, side='right'))
+        return 2 * self.gamma ** cubeta / (self.gamma + 1)
+
+    def cuantil(self, q):
+        """Cuantil con interpolación lineal entre posiciones, como Series.quantile (y median)."""
+        total = len(self)
+        if total == 0:
+            return 0.0
+        rango = q * (total - 1)
+        acumulado = np.cumsum(self.conteos)
+        bajo, alto = self._valor(math.floor(rango), acumulado), self._valor(math.ceil(rango), acumulado)
+        return bajo + (alto - bajo) * (rango - math.floor(rango))
+
+
+class AcumuladorKPI:
+    """KPIs de procesar_incremento_web acumulados parte a parte sobre las filas de tabla_resultados."""
+
+    def __init__(self):
+        self.n = 0
+        self.media = 0.0
+        self.m2 = 0.0
+        self.total_monto = 0.0
+        self.estados = {}
+        self.cambios = dict.fromkeys(CAMPOS_CAMBIO, 0)
+        self.predios_con_cambios = 0
+        self.opciones = {col: set() for col in FILTROS_RESULTADO.values()}
+        self.sketch = SketchCuantiles()
+        self.moda = pd.Series(dtype=np.int64)
+
+    def agregar(self, parte):
+        if parte.empty:
+            return
+        sistema = parte['Sistema'].to_numpy(dtype=np.float64)
+        # Media y varianza combinadas por partes (Chan et al.)
+        n_b, media_b = len(sistema), sistema.mean()
+        m2_b = ((sistema - media_b) ** 2).sum()
+        delta = media_b - self.media
+        total = self.n + n_b
+        self.media += delta * n_b / total
+        self.m2 += m2_b + delta ** 2 * self.n * n_b / total
+        self.n = total
+        self.total_monto += sistema.sum()
+        self.sketch.agregar(sistema)
+
+        # Moda: conteos exactos de los valores más frecuentes (los demás se descartan)
+        moda = self.moda.add(parte['Sistema'].value_counts(), fill_value=0)
+        self.moda = moda.nlargest(CANDIDATOS_MODA) if len(moda) > CANDIDATOS_MODA else moda
+
+        for estado, conteo in parte['Estado'].value_counts().items():
+            self.estados[estado] = self.estados.get(estado, 0) + int(conteo)
+        cambios = parte['Cambios'].to_numpy()
+        for bit, campo in enumerate(CAMPOS_CAMBIO):
+            self.cambios[campo] += int(((cambios >> bit) & 1).sum())
+        self.predios_con_cambios += int((cambios > 0).sum())
+        for col, valores in self.opciones.items():
+            valores.update(str(v) for v in parte[col].dropna().unique())
+
+    def stats(self, zona_filter, encodings):
+        return {
+            'sample_pct': 100,
+            'zona_filter': zona_filter,
+            'total_registros_muestra': self.n,
+            'total_registros_universo': self.n,
+            'ok': self.estados.get('OK', 0),
+            'nuevos': self.estados.get('NUEVO', 0),
+            'desaparecidos': self.estados.get('DESAPARECIDO', 0),
+            'inconsistencias': self.estados.get('INCONSISTENCIA', 0),
+            'mean': float(self.media) if self.n else 0,
+            'median': float(self.sketch.cuantil(0.5)),
+            'mode': float(self.moda.idxmax()) if len(self.moda) else 0,
+            'std': float(np.sqrt(self.m2 / (self.n - 1))) if self.n > 1 else 0,
+            'total_monto': float(self.total_monto),
+            'cambios': self.cambios,
+            'predios_con_cambios': self.predios_con_cambios,
+            'encoding_pre': encodings['pre'],
+            'encoding_post': encodings['post'],
+        }
+
+
+def _llave_menor_igual(df, llave):
+    """Máscara de filas con (NPN_Alta, NPN_Baja) <= `llave`."""
+    alta, baja = df[COLUMNAS_LLAVE[0]].to_numpy(), df[COLUMNAS_LLAVE[1]].to_numpy()
+    return (alta < llave[0]) | ((alta == llave[0]) & (baja <= llave[1]))
+
+
+def _ultima_llave(df):
+    return tuple(int(df[c].iat[-1]) for c in COLUMNAS_LLAVE)
+
+
+def lotes_snc(ruta, zona_filter='TODOS', bytes_bloque=BYTES_BLOQUE_STREAMING):
+    """
+    DataFrames normalizados como los de cargar_snc, uno por bloque de un R1 de ancho fijo
+    ordenado por número predial. Verifica el orden y quita los duplicados entre bloques.
+    """
+    nombre = os.path.basename(ruta)
+    if not ruta.lower().endswith(EXTENSIONES_STREAMING):
+        raise ValueError(f"{nombre}: la comparación por bloques requiere archivos planos de ancho fijo (.txt/.prn).")
+    # Primera pasada por bloques de `bytes_bloque` (el archivo no se carga ni se mapea completo)
+    encoding = detectar_encoding_archivo(ruta, bytes_bloque)
+    filtro = filtro_zona_fwf(zona_filter) if zona_filter in CODIGOS_ZONA else None
+    anterior = None
+    for registros in registros_por_bloques(ruta, encoding=encoding, bytes_bloque=bytes_bloque):
+        filas = None if filtro is None else np.flatnonzero(filtro(registros))
+        df = filtrar_zona_npn(normalizar_snc(registros.dataframe(LAYOUT_R1.colspecs, filas=filas), encoding), zona_filter)
+        if df.empty:
+            continue
+        if not columnas_llave(df):
+            raise ValueError(f"{nombre}: hay números prediales que no son de 30 dígitos; use la comparación en memoria.")
+        alta, baja = df[COLUMNAS_LLAVE[0]].to_numpy(), df[COLUMNAS_LLAVE[1]].to_numpy()
+        ordenado = (alta[1:] > alta[:-1]) | ((alta[1:] == alta[:-1]) & (baja[1:] > baja[:-1]))
+        primera = (int(alta[0]), int(baja[0]))
+        if not ordenado.all() or (anterior is not None and primera < anterior):
+            raise ValueError(f"{nombre}: el archivo no está ordenado por número predial; use la comparación en memoria.")
+        if primera == anterior:
+            # El predio continúa del bloque anterior: se conserva el primer registro, como en cargar_snc
+            df = df.iloc[1:]
+            if df.empty:
+                continue
+        anterior = _ultima_llave(df)
+        df.attrs['encoding'] = encoding
+        yield df
+
+
+def cruce_ordenado(lotes_pre, lotes_post):
+    """
+    Genera pares (parte_pre, parte_post) con todos los predios de ambos flujos hasta una
+    llave frontera, listos para cruzar_universo. El lado sin filas llega como un DataFrame
+    vacío con las columnas del otro.
+    """
+    flujos = [iter(lotes_pre), iter(lotes_post)]
+    buffers = [None, None]
+    activos = [True, True]
+    while True:
+        for i in (0, 1):
+            if activos[i] and (buffers[i] is None or buffers[i].empty):
+                siguiente = next(flujos[i], None)
+                if siguiente is None:
+                    activos[i] = False
+                else:
+                    buffers[i] = siguiente
+        if buffers[0] is None and buffers[1] is None:
+            return
+        molde = (buffers[0] if buffers[0] is not None else buffers[1]).iloc[:0]
+        buffers = [molde if b is None else b for b in buffers]
+        if not any(activos):
+            if not (buffers[0].empty and buffers[1].empty):
+                yield buffers[0], buffers[1]
+            return
+        # Un flujo terminado ya no trae llaves: la frontera la pone el que sigue activo
+        frontera = min(_ultima_llave(buffers[i]) for i in (0, 1) if activos[i])
+        partes = []
+        for i in (0, 1):
+            hasta = int(_llave_menor_igual(buffers[i], frontera).sum())
+            partes.append(buffers[i].iloc[:hasta])
+            buffers[i] = buffers[i].iloc[hasta:]
+        yield partes[0], partes[1]
+
+
+def _esquema_resultados(tabla):
+    """Esquema fijo para todas las partes: categorías con índices int32 (cada parte trae sus propias categorías)."""
+    campos = [pa.field(c.name, pa.dictionary(pa.int32(), c.type.value_type)) if pa.types.is_dictionary(c.type) else c
+              for c in tabla.schema]
+    return pa.schema(campos, metadata=tabla.schema.metadata)
+
+
+def _convertir_columnas(ruta, tipos):
+    """Reescribe el Parquet con las columnas de `tipos` convertidas, un row group a la vez."""
+    archivo = pq.ParquetFile(ruta)
+    esquema = archivo.schema_arrow
+    for nombre, tipo in tipos.items():
+        esquema = esquema.set(esquema.get_field_index(nombre), pa.field(nombre, tipo))
+    temporal = f"{ruta}.{uuid.uuid4().hex}.tmp"
+    try:
+        with pq.ParquetWriter(temporal, esquema) as escritor:
+            for i in range(archivo.num_row_groups):
+                escritor.write_table(archivo.read_row_group(i).cast(esquema))
+        os.replace(temporal, ruta)
+    finally:
+        if os.path.exists(temporal): os.remove(temporal)
+
+
+def procesar_incremento_streaming(ruta_pre, ruta_post, pct_urbano, pct_rural, zona_filter='TODOS', directorio_resultados='.',
+                                  bytes_bloque=BYTES_BLOQUE_STREAMING):
+    """
+    Variante de procesar_incremento_web para archivos grandes ordenados por NPN: merge-join
+    por bloques, tabla de resultados escrita por partes en Parquet y KPIs incrementales
+    (mediana estimada con SketchCuantiles, moda sobre los valores más frecuentes).
+    Retorna la misma estructura; sin muestreo, sin outliers y sin listas completas de nuevos
+    y desaparecidos (se consultan filtrando la tabla de resultados por Estado).
+    """
+    lotes_pre = lotes_snc(ruta_pre, zona_filter, bytes_bloque)
+    lotes_post = lotes_snc(ruta_post, zona_filter, bytes_bloque)
+    os.makedirs(directorio_resultados, exist_ok=True)
+    resultado_id = uuid.uuid4().hex
+    ruta = ruta_resultados(directorio_resultados, resultado_id)
+    kpi = AcumuladorKPI()
+    # Tipo entero más ancho de cada monto reducible en las partes; None si alguna parte fue float
+    enteros = dict.fromkeys(_MONTOS_REDUCIBLES, np.dtype(np.int32))
+    encodings = {'pre': None, 'post': None}
+    escritor = None
+    try:
+        for parte_pre, parte_post in cruce_ordenado(lotes_pre, lotes_post):
+            encodings['pre'] = encodings['pre'] or parte_pre.attrs.get('encoding')
+            encodings['post'] = encodings['post'] or parte_post.attrs.get('encoding')
+            df_final = calcular_comparacion(cruzar_universo(parte_pre, parte_post), pct_urbano, pct_rural)
+            marcar_cambios(df_final)
+            parte = tabla_resultados(df_final)
+            for col, tipo in enteros.items():
+                enteros[col] = np.promote_types(tipo, parte[col].dtype) if tipo is not None and parte[col].dtype.kind in 'iu' else None
+            parte = parte.astype(_TIPOS_MONTO)
+            kpi.agregar(parte)
+            tabla = pa.Table.from_pandas(parte, preserve_index=False)
+            if escritor is None:
+                escritor = pq.ParquetWriter(ruta, _esquema_resultados(tabla))
+            escritor.write_table(tabla.cast(escritor.schema), row_group_size=FILAS_GRUPO_RESULTADOS)
+    except Exception:
+        if escritor is not None:
+            escritor.close()
+            escritor = None
+        if os.path.exists(ruta): os.remove(ruta)
+        raise
+    finally:
+        if escritor is not None:
+            escritor.close()
+    if escritor is None:
+        # Sin predios en la zona: tabla de resultados vacía
+        pd.DataFrame(columns=COLUMNAS_RESULTADOS).to_parquet(ruta, index=False)
+    else:
+        tipos = {col: pa.from_numpy_dtype(tipo) for col, tipo in enteros.items() if tipo is not None}
+        if tipos:
+            _convertir_columnas(ruta, tipos)
+
+    return {'stats': kpi.stats(zona_filter, encodings), 'ade_stats': [], 'data': [], 'resultado_id': resultado_id,
+            'opciones_filtro': {col: sorted(v) for col, v in kpi.opciones.items()}, 'campos_cambio': list(CAMPOS_CAMBIO),
+            'outliers': [], 'outliers_grupos': [], 'nuevos_full': [], 'desaparecidos_full': []}
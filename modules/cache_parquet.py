@@ -0,0 +1,121 @@
+"""Caché en disco de DataFrames ya parseados, en Parquet y con llave por hash del contenido.
+
+Volver a ejecutar un análisis con otros parámetros sobre los mismos archivos lee el
+Parquet (milisegundos) en lugar de repetir el parseo, la detección de encoding y la
+reparación de texto. Sin pyarrow la caché se desactiva y se parsea siempre."""
+
+import hashlib
+import json
+import os
+import uuid
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from modules.tipos_compactos import TIPO_TEXTO
+
+MAX_ARCHIVOS_CACHE = 40
+BYTES_BLOQUE_HASH = 1 << 20
+
+# Hash ya calculado por (ruta, tamaño, fecha de modificación): no se relee el archivo en cada consulta
+_HASHES = {}
+
+
+def hash_archivo(ruta):
+    """sha256 del contenido del archivo (memorizado mientras el archivo no cambie)."""
+    info = os.stat(ruta)
+    llave = (os.path.abspath(ruta), info.st_size, info.st_mtime_ns)
+    if llave not in _HASHES:
+        h = hashlib.sha256()
+        with open(ruta, 'rb') as f:
+            for bloque in iter(lambda: f.read(BYTES_BLOQUE_HASH), b''):
+                h.update(bloque)
+        _HASHES[llave] = h.hexdigest()
+    return _HASHES[llave]
+
+
+def leer_parquet(ruta, filtros=None, columnas=None):
+    """
+    Lee un Parquet conservando el texto como Arrow (TIPO_TEXTO) y las categóricas.
+    `filtros` (formato de pyarrow, p. ej. [('Estado', 'in', ['OK'])]) se evalúa en la lectura
+    y `columnas` limita las columnas que se leen del archivo.
+    """
+    tabla = pq.read_table(ruta, columns=columnas, filters=filtros or None)
+    df = _a_pandas(tabla)
+    # df.attrs (p. ej. el encoding detectado) que pandas guarda en los metadatos
+    metadatos = tabla.schema.metadata or {}
+    if b'PANDAS_ATTRS' in metadatos:
+        df.attrs = json.loads(metadatos[b'PANDAS_ATTRS'])
+    return df
+
+
+def _a_pandas(tabla):
+    mapa = {pa.string(): TIPO_TEXTO, pa.large_string(): TIPO_TEXTO}
+    return tabla.to_pandas(types_mapper=mapa.get)
+
+
+def leer_filas_parquet(ruta, posiciones):
+    """
+    Filas de `ruta` en las posiciones dadas y en ese orden, como leer_parquet. Solo se leen
+    los grupos de filas (row groups) que contienen alguna de las posiciones, uno a la vez.
+    """
+    archivo = pq.ParquetFile(ruta)
+    posiciones = np.asarray(posiciones, dtype=np.int64)
+    if not len(posiciones):
+        return _a_pandas(archivo.schema_arrow.empty_table())
+    limites = np.cumsum([0] + [archivo.metadata.row_group(i).num_rows for i in range(archivo.num_row_groups)])
+    grupos = np.searchsorted(limites, posiciones, side='right') - 1
+    partes, orden = [], []
+    for grupo in np.unique(grupos):
+        dentro = np.flatnonzero(grupos == grupo)
+        partes.append(archivo.read_row_group(int(grupo)).take(pa.array(posiciones[dentro] - limites[grupo])))
+        orden.append(dentro)
+    tabla = pa.concat_tables(partes).take(pa.array(np.argsort(np.concatenate(orden), kind='stable')))
+    return _a_pandas(tabla)
+
+
+def guardar_parquet(df, ruta, filas_grupo=None):
+    """Escritura atómica: otro proceso nunca ve un Parquet a medio escribir. `filas_grupo` limita el tamaño de cada row group."""
+    temporal = f"{ruta}.{uuid.uuid4().hex}.tmp"
+    try:
+        df.to_parquet(temporal, index=False, row_group_size=filas_grupo)
+        os.replace(temporal, ruta)
+    finally:
+        if os.path.exists(temporal): os.remove(temporal)
+
+
+def limpiar_cache(directorio, max_archivos=MAX_ARCHIVOS_CACHE):
+    """Deja solo los `max_archivos` Parquet usados más recientemente."""
+    archivos = [os.path.join(directorio, n) for n in os.listdir(directorio) if n.endswith('.parquet')]
+    archivos.sort(key=os.path.getmtime, reverse=True)
+    for ruta in archivos[max_archivos:]:
+        try: os.remove(ruta)
+        except OSError: pass
+
+
+def cargar_con_cache(ruta, cargar, directorio, prefijo):
+    """
+    Retorna `cargar(ruta)` usando la caché de `directorio`. La llave es
+    `{prefijo}_{sha256}`: el prefijo debe cambiar cuando cambie el parseo.
+    """
+    if pq is None:
+        return cargar(ruta)
+    os.makedirs(directorio, exist_ok=True)
+    destino = os.path.join(directorio, f"{prefijo}_{hash_archivo(ruta)}.parquet")
+    if os.path.exists(destino):
+        try:
+            df = leer_parquet(destino)
+            os.utime(destino)  # Marca de uso para la limpieza
+            return df
+        except Exception:
+            # Parquet dañado: se vuelve a parsear y se reemplaza
+            pass
+    df = cargar(ruta)
+    guardar_parquet(df, destino)
+    limpiar_cache(directorio)
+    return df
@@ -0,0 +1,125 @@
+"""Registro único de estructuras (layouts) de los archivos planos del SNC.
+
+Cada layout define columnas y cortes una sola vez; los colspecs, anchos y tipos
+se precalculan y validan al importar el módulo. Lo usan el convertidor SNC, el
+análisis de avalúos y cualquier lector nuevo de ancho fijo."""
+
+import re
+import numpy as np
+
+# Columnas que se convierten a número (mismo criterio del convertidor SNC)
+PALABRAS_NUMERICAS = ['Area', 'Avaluo', 'Valor', 'Puntaje', 'Habitaciones', 'Baños', 'Locales', 'NoOrden', 'TotalRegistro']
+
+# Códigos de texto cortos (hasta este ancho) y la vigencia se guardan como categóricas
+ANCHO_MAX_CATEGORIA = 3
+COLUMNAS_CATEGORICAS = ['Vigencia']
+# Números prediales: texto de ancho fijo y alta cardinalidad
+PREFIJOS_NPN = ('NoPredial', 'NoPredio')
+
+
+def generar_colspecs(cortes):
+    colspecs = []
+    for i in range(len(cortes) - 1):
+        colspecs.append((cortes[i], cortes[i+1]))
+    colspecs.append((cortes[-1], None))
+    return colspecs
+
+
+def nombre_corto(columna):
+    """'AreaTerreno (m2)' -> 'AreaTerreno', 'Avaluo ($)' -> 'Avaluo'."""
+    return re.sub(r'\s*\(.*\)$', '', columna)
+
+
+class LayoutSNC:
+    """Estructura de un tipo de archivo plano: columnas, cortes y filtro de TipoRegistro."""
+
+    def __init__(self, nombre, descripcion, columnas, cortes, filtro_tipo=None):
+        self.nombre = nombre
+        self.descripcion = descripcion
+        self.columnas = list(columnas)
+        self.cortes = list(cortes)
+        self.filtro_tipo = filtro_tipo
+        self._validar()
+
+        self.colspecs = generar_colspecs(self.cortes)
+        self.anchos = [None if b is None else b - a for a, b in self.colspecs]
+        self.longitud = self.cortes[-1]
+        self.numericas = [c for c in self.columnas if any(x in c for x in PALABRAS_NUMERICAS)]
+        self.tipos = {c: ('numero' if c in self.numericas else 'texto') for c in self.columnas}
+        self.columnas_cortas = [nombre_corto(c) for c in self.columnas]
+        self.posicion = dict(zip(self.columnas, self.colspecs))
+        self.npn = [c for c in self.columnas if c.startswith(PREFIJOS_NPN)]
+        self.categoricas = [c for c, ancho in zip(self.columnas, self.anchos)
+                            if c not in self.numericas and c not in self.npn
+                            and ((ancho is not None and ancho <= ANCHO_MAX_CATEGORIA) or c in COLUMNAS_CATEGORICAS)]
+        self.textos = [c for c in self.columnas if c not in self.numericas and c not in self.categoricas]
+
+    def _validar(self):
+        if len(self.columnas) != len(self.cortes):
+            raise ValueError(f"Layout {self.nombre}: {len(self.columnas)} columnas para {len(self.cortes)} cortes")
+        if self.cortes[0] != 0 or any(a >= b for a, b in zip(self.cortes, self.cortes[1:])):
+            raise ValueError(f"Layout {self.nombre}: los cortes deben iniciar en 0 y ser crecientes")
+        if len(set(self.columnas)) != len(self.columnas):
+            raise ValueError(f"Layout {self.nombre}: nombres de columna repetidos")
+        if self.filtro_tipo is not None and 'TipoRegistro' not in self.columnas:
+            raise ValueError(f"Layout {self.nombre}: filtro_tipo requiere la columna TipoRegistro")
+
+    def filas(self, registros):
+        """Máscara del TipoRegistro pedido evaluada sobre los bytes crudos (None si no hay filtro)."""
+        if self.filtro_tipo is None:
+            return None
+        inicio, fin = self.posicion['TipoRegistro']
+        if registros.matriz.shape[1] <= inicio:
+            return np.zeros(len(registros), dtype=bool)
+        # TipoRegistro ocupa una sola posición: se compara el código del dígito
+        return registros.matriz[:, inicio] == ord(str(self.filtro_tipo))
+
+    def dataframe(self, registros, cortas=False, seleccion=None):
+        """Arma el DataFrame de un `RegistrosFWF` con los nombres del layout, ya filtrado.
+
+        `seleccion` limita el corte a esas columnas (las demás no se extraen)."""
+        indices = range(len(self.columnas)) if seleccion is None else [self.columnas.index(c) for c in seleccion]
+        nombres = self.columnas_cortas if cortas else self.columnas
+        return registros.dataframe([self.colspecs[i] for i in indices], [nombres[i] for i in indices], self.filas(registros))
+
+    def renombrar_cortas(self, df):
+        """Cambia los nombres largos del layout por los cortos (AreaTerreno, Avaluo...)."""
+        return df.rename(columns=dict(zip(self.columnas, self.columnas_cortas)))
+
+
+LAYOUTS = {
+    'R1': LayoutSNC(
+        'R1', 'Datos Básicos de Predios',
+        ["Departamento", "Municipio", "NoPredial", "TipoRegistro", "NoOrden", "TotalRegistro", "Nombre", "EstadoCivil", "TipoDocumento", "NoDocumento", "Direccion", "Comuna", "DestinoEconomico", "AreaTerreno (m2)", "AreaConstruida (m2)", "Avaluo ($)", "Vigencia", "NoPredialAnterior", "Espacio_Final"],
+        [0, 2, 5, 30, 31, 34, 37, 137, 138, 139, 151, 251, 252, 253, 268, 274, 289, 297, 312]),
+    'R2': LayoutSNC(
+        'R2', 'Detalles de Construcción',
+        ["Departamento", "Municipio", "NoPredial", "TipoRegistro", "NoOrden", "TotalRegistro", "MatriculaInmobiliaria", "Espacio1", "ZonaFisica_1", "ZonaEconomica_1", "AreaTerreno_1 (m2)", "Espacio2", "ZonaFisica_2", "ZonaEconomica_2", "AreaTerreno_2 (m2)", "Espacio3", "Habitaciones_1", "Baños_1", "Locales_1", "Pisos_1", "Estrato_1", "Uso_1", "Puntaje_1", "AreaConstruida_1 (m2)", "Espacio4", "Habitaciones_2", "Baños_2", "Locales_2", "Pisos_2", "Estrato_2", "Uso_2", "Puntaje_2", "AreaConstruida_2 (m2)", "Espacio5", "Habitaciones_3", "Baños_3", "Locales_3", "Pisos_3", "Estrato_3", "Uso_3", "Puntaje_3", "AreaConstruida_3 (m2)", "Espacio6", "Vigencia", "NoPredialAnterior", "FinLinea"],
+        [0, 2, 5, 30, 31, 34, 37, 55, 77, 80, 83, 98, 120, 123, 126, 141, 163, 165, 167, 169, 171, 172, 175, 177, 183, 205, 207, 209, 211, 213, 214, 217, 219, 225, 247, 249, 251, 253, 255, 256, 259, 261, 267, 289, 297, 312]),
+    'T1': LayoutSNC(
+        'T1', 'Resoluciones - Procedimientos Generales',
+        ["Departamento", "Municipio", "NoResolucion", "NoRadicacion", "TipoTramite", "ClaseMutacion", "NoPredio", "Cancela/Inscribe", "TipoRegistro", "NoDocumento_A", "NoOrden", "TotalRegistros", "Nombre", "EstadoCivil", "TipoDocumento", "NoDocumento_B", "Direccion", "Comuna", "DestinoEconomico", "AreaTerreno (m2)", "AreaConstruida (m2)", "Avaluo ($ miles)", "Vigencia", "NoPredialAnterior", "Espacio"],
+        [0, 2, 5, 18, 33, 35, 36, 61, 62, 63, 66, 69, 169, 170, 171, 183, 283, 284, 285, 300, 306, 321, 329, 344, 410],
+        filtro_tipo=1),
+    'T2': LayoutSNC(
+        'T2', 'Resoluciones - Detalles Físicos',
+        ["Departamento", "Municipio", "NoResolucion", "NoRadicacion", "TipoTramite", "ClaseMutacion", "NoPredio", "Cancela/Inscribe", "TipoRegistro", "NoDocumento", "NoOrden", "TotalRegistros", "MatriculaInmobiliaria", "Espacio1", "ZonaFisica_1", "ZonaEconomica_1", "AreaTerreno_1", "Espacio2", "ZonaFisica_2", "ZonaEconomica_2", "AreaTerreno_2", "Espacio3", "Habitaciones_1", "Baños_1", "Locales_1", "Pisos_1", "Tipificacion_1", "Uso_1", "Puntaje_1", "AreaConstruida_1", "Espacio4", "Habitaciones_2", "Baños_2", "Locales_2", "Pisos_2", "Tipificacion_2", "Uso_2", "Puntaje_2", "AreaConstruida_2", "Espacio5", "Habitaciones_3", "Baños_3", "Locales_3", "Pisos_3", "Tipificacion_3", "Uso_3", "Puntaje_3", "AreaConstruida_3", "Espacio6", "NoPredialAnterior"],
+        [0, 2, 5, 18, 33, 35, 36, 61, 62, 63, 66, 69, 87, 120, 123, 126, 141, 174, 177, 180, 195, 228, 230, 232, 234, 236, 238, 241, 243, 249, 282, 284, 286, 288, 290, 292, 295, 297, 303, 336, 338, 340, 342, 344, 346, 349, 351, 357, 395, 410],
+        filtro_tipo=2),
+    'T3': LayoutSNC(
+        'T3', 'Resoluciones - Decretos Legales',
+        ["Departamento", "Municipio", "NoResolucion", "NoRadicacion", "TipoTramite", "ClaseMutacion", "NoPredio", "Cancela/Inscribe", "TipoRegistro", "NoDocumento", "NoOrden", "TotalRegistros", "Decretos", "Motivacion", "NoPredialAnterior"],
+        [0, 2, 5, 18, 33, 35, 36, 61, 62, 63, 66, 69, 139, 395, 410],
+        filtro_tipo=3),
+}
+
+# Opciones del formulario del convertidor SNC
+OPCIONES = {'1': 'R1', '2': 'R2', '3': 'T1', '4': 'T2', '5': 'T3'}
+
+
+def obtener_layout(clave):
+    """Busca un layout por nombre ('R1', 'T2'...) o por opción del formulario ('1'..'5')."""
+    clave = OPCIONES.get(str(clave), str(clave).upper())
+    if clave not in LAYOUTS:
+        raise ValueError("Opción no válida")
+    return LAYOUTS[clave]
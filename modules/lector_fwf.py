@@ -0,0 +1,361 @@
+"""Lector vectorizado de archivos planos de ancho fijo (SNC R1/R2 y resoluciones).
+Lee los bytes una sola vez, los ve como una matriz de registros de longitud fija
+(equivalente a un arreglo NumPy S312/S410) y corta cada columna con NumPy."""
+
+import codecs
+import io
+import mmap
+import os
+import stat
+import numpy as np
+import pandas as pd
+
+try:
+    from pandas._libs.parsers import STR_NA_VALUES
+except ImportError:
+    STR_NA_VALUES = {'', 'NA', 'N/A', 'NULL', 'NaN', 'nan', 'None', 'null', 'n/a', '<NA>', '#N/A', '#NA'}
+
+LF, CR, TAB, ESPACIO = 10, 13, 9, 32
+_VALORES_NA = np.array(sorted(STR_NA_VALUES))
+_LARGO_MAX_NA = max(len(v) for v in STR_NA_VALUES)
+BYTES_BLOQUE_BUSQUEDA = 64 * 1024 * 1024
+FILAS_BLOQUE_COLUMNA = 262144
+BYTES_BLOQUE_UTF8 = 1024 * 1024
+# Bytes 0x80-0x9F sin carácter en cp1252: si aparecen, el archivo no es cp1252
+CP1252_INDEFINIDOS = (0x81, 0x8D, 0x8F, 0x90, 0x9D)
+
+
+def _mapear(f):
+    """Mapea un archivo abierto en modo lectura (mmap); None si no tiene descriptor real.
+
+    El mapa sigue vivo mientras existan arreglos NumPy creados sobre él, aunque el
+    archivo ya esté cerrado, así que las páginas se leen bajo demanda y sin copia."""
+    try:
+        fd = f.fileno()
+        inicio = f.tell()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+    info = os.fstat(fd)
+    if not stat.S_ISREG(info.st_mode):
+        return None
+    if info.st_size <= inicio:
+        return b''
+    mapa = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+    return memoryview(mapa)[inicio:] if inicio else mapa
+
+
+def leer_bytes(fuente):
+    """Obtiene el contenido crudo desde bytes, una ruta o un stream (FileStorage, BytesIO).
+
+    Las rutas y los streams respaldados por un archivo en disco se mapean con mmap
+    en lugar de leerse a memoria."""
+    if isinstance(fuente, (bytes, bytearray, memoryview, mmap.mmap)):
+        return fuente
+    if isinstance(fuente, (str, os.PathLike)):
+        with open(fuente, 'rb') as f:
+            return _mapear(f)
+    stream = getattr(fuente, 'stream', fuente)  # FileStorage de Flask
+    mapa = _mapear(stream)
+    if mapa is not None:
+        return mapa
+    data = stream.read()
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return data
+
+
+class DetectorEncoding:
+    """Detección de encoding por bloques: agregar() recibe el contenido en orden y
+    resultado() da lo mismo que detectar_encoding sobre el contenido completo, con
+    memoria acotada por el bloque (decodificador UTF-8 incremental y conteo de bytes)."""
+
+    def __init__(self):
+        self.decodificador = codecs.getincrementaldecoder('utf-8')()
+        self.utf8_valido = True
+        self.conteo = np.zeros(256, dtype=np.int64)
+        self.inicio = b''
+
+    def agregar(self, bloque):
+        codigos = np.frombuffer(bloque, dtype=np.uint8)
+        if len(self.inicio) < 3:
+            self.inicio += codigos[:3 - len(self.inicio)].tobytes()
+        # Por tramos: bincount convierte a enteros de 64 bits (8 veces el tamaño del tramo)
+        for a in range(0, len(codigos), BYTES_BLOQUE_UTF8):
+            tramo = codigos[a:a + BYTES_BLOQUE_UTF8]
+            self.conteo += np.bincount(tramo, minlength=256)
+            if self.utf8_valido:
+                try:
+                    self.decodificador.decode(tramo.tobytes())
+                except UnicodeDecodeError:
+                    self.utf8_valido = False
+
+    def resultado(self):
+        if not self.conteo[0x80:].any():
+            return 'utf-8'
+        if self.utf8_valido:
+            try:
+                self.decodificador.decode(b'', final=True)
+                return 'utf-8-sig' if self.inicio == codecs.BOM_UTF8 else 'utf-8'
+            except UnicodeDecodeError:
+                pass
+        if self.conteo[0x80:0xA0].any() and not self.conteo[list(CP1252_INDEFINIDOS)].any():
+            return 'cp1252'
+        return 'latin-1'
+
+
+def detectar_encoding(datos, bytes_bloque=BYTES_BLOQUE_UTF8):
+    """Elige el encoding de un contenido crudo en una sola pasada, sin parsear.
+
+    ASCII o UTF-8 válido (validado por bloques con un decodificador incremental)
+    -> 'utf-8' ('utf-8-sig' con BOM); si hay bytes 0x80-0x9F y todos existen en
+    cp1252 (comillas, guiones de Windows) -> 'cp1252'; en otro caso 'latin-1'."""
+    codigos = np.frombuffer(datos, dtype=np.uint8)
+    if len(codigos) == 0 or codigos.max() < 0x80:
+        return 'utf-8'
+    detector = DetectorEncoding()
+    for a in range(0, len(codigos), bytes_bloque):
+        detector.agregar(codigos[a:a + bytes_bloque])
+    return detector.resultado()
+
+
+def detectar_encoding_archivo(ruta, bytes_bloque=BYTES_BLOQUE_BUSQUEDA):
+    """detectar_encoding leyendo el archivo por bloques de `bytes_bloque` (sin mapearlo ni cargarlo completo)."""
+    detector = DetectorEncoding()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(bytes_bloque), b''):
+            detector.agregar(bloque)
+    return detector.resultado()
+
+
+def _posiciones(codigos, valor, bloque=BYTES_BLOQUE_BUSQUEDA):
+    """np.flatnonzero(codigos == valor) por tramos, sin una máscara del tamaño del archivo."""
+    partes = [np.flatnonzero(codigos[a:a + bloque] == valor) + a for a in range(0, len(codigos), bloque)]
+    return np.concatenate(partes) if partes else np.empty(0, dtype=np.int64)
+
+
+def _tabla_codificacion(encoding):
+    """Tabla byte -> punto de código para codificaciones de un byte (latin-1, cp1252...)."""
+    tabla = bytes(range(256)).decode(encoding, errors='replace')
+    return np.array([ord(c) for c in tabla], dtype='<u4')
+
+
+def _es_multibyte(encoding):
+    return codecs.lookup(encoding).name.startswith('utf')
+
+
+class RegistrosFWF:
+    """Matriz (n_registros x ancho) de un archivo de ancho fijo ya partido en líneas.
+
+    `matriz` contiene bytes (uint8) para codificaciones de un byte o puntos de
+    código (uint32) cuando el archivo es UTF-8 con caracteres multibyte; en ambos
+    casos las posiciones de los cortes son las mismas que usa `pd.read_fwf`.
+    `longitudes` guarda el largo real de cada línea (sin CR/LF)."""
+
+    def __init__(self, matriz, longitudes, tabla=None, encoding=None):
+        self.matriz = matriz
+        self.longitudes = longitudes
+        self.tabla = tabla
+        self.encoding = encoding
+        self.identidad = tabla is not None and bool((tabla == np.arange(256)).all())
+
+    def __len__(self):
+        return self.matriz.shape[0]
+
+    @classmethod
+    def desde_fuente(cls, fuente, encoding='utf-8'):
+        """Lee y parte el contenido; con encoding='auto' lo detecta sobre los mismos bytes."""
+        buf = leer_bytes(fuente)
+        if encoding == 'auto':
+            encoding = detectar_encoding(buf)
+        codigos = np.frombuffer(buf, dtype=np.uint8)
+        tabla = None
+        if not _es_multibyte(encoding):
+            tabla = _tabla_codificacion(encoding)
+        elif len(codigos) == 0 or codigos.max() < 0x80:
+            # UTF-8 puro ASCII: byte == carácter, se evita decodificar
+            tabla = _tabla_codificacion('latin-1')
+        else:
+            texto = codecs.decode(buf, encoding)
+            if texto.startswith('\ufeff'):
+                texto = texto[1:]
+            codigos = np.frombuffer(texto.encode('utf-32-le'), dtype='<u4')
+        matriz, longitudes = cls._partir_lineas(codigos)
+        return cls(matriz, longitudes, tabla, encoding)
+
+    @staticmethod
+    def _partir_lineas(codigos, filas_bloque=8192):
+        """Parte el buffer en líneas y arma la matriz de registros.
+
+        Si todas las líneas tienen la misma longitud y separador (el caso normal
+        de un PRN del SNC) la matriz es una vista sin copia sobre el buffer."""
+        total = len(codigos)
+        if total == 0:
+            return np.empty((0, 0), dtype=codigos.dtype), np.empty(0, dtype=np.int64)
+        saltos = _posiciones(codigos, LF)
+        inicios = np.concatenate(([0], saltos + 1)).astype(np.int64)
+        fines = np.concatenate((saltos, [total])).astype(np.int64)
+        longitudes = fines - inicios
+        con_cr = (longitudes > 0) & (codigos[np.maximum(fines - 1, 0)] == CR)
+        longitudes -= con_cr
+        validas = longitudes > 0
+        inicios, longitudes = inicios[validas], longitudes[validas]
+
+        n = len(inicios)
+        if n == 0:
+            return np.empty((0, 0), dtype=codigos.dtype), longitudes
+        ancho = int(longitudes.max())
+        paso = int(inicios[1] - inicios[0]) if n > 1 else ancho
+        uniforme = (longitudes == ancho).all() and (n == 1 or (np.diff(inicios) == paso).all())
+        if uniforme:
+            matriz = np.lib.stride_tricks.as_strided(
+                codigos[inicios[0]:], shape=(n, ancho),
+                strides=(paso * codigos.itemsize, codigos.itemsize), writeable=False)
+        else:
+            # Registros de longitud irregular: se rellenan con espacios al ancho máximo
+            matriz = np.full((n, ancho), ESPACIO, dtype=codigos.dtype)
+            cols = np.arange(ancho)
+            for a in range(0, n, filas_bloque):
+                b = min(a + filas_bloque, n)
+                idx = inicios[a:b, None] + cols
+                dentro = cols < longitudes[a:b, None]
+                matriz[a:b][dentro] = codigos[idx[dentro]]
+
+        # Omitir líneas que solo tienen espacios (igual que read_fwf)
+        en_blanco = np.zeros(n, dtype=bool)
+        for a in range(0, n, filas_bloque):
+            sub = matriz[a:a + filas_bloque]
+            en_blanco[a:a + filas_bloque] = ((sub == ESPACIO) | (sub == TAB)).all(axis=1)
+        if en_blanco.any():
+            matriz, longitudes = matriz[~en_blanco], longitudes[~en_blanco]
+        return matriz, longitudes
+
+    def campo_en(self, inicio, fin, valores):
+        """Máscara de registros cuyo campo crudo [inicio:fin] es uno de `valores` (texto ASCII
+        del mismo ancho). Compara los bytes sin extraer ni decodificar la columna."""
+        bloque = self.matriz[:, inicio:fin]
+        mascara = np.zeros(len(self), dtype=bool)
+        for valor in valores:
+            codigos = np.frombuffer(valor.encode('ascii'), dtype=np.uint8).astype(bloque.dtype)
+            if len(codigos) == bloque.shape[1]:
+                mascara |= (bloque == codigos).all(axis=1)
+        return mascara
+
+    def campo_numerico(self, inicio, fin):
+        """Máscara de registros cuyo campo crudo [inicio:fin] son solo dígitos ASCII."""
+        bloque = self.matriz[:, inicio:fin]
+        return ((bloque >= ord('0')) & (bloque <= ord('9'))).all(axis=1) & (bloque.shape[1] == fin - inicio)
+
+    def columna(self, inicio, fin=None, filas=None, filas_bloque=FILAS_BLOQUE_COLUMNA):
+        """Extrae una columna como arreglo object de str (NaN donde está vacía), sin espacios.
+
+        Se convierte por tramos de `filas_bloque` registros para que los temporales
+        no crezcan con el archivo (solo la columna de salida ocupa memoria)."""
+        bloque = self.matriz[:, inicio:fin]
+        if filas is not None:
+            bloque = bloque[filas]
+        n = bloque.shape[0]
+        if n <= filas_bloque:
+            return self._convertir(bloque)
+        salida = np.empty(n, dtype=object)
+        for a in range(0, n, filas_bloque):
+            salida[a:a + filas_bloque] = self._convertir(bloque[a:a + filas_bloque])
+        return salida
+
+    def _convertir(self, bloque):
+        n, ancho = bloque.shape
+        if ancho == 0:
+            return np.full(n, np.nan, dtype=object)
+
+        blanco = (bloque == ESPACIO) | (bloque == TAB)
+        if blanco.all():
+            return np.full(n, np.nan, dtype=object)
+        if self.tabla is None or self.identidad:
+            cod = bloque.astype('<u4')
+        else:
+            cod = self.tabla[bloque]
+        if blanco[:, -1].any():
+            cola = np.logical_and.accumulate(blanco[:, ::-1], axis=1)[:, ::-1]
+            cod[cola] = 0
+        if blanco[:, 0].any():
+            desplazamiento = np.logical_and.accumulate(blanco, axis=1).sum(axis=1)
+            idx = np.arange(ancho) + desplazamiento[:, None]
+            cod = np.take_along_axis(cod, np.minimum(idx, ancho - 1), axis=1)
+            cod[idx >= ancho] = 0
+
+        textos = np.ascontiguousarray(cod).view(f'<U{ancho}').ravel()
+        salida = textos.astype(object)
+        # Valores nulos al estilo read_fwf ('', 'NA', 'NULL'...): solo se revisan los textos cortos
+        if ancho > _LARGO_MAX_NA:
+            candidatos = np.flatnonzero(cod[:, _LARGO_MAX_NA] == 0)
+        else:
+            candidatos = np.arange(n)
+        salida[candidatos[np.isin(textos[candidatos], _VALORES_NA)]] = np.nan
+        return salida
+
+    def dataframe(self, colspecs, columnas=None, filas=None):
+        """Arma el DataFrame (dtype object/str) con los mismos cortes que `pd.read_fwf`."""
+        datos = {i: self.columna(a, b, filas) for i, (a, b) in enumerate(colspecs)}
+        df = pd.DataFrame(datos)
+        if columnas is not None:
+            df.columns = list(columnas)[:len(df.columns)]
+        return df
+
+
+def leer_fwf(fuente, colspecs, encoding='utf-8', filtro=None):
+    """Reemplazo vectorizado de `pd.read_fwf(..., header=None, dtype=str)`.
+
+    Acepta bytes, ruta o stream y devuelve columnas numeradas 0..n-1, con los
+    valores ya sin espacios y NaN en los campos vacíos. El encoding usado (útil con
+    encoding='auto') queda en `df.attrs['encoding']`. `filtro(registros)` retorna la
+    máscara de registros a conservar y se evalúa sobre los bytes crudos, antes de
+    extraer las columnas: los descartados no se decodifican."""
+    registros = RegistrosFWF.desde_fuente(fuente, encoding=encoding)
+    filas = None if filtro is None else np.flatnonzero(filtro(registros))
+    df = registros.dataframe(colspecs, filas=filas)
+    df.attrs['encoding'] = registros.encoding
+    return df
+
+
+def _bloques_crudos(fuente, bytes_bloque):
+    """Genera bloques de bytes que terminan en un salto de línea completo."""
+    if isinstance(fuente, (bytes, bytearray, memoryview)):
+        fuente = io.BytesIO(fuente)
+    propio = isinstance(fuente, str)
+    stream = open(fuente, 'rb') if propio else fuente
+    try:
+        resto = b''
+        while True:
+            data = stream.read(bytes_bloque)
+            if isinstance(data, str):
+                data = data.encode('utf-8')
+            if not data:
+                break
+            data = resto + data
+            corte = data.rfind(b'\n')
+            if corte < 0:
+                resto = data
+                continue
+            resto = data[corte + 1:]
+            yield data[:corte + 1]
+        if resto:
+            yield resto
+    finally:
+        if propio:
+            stream.close()
+
+
+def registros_por_bloques(fuente, encoding='utf-8', bytes_bloque=32 * 1024 * 1024):
+    """Genera un `RegistrosFWF` por bloque; nunca tiene más de `bytes_bloque` del archivo en memoria.
+
+    Cada bloque se corta en un salto de línea, así ningún registro queda partido
+    (en UTF-8 el byte LF nunca forma parte de un carácter multibyte)."""
+    for data in _bloques_crudos(fuente, bytes_bloque):
+        registros = RegistrosFWF.desde_fuente(data, encoding=encoding)
+        if len(registros):
+            yield registros
+
+
+def leer_fwf_por_bloques(fuente, colspecs, encoding='utf-8', bytes_bloque=32 * 1024 * 1024):
+    """Versión por bloques de `leer_fwf` (un DataFrame por bloque)."""
+    for registros in registros_por_bloques(fuente, encoding=encoding, bytes_bloque=bytes_bloque):
+        yield registros.dataframe(colspecs)
@@ -0,0 +1,88 @@
+"""Llave entera para los NPN de 30 dígitos.
+
+Cada NPN se codifica como dos int64 de 15 dígitos (NPN_Alta, NPN_Baja): cruces,
+duplicados y ordenamientos comparan enteros en lugar de cadenas de 30 caracteres.
+El orden de (alta, baja) es el mismo orden lexicográfico del texto, así que un
+merge o sort sobre la llave entrega las filas en el mismo orden. El texto solo se
+reconstruye para la salida."""
+
+import numpy as np
+import pandas as pd
+
+LARGO_NPN = 30
+DIGITOS_MITAD = LARGO_NPN // 2
+COLUMNAS_LLAVE = ['NPN_Alta', 'NPN_Baja']
+
+_POTENCIAS = 10 ** np.arange(DIGITOS_MITAD - 1, -1, -1, dtype=np.int64)
+
+
+def codificar_npn(serie):
+    """
+    Retorna (alta, baja, validos). `validos` marca los valores de exactamente 30 dígitos
+    ASCII; en los demás la llave queda en -1.
+    """
+    serie = pd.Series(serie)
+    texto = serie if serie.dtype == object or isinstance(serie.dtype, pd.StringDtype) else serie.astype(str)
+    validos = texto.str.fullmatch(r'[0-9]{30}').fillna(False).to_numpy(dtype=bool)
+    alta = np.full(len(serie), -1, dtype=np.int64)
+    baja = np.full(len(serie), -1, dtype=np.int64)
+    if validos.any():
+        digitos = texto[validos].to_numpy(dtype=f'S{LARGO_NPN}').view(np.uint8).reshape(-1, LARGO_NPN) - ord('0')
+        alta[validos] = digitos[:, :DIGITOS_MITAD].astype(np.int64) @ _POTENCIAS
+        baja[validos] = digitos[:, DIGITOS_MITAD:].astype(np.int64) @ _POTENCIAS
+    return alta, baja, validos
+
+
+def decodificar_npn(alta, baja):
+    """Arreglo de NPN de 30 dígitos (texto) a partir de las dos mitades."""
+    alta = np.asarray(alta, dtype=np.int64)
+    baja = np.asarray(baja, dtype=np.int64)
+    digitos = np.empty((len(alta), LARGO_NPN), dtype=np.uint8)
+    digitos[:, :DIGITOS_MITAD] = (alta[:, None] // _POTENCIAS) % 10 + ord('0')
+    digitos[:, DIGITOS_MITAD:] = (baja[:, None] // _POTENCIAS) % 10 + ord('0')
+    return digitos.view(f'S{LARGO_NPN}').ravel().astype(str)
+
+
+def agregar_llave(df, columna):
+    """
+    Agrega NPN_Alta/NPN_Baja a `df` si todos los valores de `columna` son NPN válidos y
+    retorna las columnas por las que cruzar o deduplicar: la llave entera o, si algún
+    valor no es un NPN de 30 dígitos, la columna de texto.
+    """
+    alta, baja, validos = codificar_npn(df[columna])
+    if len(df) == 0 or not validos.all():
+        return [columna]
+    df[COLUMNAS_LLAVE[0]] = alta
+    df[COLUMNAS_LLAVE[1]] = baja
+    return list(COLUMNAS_LLAVE)
+
+
+def columnas_llave(df):
+    """Columnas de la llave entera presentes en `df` (lista vacía si no se agregó)."""
+    return list(COLUMNAS_LLAVE) if all(c in df.columns for c in COLUMNAS_LLAVE) else []
+
+
+def duplicados_npn(serie, keep='first'):
+    """Como serie.duplicated(keep), comparando la llave entera si todos los valores son NPN válidos."""
+    alta, baja, validos = codificar_npn(serie)
+    if len(serie) == 0 or not validos.all():
+        return serie.duplicated(keep=keep).to_numpy()
+    return pd.DataFrame({'alta': alta, 'baja': baja}).duplicated(keep=keep).to_numpy()
+
+
+def cruzar_por_npn(izq, der, columna, **kwargs):
+    """
+    pd.merge(izq, der, on=columna, **kwargs) usando la llave entera cuando ambos lados la
+    tienen. `columna` se completa desde la llave en las filas que solo vienen de `der`, y
+    las columnas de la llave no quedan en el resultado.
+    """
+    if not (columnas_llave(izq) and columnas_llave(der)):
+        return pd.merge(izq.drop(columns=COLUMNAS_LLAVE, errors='ignore'),
+                        der.drop(columns=COLUMNAS_LLAVE, errors='ignore'), on=columna, **kwargs)
+    res = pd.merge(izq, der.drop(columns=[columna]), on=COLUMNAS_LLAVE, **kwargs)
+    faltantes = res[columna].isna().to_numpy()
+    if faltantes.any():
+        npn = res[columna].astype(object).to_numpy()
+        npn[faltantes] = decodificar_npn(res[COLUMNAS_LLAVE[0]].to_numpy()[faltantes], res[COLUMNAS_LLAVE[1]].to_numpy()[faltantes])
+        res[columna] = pd.Series(npn, index=res.index).astype(izq[columna].dtype)
+    return res.drop(columns=COLUMNAS_LLAVE)
@@ -0,0 +1,90 @@
+"""Redondeo de avalúos idéntico a Excel: =REDONDEAR(base * (1 + pct/100); -3).
+
+En float, `floor(x / 1000 + 0.5) * 1000` se equivoca cuando el producto cae justo en
+la mitad de un millar (p. ej. 500000 * 1.045 da 522499.99999999994 y redondea a 522000). Aquí la base y
+el porcentaje se escalan a enteros (base = B / 10^m, 1 + pct/100 = F / D) y el
+redondeo ROUND_HALF_UP se hace con división entera sobre arreglos completos: el
+resultado es el mismo del Decimal fila por fila, sin el costo de crear un Decimal
+por predio."""
+
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+
+# Decimales que se prueban para escribir la base como entero (B / 10^m)
+MAX_DECIMALES_BASE = 6
+# Hasta aquí un float entero es exacto (2^53): por encima se usa Decimal
+MAX_BASE_EXACTA = 2 ** 53
+_MAX_INT64 = np.iinfo(np.int64).max
+
+
+def redondear_miles_decimal(valor_base, pct_incremento):
+    """Versión escalar con Decimal (la referencia del redondeo de Excel)."""
+    if valor_base is None or valor_base != valor_base or valor_base == 0:
+        return 0
+    incrementado = Decimal(str(valor_base)) * (Decimal("1") + Decimal(str(pct_incremento)) / Decimal("100"))
+    return int(incrementado.quantize(Decimal("1E3"), rounding=ROUND_HALF_UP))
+
+
+def _fraccion_factor(pct):
+    """
+    (numeradores, inversa, D): 1 + pct/100 = numeradores[inversa] / D, con el mismo D
+    para todos los porcentajes (se calcula con Decimal solo sobre los valores distintos).
+    """
+    unicos, inversa = np.unique(pct, return_inverse=True)
+    decimales = [Decimal(str(p)) for p in unicos.tolist()]
+    escala = 10 ** max([max(-d.as_tuple().exponent, 0) for d in decimales], default=0)
+    return [int(d * escala) + 100 * escala for d in decimales], inversa.reshape(pct.shape), 100 * escala
+
+
+def _escalar_base(base):
+    """(B, m, exactos): B / 10^m es el decimal más corto que reproduce cada float de `base`."""
+    enteros = np.zeros(base.shape, dtype=np.int64)
+    exponentes = np.zeros(base.shape, dtype=np.int64)
+    pendientes = np.isfinite(base) & (np.abs(base) < MAX_BASE_EXACTA)
+    for m in range(MAX_DECIMALES_BASE + 1):
+        escalado = base * 10.0 ** m
+        with np.errstate(invalid='ignore'):
+            candidato = np.rint(escalado)
+            exacto = pendientes & (np.abs(candidato) < MAX_BASE_EXACTA) & (candidato / 10.0 ** m == base)
+        enteros[exacto] = candidato[exacto].astype(np.int64)
+        exponentes[exacto] = m
+        pendientes &= ~exacto
+        if not pendientes.any():
+            break
+    return enteros, exponentes, ~pendientes & np.isfinite(base) & (np.abs(base) < MAX_BASE_EXACTA)
+
+
+def redondear_miles(base, pct):
+    """
+    ROUND_HALF_UP a miles de base * (1 + pct/100), vectorizado y exacto (igual a
+    redondear_miles_decimal). `base` y `pct` se difunden como en numpy (p. ej. una
+    columna de bases contra una matriz de escenarios). Base 0 o NaN da 0; un porcentaje
+    no finito es ValueError. Retorna int64.
+    """
+    base = np.asarray(base, dtype=np.float64)
+    pct = np.asarray(pct, dtype=np.float64)
+    if not np.isfinite(pct).all():
+        raise ValueError("porcentaje de incremento no finito")
+    base, pct = np.broadcast_arrays(base, pct)
+    resultado = np.zeros(base.shape, dtype=np.int64)
+    if base.size == 0:
+        return resultado
+
+    enteros, exponentes, exactos = _escalar_base(base)
+    numeradores, inversa, denominador = _fraccion_factor(pct)
+    # base * factor / 1000 = B * F / (10^m * D * 1000); en int64 si 2 * |B * F| + divisor no se desborda
+    max_divisor = 10 ** int(exponentes.max()) * denominador * 1000
+    maximo = 2 * int(np.abs(enteros).max()) * max(abs(f) for f in numeradores) + max_divisor
+    tipo = np.int64 if maximo < _MAX_INT64 else object
+    producto = enteros.astype(tipo) * np.array(numeradores, dtype=tipo)[inversa]
+    divisor = (10 ** exponentes).astype(tipo) * (denominador * 1000)
+    # ROUND_HALF_UP: la mitad se redondea alejándose de cero
+    redondeado = (2 * np.abs(producto) + divisor) // (2 * divisor)
+    miles = np.where(producto < 0, -redondeado, redondeado)
+    resultado[exactos] = (miles[exactos] * 1000).astype(np.int64)
+
+    # Valores fuera del rango exacto (muy grandes o con muchos decimales): Decimal fila por fila
+    for i in zip(*np.nonzero(~exactos & np.isfinite(base))):
+        resultado[i] = redondear_miles_decimal(float(base[i]), float(pct[i]))
+    return resultado
@@ -5,6 +5,8 @@ import os
 import zipfile
 import tempfile
 from datetime import datetime, timezone, timedelta
+from modules.llave_npn import codificar_npn, COLUMNAS_LLAVE
+from modules.tipos_compactos import compactar_dataframe
 
 # =============================================================================
 # CLASE PRINCIPAL: AUDITORÍA SNC (VERSIÓN 3.1 - PRODUCTION READY)
@@ -98,6 +100,15 @@ class AuditoriaSNC:
             # if self.col_estado in self.df.columns:
             #     self.df = self.df[self.df[self.col_estado].astype(str).str.upper().str.contains('ACTIVO', na=False)].copy()
             
+            # Tipado compacto solo en las columnas que usa la auditoría: NPN como texto Arrow y
+            # ESTADO como categórica (las demás columnas del Excel quedan como vienen)
+            compactar_dataframe(self.df, categoricas=[self.col_estado], textos=[self.col_ant, self.col_new])
+
+            # Llave entera del NPN nuevo, calculada una sola vez (-1 si no son 30 dígitos exactos)
+            alta, baja, _ = codificar_npn(self.df[self.col_new])
+            self.df[COLUMNAS_LLAVE[0]] = alta
+            self.df[COLUMNAS_LLAVE[1]] = baja
+
             self.stats['total_filas'] = len(self.df)
             return True
         except Exception as e:
@@ -168,7 +179,14 @@ class AuditoriaSNC:
     def validar_unicidad_absoluta(self):
         if self.df_clean.empty: return
         # Busca si el mismo NPN de salida se generó para más de un predio
-        duplicados = self.df_clean[self.df_clean.duplicated(subset=[self.col_new], keep=False)]
+        # Comparación sobre la llave entera de cargar_datos; si algún NPN trae espacios (llave -1)
+        # se compara el texto, como antes
+        llave = self.df_clean[COLUMNAS_LLAVE]
+        if (llave[COLUMNAS_LLAVE[0]] >= 0).all():
+            repetidos = llave.duplicated(keep=False)
+        else:
+            repetidos = self.df_clean[self.col_new].duplicated(keep=False)
+        duplicados = self.df_clean[repetidos]
         
         if not duplicados.empty:
             # Agrupar para reporte limpio
@@ -210,7 +228,7 @@ class AuditoriaSNC:
             if row['MZ_A'] != row['MZ_N']: return 'NUEVA_MANZANA'
             return 'NUEVO_TERRENO'
 
-        self.df_clean['ESCENARIO'] = self.df_clean.apply(determinar_escenario, axis=1)
+        self.df_clean['ESCENARIO'] = self.df_clean.apply(determinar_escenario, axis=1).astype('category')
 
         # Cargar diccionarios con los máximos de los predios que NO cambiaron (La base histórica)
         hist = self.df_clean[self.df_clean['ESCENARIO'] == 'PERMANENCIA']
@@ -240,7 +258,8 @@ class AuditoriaSNC:
         
         if df_proc.empty: return
 
-        # Ordenamos por la jerarquía anterior para procesar en orden de "llegada"
+        # Ordenamos por la jerarquía anterior para procesar en orden de "llegada" (texto: el NPN
+        # anterior puede ser temporal alfanumérico, así que aquí no aplica la llave entera)
         sort_cols = ['M_A', 'Z_A', 'S_A', 'MZ_A']
         for c in sort_cols:
              df_proc[c] = df_proc[c].astype(str).replace('nan', 'UNK')
@@ -1,63 +1,105 @@
 import pandas as pd
+import numpy as np
 import io
+import json
 import os
+import tempfile
+import time
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from modules.lector_fwf import RegistrosFWF, registros_por_bloques
+from modules.layouts_snc import obtener_layout, generar_colspecs, PALABRAS_NUMERICAS
+from modules.tipos_compactos import compactar_dataframe
 
-def generar_colspecs(cortes):
-    colspecs = []
-    for i in range(len(cortes) - 1):
-        colspecs.append((cortes[i], cortes[i+1]))
-    colspecs.append((cortes[-1], None))
-    return colspecs
-
-def procesar_dataframe(file_stream, opcion, filename_original):
-    config = {}
-
-    # --- 1. CONFIGURACIÓN DE COLUMNAS Y CORTES ---
-    if opcion == '1':
-        config['columnas'] = ["Departamento", "Municipio", "NoPredial", "TipoRegistro", "NoOrden", "TotalRegistro", "Nombre", "EstadoCivil", "TipoDocumento", "NoDocumento", "Direccion", "Comuna", "DestinoEconomico", "AreaTerreno (m2)", "AreaConstruida (m2)", "Avaluo ($)", "Vigencia", "NoPredialAnterior", "Espacio_Final"]
-        config['cortes'] = [0, 2, 5, 30, 31, 34, 37, 137, 138, 139, 151, 251, 252, 253, 268, 274, 289, 297, 312]
-        config['filtro_tipo'] = None
-    elif opcion == '2':
-        config['columnas'] = ["Departamento", "Municipio", "NoPredial", "TipoRegistro", "NoOrden", "TotalRegistro", "MatriculaInmobiliaria", "Espacio1", "ZonaFisica_1", "ZonaEconomica_1", "AreaTerreno_1 (m2)", "Espacio2", "ZonaFisica_2", "ZonaEconomica_2", "AreaTerreno_2 (m2)", "Espacio3", "Habitaciones_1", "Baños_1", "Locales_1", "Pisos_1", "Estrato_1", "Uso_1", "Puntaje_1", "AreaConstruida_1 (m2)", "Espacio4", "Habitaciones_2", "Baños_2", "Locales_2", "Pisos_2", "Estrato_2", "Uso_2", "Puntaje_2", "AreaConstruida_2 (m2)", "Espacio5", "Habitaciones_3", "Baños_3", "Locales_3", "Pisos_3", "Estrato_3", "Uso_3", "Puntaje_3", "AreaConstruida_3 (m2)", "Espacio6", "Vigencia", "NoPredialAnterior", "FinLinea"]
-        config['cortes'] = [0, 2, 5, 30, 31, 34, 37, 55, 77, 80, 83, 98, 120, 123, 126, 141, 163, 165, 167, 169, 171, 172, 175, 177, 183, 205, 207, 209, 211, 213, 214, 217, 219, 225, 247, 249, 251, 253, 255, 256, 259, 261, 267, 289, 297, 312]
-        config['filtro_tipo'] = None
-    elif opcion == '3': # Reso Tipo 1
-        config['columnas'] = ["Departamento", "Municipio", "NoResolucion", "NoRadicacion", "TipoTramite", "ClaseMutacion", "NoPredio", "Cancela/Inscribe", "TipoRegistro", "NoDocumento_A", "NoOrden", "TotalRegistros", "Nombre", "EstadoCivil", "TipoDocumento", "NoDocumento_B", "Direccion", "Comuna", "DestinoEconomico", "AreaTerreno (m2)", "AreaConstruida (m2)", "Avaluo ($ miles)", "Vigencia", "NoPredialAnterior", "Espacio"]
-        config['cortes'] = [0, 2, 5, 18, 33, 35, 36, 61, 62, 63, 66, 69, 169, 170, 171, 183, 283, 284, 285, 300, 306, 321, 329, 344, 410]
-        config['filtro_tipo'] = 1
-    elif opcion == '4': # Reso Tipo 2
-        config['columnas'] = ["Departamento", "Municipio", "NoResolucion", "NoRadicacion", "TipoTramite", "ClaseMutacion", "NoPredio", "Cancela/Inscribe", "TipoRegistro", "NoDocumento", "NoOrden", "TotalRegistros", "MatriculaInmobiliaria", "Espacio1", "ZonaFisica_1", "ZonaEconomica_1", "AreaTerreno_1", "Espacio2", "ZonaFisica_2", "ZonaEconomica_2", "AreaTerreno_2", "Espacio3", "Habitaciones_1", "Baños_1", "Locales_1", "Pisos_1", "Tipificacion_1", "Uso_1", "Puntaje_1", "AreaConstruida_1", "Espacio4", "Habitaciones_2", "Baños_2", "Locales_2", "Pisos_2", "Tipificacion_2", "Uso_2", "Puntaje_2", "AreaConstruida_2", "Espacio5", "Habitaciones_3", "Baños_3", "Locales_3", "Pisos_3", "Tipificacion_3", "Uso_3", "Puntaje_3", "AreaConstruida_3", "Espacio6", "NoPredialAnterior"]
-        config['cortes'] = [0, 2, 5, 18, 33, 35, 36, 61, 62, 63, 66, 69, 87, 120, 123, 126, 141, 174, 177, 180, 195, 228, 230, 232, 234, 236, 238, 241, 243, 249, 282, 284, 286, 288, 290, 292, 295, 297, 303, 336, 338, 340, 342, 344, 346, 349, 351, 357, 395, 410]
-        config['filtro_tipo'] = 2
-    elif opcion == '5': # Reso Tipo 3
-        config['columnas'] = ["Departamento", "Municipio", "NoResolucion", "NoRadicacion", "TipoTramite", "ClaseMutacion", "NoPredio", "Cancela/Inscribe", "TipoRegistro", "NoDocumento", "NoOrden", "TotalRegistros", "Decretos", "Motivacion", "NoPredialAnterior"]
-        config['cortes'] = [0, 2, 5, 18, 33, 35, 36, 61, 62, 63, 66, 69, 139, 395, 410]
-        config['filtro_tipo'] = 3
-    else:
-        raise ValueError("Opción no válida")
+# Formatos de salida del convertidor: extensión y mimetype
+FORMATOS_SALIDA = {
+    'xlsx': ('.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+    'csv.gz': ('.csv.gz', 'application/gzip'),
+    'feather': ('.feather', 'application/vnd.apache.arrow.file'),
+}
+
+# Opción de resolución completa: una sola lectura repartida en T1, T2 y T3
+OPCION_RESOLUCIONES = '6'
+LAYOUTS_RESOLUCION = ['T1', 'T2', 'T3']
+
+# Opción de predios: R1 + R2 unidos en una fila por predio (requiere los dos archivos)
+OPCION_PREDIOS = '7'
+
+def convertir_numericos(df, columnas=None):
+    """Convierte a número las columnas dadas (por defecto, las que el nombre indica numéricas)."""
+    if columnas is None:
+        columnas = [c for c in df.columns if any(x in c for x in PALABRAS_NUMERICAS)]
+    for col in columnas:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df
+
+def layouts_opcion(opcion):
+    """Layouts que produce una opción: uno solo, o T1/T2/T3 para la resolución completa."""
+    if str(opcion) == OPCION_RESOLUCIONES:
+        return [obtener_layout(nombre) for nombre in LAYOUTS_RESOLUCION]
+    return [obtener_layout(opcion)]
+
+def procesar_dataframe(file_stream, opcion, filename_original, formato='xlsx', integridad=False):
+    """Convierte el archivo plano; con `integridad=True` agrega el reporte de integridad
+    (hoja INTEGRIDAD en Excel, o JSON dentro del ZIP en formatos columnares)."""
+    if formato not in FORMATOS_SALIDA:
+        raise ValueError(f"Formato de salida no válido: {formato}")
+
+    # Leer como texto (str) y con encoding latin-1 para tildes/ñ (lector vectorizado)
+    registros = RegistrosFWF.desde_fuente(file_stream, encoding='latin-1')
+    hojas = convertir_registros(registros, opcion)
+    reporte = calcular_integridad(registros, hojas, opcion) if integridad else None
+    return exportar_hojas(hojas, formato, filename_original, integridad=reporte)
+
+def convertir_registros(registros, opcion):
+    """Arma un DataFrame ordenado y tipado por cada layout de la opción."""
+    # --- 1. ESTRUCTURA DEL ARCHIVO (registro de layouts) ---
+    layouts = layouts_opcion(opcion)
 
     # --- 2. LECTURA Y PROCESAMIENTO ---
-    colspecs = generar_colspecs(config['cortes'])
-    
-    # Leer como texto (str) y con encoding latin-1 para tildes/ñ
-    df = pd.read_fwf(file_stream, colspecs=colspecs, header=None, encoding='latin-1', dtype=str)
-    
-    # Asignar columnas de forma segura
-    if len(df.columns) == len(config['columnas']):
-        df.columns = config['columnas']
-    else:
-        df.columns = config['columnas'][:len(df.columns)]
+    # El archivo se lee una sola vez y cada layout toma sus filas por TipoRegistro
+    # sobre los bytes, antes de cortar columnas
+    hojas = {}
+    for layout in layouts:
+        df = layout.dataframe(registros)
 
-    # Filtros por Tipo de Registro (para resoluciones)
-    if config['filtro_tipo'] is not None and "TipoRegistro" in df.columns:
-        df["TipoRegistro_Num"] = pd.to_numeric(df["TipoRegistro"], errors='coerce')
-        df = df[df["TipoRegistro_Num"] == config['filtro_tipo']]
-        df = df.drop(columns=["TipoRegistro_Num"])
+        # --- 3. ORDENAMIENTO ---
+        df = ordenar_registros(df)
 
-    # Limpieza de espacios en blanco
-    df = df.apply(lambda x: x.str.strip() if x.dtype == "object" else x)
+        # --- 4. CONVERSIÓN NUMÉRICA Y TIPADO COMPACTO ---
+        df = convertir_numericos(df, layout.numericas)
+        hojas[layout.nombre] = compactar_dataframe(df, layout.categoricas, layout.textos, layout.numericas)
+    return hojas
 
-    # --- 3. ORDENAMIENTO ---
+def exportar_hojas(hojas, formato, filename_original, integridad=None):
+    """Exporta las hojas convertidas y retorna (BytesIO, nombre del archivo de salida)."""
+    # --- 5. EXPORTACIÓN (EXCEL O FORMATO COLUMNAR) ---
+    base_name = os.path.splitext(filename_original)[0]
+    extension = FORMATOS_SALIDA[formato][0]
+    if formato == 'xlsx':
+        # Un solo libro: 'Datos' para un layout, o una hoja por tipo de registro
+        if len(hojas) == 1:
+            hojas = {'Datos': next(iter(hojas.values()))}
+        if integridad is not None:
+            hojas = {**hojas, 'INTEGRIDAD': tabla_integridad(integridad)}
+        return _exportar_excel(hojas), f"{base_name}{extension}"
+    if len(hojas) == 1 and integridad is None:
+        return exportar_dataframe(next(iter(hojas.values())), formato), f"{base_name}{extension}"
+    # Formatos columnares: un archivo por tipo de registro (y el reporte JSON) dentro de un ZIP
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_STORED) as zf:
+        for nombre, df in hojas.items():
+            archivo = f"{base_name}{extension}" if len(hojas) == 1 else f"{base_name}_{nombre}{extension}"
+            zf.writestr(archivo, exportar_dataframe(df, formato).getvalue())
+        if integridad is not None:
+            zf.writestr(f"{base_name}_INTEGRIDAD.json", json.dumps(integridad, ensure_ascii=False, indent=2))
+    output.seek(0)
+    return output, f"{base_name}_resoluciones.zip" if len(hojas) > 1 else f"{base_name}.zip"
+
+def ordenar_registros(df):
     if 'NoOrden' in df.columns:
         df['NoOrden_Num'] = pd.to_numeric(df['NoOrden'], errors='coerce').fillna(0)
     
@@ -70,34 +112,436 @@ def procesar_dataframe(file_stream, opcion, filename_original):
     if final_keys:
         df = df.sort_values(by=final_keys, ascending=True)
     if 'NoOrden_Num' in df.columns: df = df.drop(columns=['NoOrden_Num'])
+    return df
+
+# =============================================================================
+# INTEGRIDAD DEL ARCHIVO (misma lectura de la conversión)
+# =============================================================================
+
+MAX_EJEMPLOS_INTEGRIDAD = 20
+
+def _llave_predio(df):
+    """Columnas que identifican el predio: NPN en R1/R2, resolución + predio en T1/T2/T3."""
+    if 'NoPredial' in df.columns:
+        return ['Departamento', 'Municipio', 'NoPredial']
+    return ['Departamento', 'Municipio', 'NoResolucion', 'NoPredio', 'Cancela/Inscribe']
 
-    # --- 4. CONVERSIÓN NUMÉRICA ---
-    cols_valores = [c for c in df.columns if any(x in c for x in ['Area', 'Avaluo', 'Valor', 'Puntaje', 'Habitaciones', 'Baños', 'Locales', 'NoOrden', 'TotalRegistro'])]
-    for col in cols_valores:
-        df[col] = pd.to_numeric(df[col], errors='coerce')
+def _texto_llave(llave, valores):
+    separador = '' if 'NoPredial' in llave else ' / '
+    return separador.join(str(v) for v in valores)
 
-    # --- 5. EXPORTACIÓN A EXCEL (SIN ESTILOS) ---
+def _integridad_layout(df):
+    """Consistencia NoOrden/TotalRegistro por predio y NPN repetidos (mismo predio y NoOrden)."""
+    llave = _llave_predio(df)
+    total = 'TotalRegistro' if 'TotalRegistro' in df.columns else 'TotalRegistros'
+    if df.empty:
+        return {'filas': 0, 'predios': 0, 'predios_inconsistentes': 0, 'ejemplos_inconsistentes': [],
+                'duplicados': 0, 'ejemplos_duplicados': []}
+
+    grupos = df.groupby(llave, sort=False, dropna=False, observed=True).agg(
+        registros=('NoOrden', 'size'), orden_min=('NoOrden', 'min'), orden_max=('NoOrden', 'max'),
+        ordenes=('NoOrden', 'nunique'), declarado=(total, 'max'), declarado_min=(total, 'min'))
+    # Un predio está completo si tiene TotalRegistro filas con NoOrden 1..TotalRegistro sin repetir
+    inconsistentes = grupos[(grupos['registros'] != grupos['declarado'])
+                            | (grupos['declarado_min'] != grupos['declarado'])
+                            | (grupos['ordenes'] != grupos['registros'])
+                            | (grupos['orden_min'] != 1)
+                            | (grupos['orden_max'] != grupos['declarado'])]
+    duplicados = df[df.duplicated(llave + ['NoOrden'], keep='first')]
+
+    def numero(v):
+        return None if pd.isna(v) else int(v)
+
+    return {
+        'filas': int(len(df)),
+        'predios': int(len(grupos)),
+        'predios_inconsistentes': int(len(inconsistentes)),
+        'ejemplos_inconsistentes': [
+            {'predio': _texto_llave(llave, f.Index), 'registros': int(f.registros),
+             'total_declarado': numero(f.declarado), 'no_orden_min': numero(f.orden_min), 'no_orden_max': numero(f.orden_max)}
+            for f in inconsistentes.head(MAX_EJEMPLOS_INTEGRIDAD).itertuples()],
+        'duplicados': int(len(duplicados)),
+        'ejemplos_duplicados': [
+            {'predio': _texto_llave(llave, valores[:-1]), 'no_orden': numero(valores[-1])}
+            for valores in duplicados[llave + ['NoOrden']].head(MAX_EJEMPLOS_INTEGRIDAD).itertuples(index=False)],
+    }
+
+def calcular_integridad(registros, hojas, opcion):
+    """
+    Estadísticas de integridad sobre los registros ya leídos y las hojas ya convertidas
+    (no vuelve a cargar el archivo): anomalías de longitud, conteo por TipoRegistro,
+    consistencia NoOrden/TotalRegistro por predio y NPN duplicados. Retorna un dict
+    serializable a JSON.
+    """
+    layouts = layouts_opcion(opcion)
+    longitud = layouts[0].longitud
+    anomalas = np.flatnonzero(registros.longitudes != longitud)
+
+    # Conteo de TipoRegistro sobre el byte crudo de su posición
+    por_tipo = {}
+    inicio = layouts[0].posicion['TipoRegistro'][0]
+    if len(registros) and registros.matriz.shape[1] > inicio:
+        codigos, cuentas = np.unique(registros.matriz[:, inicio], return_counts=True)
+        por_tipo = {(chr(c).strip() or '(vacío)'): int(n) for c, n in zip(codigos, cuentas)}
+
+    return {
+        'registros': int(len(registros)),
+        'longitud_esperada': int(longitud),
+        'anomalias_longitud': int(len(anomalas)),
+        'ejemplos_longitud': [{'registro': int(i) + 1, 'longitud': int(registros.longitudes[i])}
+                              for i in anomalas[:MAX_EJEMPLOS_INTEGRIDAD]],
+        'por_tipo_registro': por_tipo,
+        'layouts': {nombre: _integridad_layout(df) for nombre, df in hojas.items()},
+    }
+
+def tabla_integridad(integridad):
+    """Aplana el reporte de integridad en filas Sección / Indicador / Valor para Excel."""
+    filas = [('ARCHIVO', 'Registros', integridad['registros']),
+             ('ARCHIVO', 'Longitud esperada', integridad['longitud_esperada']),
+             ('ARCHIVO', 'Anomalías de longitud', integridad['anomalias_longitud'])]
+    filas += [('TIPO REGISTRO', tipo, n) for tipo, n in integridad['por_tipo_registro'].items()]
+    for nombre, datos in integridad['layouts'].items():
+        filas += [(nombre, 'Filas', datos['filas']),
+                  (nombre, 'Predios', datos['predios']),
+                  (nombre, 'Predios inconsistentes (NoOrden/TotalRegistro)', datos['predios_inconsistentes']),
+                  (nombre, 'Duplicados (predio + NoOrden)', datos['duplicados'])]
+    filas += [('EJEMPLOS LONGITUD', f"Registro {e['registro']}", e['longitud']) for e in integridad['ejemplos_longitud']]
+    for nombre, datos in integridad['layouts'].items():
+        filas += [(f"{nombre} - INCONSISTENTES", e['predio'],
+                   f"{e['registros']} registros, total declarado {e['total_declarado']}, NoOrden {e['no_orden_min']}-{e['no_orden_max']}")
+                  for e in datos['ejemplos_inconsistentes']]
+        filas += [(f"{nombre} - DUPLICADOS", e['predio'], f"NoOrden {e['no_orden']}") for e in datos['ejemplos_duplicados']]
+    return pd.DataFrame(filas, columns=['Seccion', 'Indicador', 'Valor'])
+
+def exportar_dataframe(df, formato='xlsx'):
+    """Serializa el DataFrame en el formato pedido y retorna un BytesIO listo para enviar."""
+    if formato == 'xlsx':
+        return _exportar_excel({'Datos': df})
+    df = df.reset_index(drop=True)
+    output = io.BytesIO()
+    if formato == 'parquet':
+        df.to_parquet(output, index=False)
+    elif formato == 'feather':
+        df.to_feather(output)
+    elif formato == 'csv.gz':
+        df.to_csv(output, index=False, compression={'method': 'gzip'}, encoding='utf-8')
+    else:
+        raise ValueError(f"Formato de salida no válido: {formato}")
+    output.seek(0)
+    return output
+
+def _exportar_excel(hojas):
+    # EXPORTACIÓN A EXCEL (SIN ESTILOS)
     output = io.BytesIO()
     with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        df.to_excel(writer, index=False, sheet_name='Datos', startrow=1, header=False)
         workbook = writer.book
-        worksheet = writer.sheets['Datos']
         plain_format = workbook.add_format({'bold': False, 'border': 0, 'align': 'left'})
-        
-        # Escribir encabezados manualmente
-        for col_num, value in enumerate(df.columns.values):
-            worksheet.write(0, col_num, value, plain_format)
-            
-        # Ajustar ancho columnas
-        for i, col in enumerate(df.columns):
-            max_len = max(df[col].astype(str).map(len).max(), len(str(col))) + 2
-            if max_len > 50: max_len = 50
-            worksheet.set_column(i, i, max_len)
+        for sheet_name, df in hojas.items():
+            df.to_excel(writer, index=False, sheet_name=sheet_name, startrow=1, header=False)
+            worksheet = writer.sheets[sheet_name]
+
+            # Escribir encabezados manualmente
+            for col_num, value in enumerate(df.columns.values):
+                worksheet.write(0, col_num, value, plain_format)
+
+            # Ajustar ancho columnas
+            for i, col in enumerate(df.columns):
+                max_len = max(df[col].astype(str).map(len).max(), len(str(col))) + 2
+                if pd.isna(max_len): max_len = len(str(col)) + 2
+                if max_len > 50: max_len = 50
+                worksheet.set_column(i, i, max_len)
             
     output.seek(0)
-    
-    # Nombre archivo de salida
+    return output
+
+
+# =============================================================================
+# MODO PREDIOS (R1 + R2 UNIDOS POR LLAVE DE 30 DÍGITOS)
+# =============================================================================
+COLS_PREDIO_R1 = ['Departamento', 'Municipio', 'NoPredial', 'Direccion', 'Comuna', 'DestinoEconomico',
+                  'AreaTerreno (m2)', 'AreaConstruida (m2)', 'Avaluo ($)', 'Vigencia', 'NoPredialAnterior']
+COLS_PREDIO_R2 = ['NoOrden', 'MatriculaInmobiliaria', 'ZonaFisica_1', 'ZonaEconomica_1', 'Estrato_1',
+                  'AreaTerreno_1 (m2)', 'AreaTerreno_2 (m2)', 'AreaConstruida_1 (m2)', 'AreaConstruida_2 (m2)',
+                  'AreaConstruida_3 (m2)', 'Pisos_1', 'Pisos_2', 'Pisos_3']
+
+def _con_llave(layout, registros, seleccion):
+    """Columnas `seleccion` del layout con Predial_Nacional (Departamento+Municipio+NoPredial) en un
+    solo corte, ordenado por llave y NoOrden (los extractos ya vienen ordenados: normalmente no se reordena)."""
+    df = layout.dataframe(registros, seleccion=seleccion)
+    df = convertir_numericos(df, [c for c in layout.numericas if c in seleccion])
+    inicio, fin = layout.posicion['Departamento'][0], layout.posicion['NoPredial'][1]
+    df.insert(0, 'Predial_Nacional', registros.columna(inicio, fin))
+    df = df[df['Predial_Nacional'].notna()]
+    if not df['Predial_Nacional'].is_monotonic_increasing:
+        df = df.sort_values(['Predial_Nacional', 'NoOrden'], kind='stable')
+    return df
+
+def _predios_r1(registros):
+    """Una fila por predio del R1: datos del predio más propietarios agregados."""
+    df = _con_llave(obtener_layout('R1'), registros, COLS_PREDIO_R1 + ['NoOrden', 'Nombre', 'TipoDocumento', 'NoDocumento'])
+    predio = df.groupby('Predial_Nacional', sort=True)[COLS_PREDIO_R1].first()
+
+    # Con las filas ordenadas por llave cada predio es un tramo contiguo: los nombres
+    # se unen por tramos en lugar de un groupby con función Python por grupo
+    llave = df['Predial_Nacional'].to_numpy()
+    inicios = np.flatnonzero(np.r_[True, llave[1:] != llave[:-1]])
+    fines = np.r_[inicios[1:], len(llave)]
+    propietario = (df['Nombre'].fillna('') + ' (' + df['TipoDocumento'].fillna('') + ' '
+                   + df['NoDocumento'].fillna('') + ')').to_numpy()
+    predio['NumPropietarios'] = fines - inicios
+    predio['Propietarios'] = [' | '.join(propietario[a:b]) for a, b in zip(inicios, fines)]
+    return predio
+
+def _predios_r2(registros):
+    """Una fila por predio del R2: matrícula, zonas y totales de terreno y construcción."""
+    df = _con_llave(obtener_layout('R2'), registros, COLS_PREDIO_R2)
+    areas_c = df[['AreaConstruida_1 (m2)', 'AreaConstruida_2 (m2)', 'AreaConstruida_3 (m2)']]
+    df['_terreno'] = df[['AreaTerreno_1 (m2)', 'AreaTerreno_2 (m2)']].sum(axis=1)
+    df['_construida'] = areas_c.sum(axis=1)
+    df['_construcciones'] = (areas_c.fillna(0) > 0).sum(axis=1)
+    df['_pisos'] = df[['Pisos_1', 'Pisos_2', 'Pisos_3']].apply(pd.to_numeric, errors='coerce').max(axis=1)
+    return df.groupby('Predial_Nacional', sort=True).agg(**{
+        'MatriculaInmobiliaria': ('MatriculaInmobiliaria', 'first'),
+        'ZonaFisica': ('ZonaFisica_1', 'first'),
+        'ZonaEconomica': ('ZonaEconomica_1', 'first'),
+        'Estrato': ('Estrato_1', 'first'),
+        'AreaTerreno_R2 (m2)': ('_terreno', 'sum'),
+        'AreaConstruida_R2 (m2)': ('_construida', 'sum'),
+        'Construcciones': ('_construcciones', 'sum'),
+        'PisosMax': ('_pisos', 'max'),
+        'RegistrosR2': ('Predial_Nacional', 'size'),
+    })
+
+def procesar_predios(fuente_r1, fuente_r2, filename_original, formato='parquet'):
+    """
+    Une R1 (propietarios) y R2 (físico) en un solo archivo con una fila por predio.
+    Cada archivo se agrupa por la llave de 30 dígitos (índice ordenado y único) y
+    luego se unen con un join ordenado; la columna Fuente indica AMBOS, SOLO_R1 o SOLO_R2.
+    """
+    if formato not in FORMATOS_SALIDA:
+        raise ValueError(f"Formato de salida no válido: {formato}")
+    r1 = _predios_r1(RegistrosFWF.desde_fuente(fuente_r1, encoding='latin-1'))
+    r2 = _predios_r2(RegistrosFWF.desde_fuente(fuente_r2, encoding='latin-1'))
+
+    df = r1.join(r2, how='outer')
+    df['Fuente'] = np.select([df['NumPropietarios'].isna(), df['RegistrosR2'].isna()], ['SOLO_R2', 'SOLO_R1'], default='AMBOS')
+    for col in ['NumPropietarios', 'RegistrosR2', 'Construcciones']:
+        df[col] = df[col].fillna(0).astype(int)
+    df = df.reset_index()
+
+    output = exportar_dataframe(df, formato)
     base_name = os.path.splitext(filename_original)[0]
-    new_filename = f"{base_name}.xlsx"
-    
-    return output, new_filename
\ No newline at end of file
+    return output, f"{base_name}_PREDIOS{FORMATOS_SALIDA[formato][0]}"
+
+
+# =============================================================================
+# MODO STREAMING (ARCHIVOS GRANDES)
+# =============================================================================
+FILAS_MAX_EXCEL = 1048576
+FILAS_MUESTRA_ANCHOS = 2000
+
+def _anchos_columnas(muestra, columnas):
+    """Ancho de cada columna calculado sobre una muestra (no sobre todo el archivo)."""
+    anchos = []
+    for col in columnas:
+        max_len = len(str(col))
+        if col in muestra.columns and not muestra.empty:
+            max_len = max(max_len, int(muestra[col].astype(str).map(len).max()))
+        anchos.append(min(max_len + 2, 50))
+    return anchos
+
+class HojaStreaming:
+    """Hoja escrita fila a fila en modo `constant_memory`; al llegar al límite de filas
+    de Excel continúa en `<nombre>_2`, `<nombre>_3`..."""
+
+    def __init__(self, workbook, nombre, columnas, formato):
+        self.workbook = workbook
+        self.nombre = nombre
+        self.columnas = columnas
+        self.formato = formato
+        self.anchos = None
+        self.n_hoja = 0
+        self.total = 0
+        self._nueva_hoja()
+
+    def _nueva_hoja(self):
+        self.n_hoja += 1
+        self.worksheet = self.workbook.add_worksheet(self.nombre if self.n_hoja == 1 else f'{self.nombre}_{self.n_hoja}')
+        self._ajustar_anchos()
+        self.worksheet.write_row(0, 0, self.columnas, self.formato)
+        self.fila = 1
+
+    def _ajustar_anchos(self):
+        for i, ancho in enumerate(self.anchos or []):
+            self.worksheet.set_column(i, i, ancho)
+
+    def escribir(self, df):
+        if self.anchos is None:
+            self.anchos = _anchos_columnas(df.head(FILAS_MUESTRA_ANCHOS), self.columnas)
+            self._ajustar_anchos()
+        valores = df.astype(object).where(df.notna(), None).to_numpy()
+        for registro in valores:
+            if self.fila >= FILAS_MAX_EXCEL:
+                self._nueva_hoja()
+            self.worksheet.write_row(self.fila, 0, registro)
+            self.fila += 1
+        self.total += len(df)
+
+def procesar_dataframe_streaming(file_stream, opcion, filename_original, ruta_salida, bytes_bloque=32 * 1024 * 1024):
+    """
+    Convierte a Excel por bloques con memoria acotada.
+    Lee el archivo en bloques de `bytes_bloque` bytes y escribe cada fila con
+    xlsxwriter en modo `constant_memory` directo a `ruta_salida` (en disco).
+    Mantiene el orden original del archivo (los extractos SNC ya vienen ordenados
+    por predio); si se supera el límite de filas de Excel continúa en otra hoja.
+    Con la resolución completa cada bloque se reparte en las hojas T1, T2 y T3.
+    El XLSX es un ZIP que xlsxwriter arma al cerrar el libro, así que no se puede
+    enviar mientras se escribe: para que la descarga empiece de inmediato está
+    procesar_csv_streaming.
+    """
+    import xlsxwriter
+
+    layouts = layouts_opcion(opcion)
+
+    workbook = xlsxwriter.Workbook(ruta_salida, {'constant_memory': True})
+    plain_format = workbook.add_format({'bold': False, 'border': 0, 'align': 'left'})
+    try:
+        hojas = [
+            (layout, HojaStreaming(workbook, 'Datos' if len(layouts) == 1 else layout.nombre, layout.columnas, plain_format))
+            for layout in layouts
+        ]
+        for registros in registros_por_bloques(file_stream, encoding='latin-1', bytes_bloque=bytes_bloque):
+            for layout, hoja in hojas:
+                df = convertir_numericos(layout.dataframe(registros), layout.numericas)
+                if not df.empty:
+                    hoja.escribir(df)
+    finally:
+        workbook.close()
+
+    base_name = os.path.splitext(filename_original)[0]
+    return f"{base_name}.xlsx", sum(hoja.total for _, hoja in hojas)
+
+def procesar_csv_streaming(fuente, opcion, filename_original, bytes_bloque=32 * 1024 * 1024):
+    """
+    (generador, nombre): el generador entrega el CSV comprimido con gzip bloque a bloque
+    mientras se lee `fuente`, así la respuesta empieza con el primer bloque y la memoria
+    queda acotada por `bytes_bloque`. Un CSV tiene un solo encabezado: la resolución
+    completa (T1+T2+T3) no se admite en este modo.
+    """
+    layouts = layouts_opcion(opcion)
+    if len(layouts) != 1:
+        raise ValueError("El CSV en streaming admite un solo tipo de registro; use XLSX para la resolución completa.")
+    layout = layouts[0]
+
+    def generar():
+        compresor = zlib.compressobj(wbits=31)  # wbits=31: formato gzip
+        encabezado = compresor.compress(pd.DataFrame(columns=layout.columnas).to_csv(index=False, lineterminator='\n').encode('utf-8'))
+        for registros in registros_por_bloques(fuente, encoding='latin-1', bytes_bloque=bytes_bloque):
+            df = convertir_numericos(layout.dataframe(registros), layout.numericas)
+            if not df.empty:
+                # Z_SYNC_FLUSH: cada bloque sale completo hacia el cliente en vez de quedar en el búfer de zlib
+                datos = compresor.compress(df.to_csv(index=False, header=False, lineterminator='\n').encode('utf-8'))
+                yield encabezado + datos + compresor.flush(zlib.Z_SYNC_FLUSH)
+                encabezado = b''
+        yield encabezado + compresor.flush()
+
+    base_name = os.path.splitext(filename_original)[0]
+    return generar(), f"{base_name}{FORMATOS_SALIDA['csv.gz'][0]}"
+
+
+# =============================================================================
+# MODO LOTE (ZIP CON VARIOS MUNICIPIOS)
+# =============================================================================
+EXTENSIONES_LOTE = ('.txt', '.prn')
+
+def convertir_archivo_lote(ruta_entrada, nombre, opcion, formato, ruta_salida):
+    """Convierte un archivo del lote en un proceso aparte; retorna su fila del resumen."""
+    resumen = {'archivo': nombre, 'salida': '', 'filas': 0, 'anomalias_longitud': 0,
+               'predios_inconsistentes': 0, 'duplicados': 0,
+               'seg_lectura': 0.0, 'seg_total': 0.0, 'estado': 'OK', 'error': ''}
+    t0 = time.perf_counter()
+    try:
+        registros = RegistrosFWF.desde_fuente(ruta_entrada, encoding='latin-1')
+        hojas = convertir_registros(registros, opcion)
+        resumen['seg_lectura'] = round(time.perf_counter() - t0, 3)
+
+        output, resumen['salida'] = exportar_hojas(hojas, formato, nombre)
+        with open(ruta_salida, 'wb') as f:
+            f.write(output.getbuffer())
+        resumen['filas'] = int(sum(len(df) for df in hojas.values()))
+        # Registros truncados, predios incompletos y NoOrden repetidos, sobre la misma lectura
+        integridad = calcular_integridad(registros, hojas, opcion)
+        resumen['anomalias_longitud'] = integridad['anomalias_longitud']
+        resumen['predios_inconsistentes'] = sum(d['predios_inconsistentes'] for d in integridad['layouts'].values())
+        resumen['duplicados'] = sum(d['duplicados'] for d in integridad['layouts'].values())
+    except Exception as e:
+        resumen['estado'] = 'ERROR'
+        resumen['error'] = str(e)
+    resumen['seg_total'] = round(time.perf_counter() - t0, 3)
+    return resumen
+
+def nombre_unico(nombre, usados):
+    """
+    `nombre` o, si ya está en `usados` (sin distinguir mayúsculas), `<base>_2<ext>`, `<base>_3<ext>`...
+    Lo agrega a `usados`. Evita que x.txt y x.prn del mismo lote escriban la misma entrada del ZIP.
+    """
+    extension = next((e for e in ('.csv.gz',) if nombre.lower().endswith(e)), os.path.splitext(nombre)[1])
+    base, candidato, i = nombre[:len(nombre) - len(extension)], nombre, 2
+    while candidato.lower() in usados:
+        candidato, i = f"{base}_{i}{extension}", i + 1
+    usados.add(candidato.lower())
+    return candidato
+
+def procesar_lote_zip(zip_stream, opcion, ruta_salida, formato='xlsx', max_workers=None, directorio_trabajo=None):
+    """
+    Convierte todos los .txt/.prn de un ZIP (un archivo por proceso) y escribe en
+    `ruta_salida` un ZIP con las salidas más RESUMEN_LOTE.csv (filas, tiempos y
+    rechazos por archivo). Retorna la lista de resúmenes.
+    """
+    if formato not in FORMATOS_SALIDA:
+        raise ValueError(f"Formato de salida no válido: {formato}")
+    layouts_opcion(opcion)  # valida la opción antes de lanzar procesos
+
+    resumenes = []
+    with tempfile.TemporaryDirectory(dir=directorio_trabajo) as tmp:
+        # Extraer con nombres internos (evita rutas arbitrarias dentro del ZIP)
+        tareas = []
+        with zipfile.ZipFile(zip_stream) as zin:
+            for info in zin.infolist():
+                nombre = info.filename
+                if info.is_dir() or nombre.startswith('__MACOSX/'):
+                    continue
+                if not nombre.lower().endswith(EXTENSIONES_LOTE):
+                    resumenes.append({'archivo': nombre, 'salida': '', 'filas': 0, 'anomalias_longitud': 0,
+                                      'predios_inconsistentes': 0, 'duplicados': 0, 'seg_lectura': 0.0, 'seg_total': 0.0, 'estado': 'RECHAZADO',
+                                      'error': 'Extensión no admitida (se esperan .txt/.prn)'})
+                    continue
+                i = len(tareas)
+                entrada = os.path.join(tmp, f"in_{i:04d}")
+                with zin.open(info) as src, open(entrada, 'wb') as dst:
+                    while True:
+                        bloque = src.read(1024 * 1024)
+                        if not bloque: break
+                        dst.write(bloque)
+                tareas.append((entrada, nombre, opcion, formato, os.path.join(tmp, f"out_{i:04d}")))
+        if not tareas:
+            raise ValueError("El ZIP no contiene archivos .txt/.prn")
+
+        # Un archivo por proceso
+        workers = min(len(tareas), max_workers or os.cpu_count() or 1)
+        if workers == 1:
+            resultados = [convertir_archivo_lote(*t) for t in tareas]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                resultados = list(pool.map(convertir_archivo_lote, *zip(*tareas)))
+
+        with zipfile.ZipFile(ruta_salida, 'w', zipfile.ZIP_DEFLATED) as zout:
+            usados = {'resumen_lote.csv'}
+            for tarea, resumen in zip(tareas, resultados):
+                if resumen['estado'] == 'OK':
+                    # El resumen registra el nombre con que quedó la salida dentro del ZIP
+                    resumen['salida'] = nombre_unico(resumen['salida'], usados)
+                    zout.write(tarea[4], resumen['salida'])
+            resumenes = resultados + resumenes
+            zout.writestr('RESUMEN_LOTE.csv', pd.DataFrame(resumenes).to_csv(index=False).encode('utf-8-sig'))
+    return resumenes
@@ -0,0 +1,104 @@
+"""Tipado compacto de los DataFrames catastrales.
+
+Paso común a todos los lectores: las columnas de baja cardinalidad (Departamento,
+Municipio, DestinoEconomico, ESTADO, ESCENARIO...) pasan a categóricas, las áreas
+y avalúos se reducen al tipo numérico más pequeño que los representa sin pérdida
+y los NPN quedan como texto Arrow en lugar de un objeto Python por celda."""
+
+import numpy as np
+import pandas as pd
+
+# Texto Arrow con semántica de object (faltantes como NaN, comparaciones con bool de numpy)
+try:
+    import pyarrow  # noqa: F401
+    TIPO_TEXTO = pd.StringDtype('pyarrow_numpy')
+except (ImportError, ValueError, TypeError):
+    TIPO_TEXTO = object
+
+# Una columna de texto es categórica si tiene a lo sumo esta fracción de valores distintos
+UMBRAL_CATEGORIA = 0.05
+
+
+def reducir_numerica(serie):
+    """Entero de 32 bits si los valores son enteros y caben; float32 solo si no cambia ningún valor."""
+    if not isinstance(serie.dtype, np.dtype) or serie.dtype.kind not in 'iuf' or serie.empty:
+        return serie
+    valores = serie.to_numpy()
+    if pd.api.types.is_float_dtype(serie):
+        if np.isfinite(valores).all() and np.array_equal(valores, np.trunc(valores)):
+            valores = valores.astype(np.int64)
+        else:
+            reducido = valores.astype(np.float32)
+            if np.array_equal(reducido.astype(valores.dtype), valores, equal_nan=True):
+                return pd.Series(reducido, index=serie.index, name=serie.name)
+            return serie
+    # Mínimo int32: las restas entre montos no deben desbordar
+    info = np.iinfo(np.int32)
+    if valores.min() >= info.min and valores.max() <= info.max:
+        return pd.Series(valores.astype(np.int32), index=serie.index, name=serie.name)
+    return pd.Series(valores.astype(np.int64), index=serie.index, name=serie.name)
+
+
+def columnas_baja_cardinalidad(df, umbral=UMBRAL_CATEGORIA):
+    """Columnas de texto con pocos valores distintos respecto al número de filas."""
+    if df.empty:
+        return []
+    return [c for c in df.columns if df[c].dtype == object and df[c].nunique() <= umbral * len(df)]
+
+
+def compactar_dataframe(df, categoricas=(), textos=(), numericas=(), umbral_categoria=None):
+    """
+    Aplica el tipado compacto sobre las columnas presentes y retorna el DataFrame:
+    `categoricas` a category, `textos` (NPN, nombres) a texto Arrow y `numericas` reducidas.
+    Con `umbral_categoria` también pasan a categóricas las demás columnas de texto
+    con pocos valores distintos (útil para Excel con columnas desconocidas).
+    """
+    categoricas = [c for c in categoricas if c in df.columns]
+    if umbral_categoria is not None:
+        categoricas += [c for c in columnas_baja_cardinalidad(df, umbral_categoria) if c not in categoricas and c not in textos]
+    for col in categoricas:
+        if df[col].dtype == object:
+            df[col] = df[col].astype('category')
+    for col in textos:
+        if col in df.columns and df[col].dtype == object:
+            df[col] = df[col].astype(TIPO_TEXTO)
+    for col in numericas:
+        if col in df.columns:
+            df[col] = reducir_numerica(df[col])
+    return df
+
+
+def combinar_columnas(principal, respaldo, relleno):
+    """`principal.combine_first(respaldo).fillna(relleno)` sin perder el tipo categórico.
+
+    Con categóricas se unen las categorías de ambos lados (más el relleno) antes de combinar."""
+    if isinstance(principal.dtype, pd.CategoricalDtype) and isinstance(respaldo.dtype, pd.CategoricalDtype):
+        categorias = principal.cat.categories.union(respaldo.cat.categories).union(pd.Index([relleno]))
+        principal = principal.cat.set_categories(categorias)
+        respaldo = respaldo.cat.set_categories(categorias)
+        return principal.where(principal.notna(), respaldo).fillna(relleno)
+    return principal.combine_first(respaldo).fillna(relleno)
+
+
+def rellenar_categorica(serie, relleno):
+    """fillna sobre una categórica agregando el relleno como categoría si hace falta."""
+    if not serie.isna().any():
+        return serie
+    if relleno not in serie.cat.categories:
+        serie = serie.cat.add_categories([relleno])
+    return serie.fillna(relleno)
+
+
+def valores_distintos(a, b):
+    """Máscara numpy de `a != b` fila a fila, con dos faltantes como iguales.
+
+    Con categóricas se comparan los códigos sobre la unión de categorías, sin pasar por texto."""
+    if isinstance(a.dtype, pd.CategoricalDtype) and isinstance(b.dtype, pd.CategoricalDtype):
+        categorias = a.cat.categories.union(b.cat.categories)
+        return a.cat.set_categories(categorias).cat.codes.to_numpy() != b.cat.set_categories(categorias).cat.codes.to_numpy()
+    if pd.api.types.is_numeric_dtype(a) and pd.api.types.is_numeric_dtype(b):
+        va, vb = a.to_numpy(dtype=np.float64, na_value=np.nan), b.to_numpy(dtype=np.float64, na_value=np.nan)
+        return (va != vb) & ~(np.isnan(va) & np.isnan(vb))
+    a, b = a.astype(TIPO_TEXTO), b.astype(TIPO_TEXTO)
+    ambos_faltantes = (a.isna() & b.isna()).to_numpy()
+    return (a != b).to_numpy(dtype=bool) & ~ambos_faltantes
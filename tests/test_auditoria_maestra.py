@@ -0,0 +1,40 @@
+import unittest
+import sys
+import os
+import tempfile
+import pandas as pd
+
+# Add modules to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from modules.auditoria_maestra import consultar_auditoria, variaciones_auditoria, ruta_resultados_auditoria
+
+
+class TestTablaAuditoria(unittest.TestCase):
+    def test_pagina_busqueda_y_variaciones(self):
+        estados = ['OK', 'Error de Cálculo', 'OK', 'Faltante en Listado', 'OK']
+        full = pd.DataFrame({
+            'Numero_Predial': [f"70215{i:025d}" for i in range(5)],
+            'Valor_Base_R1': 1000.0,
+            'Zona': 'Urbana',
+            'Base_Usada': [1000.0, 2000.0, 3000.0, 4000.0, 5000.0],
+            'Valor_Cierre_Listado': [1100.0, 2300.0, 3300.0, 0.0, 5500.0],
+            'Cierre_Calculado': [1000, 2000, 3000, 4000, 6000],
+            'Pct_Variacion': [10.0, 15.0, 10.0, -100.0, 10.0],
+            'Estado': pd.Categorical(estados),
+            '_merge': ['both', 'both', 'both', 'left_only', 'both'],
+        })
+        with tempfile.TemporaryDirectory() as tmp:
+            ruta = ruta_resultados_auditoria(tmp, 'x')
+            full.to_parquet(ruta, index=False)
+            res = consultar_auditoria(ruta, pagina=2, por_pagina=2)
+            self.assertEqual((res['total'], res['paginas'], res['pagina']), (5, 3, 2))
+            self.assertEqual([f['Base_Usada'] for f in res['filas']], [3000.0, 4000.0])
+            self.assertNotIn('Valor_Base_R1', res['filas'][0])
+            # La búsqueda cubre el número predial y el estado, sin distinguir mayúsculas
+            self.assertEqual(consultar_auditoria(ruta, busqueda='error')['total'], 1)
+            self.assertEqual(consultar_auditoria(ruta, busqueda='00004', pagina=7)['filas'][0]['Estado'], 'OK')
+            self.assertEqual(variaciones_auditoria(ruta), [10.0, 15.0, 10.0, 10.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,239 @@
+import unittest
+import sys
+import os
+import io
+import tempfile
+import zipfile
+import numpy as np
+import pandas as pd
+
+# Add modules to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from modules.avaluo_analisis import (limpiar_columna_texto, consultar_resultados, barrido_incrementos, grilla_escenarios, procesar_departamento,
+                                     procesar_departamento_zip,
+                                     detectar_outliers, procesar_incremento_web, ruta_resultados, exportar_csv, exportar_resultados,
+                                     cargar_snc, cargar_snc_cache)
+
+
+class TestLimpiezaTexto(unittest.TestCase):
+    def test_reparacion_sobre_valores_distintos(self):
+        serie = pd.Series(['  MUÃ‘OZ ANA ', 'PEREZ JUAN', 'MUÃ‘OZ ANA', np.nan, 'PEREZ JUAN  '], index=[10, 11, 12, 13, 14])
+        limpia = limpiar_columna_texto(serie)
+        self.assertEqual(list(limpia.index), [10, 11, 12, 13, 14])
+        self.assertEqual(limpia.iloc[[0, 1, 2, 4]].tolist(), ['MUÑOZ ANA', 'PEREZ JUAN', 'MUÑOZ ANA', 'PEREZ JUAN'])
+        self.assertTrue(pd.isna(limpia.iloc[3]))
+
+
+class TestConsultaResultados(unittest.TestCase):
+    def test_pagina_filtrada_y_ordenada(self):
+        df = pd.DataFrame({
+            'Predial_Nacional': [f"70215{z}{i:023d}" for i, z in enumerate(['01', '00', '01', '01', '00'])],
+            'Estado': pd.Categorical(['OK', 'NUEVO', 'INCONSISTENCIA', 'OK', 'OK']),
+            'Zona': pd.Categorical(['URBANO', 'RURAL', 'URBANO', 'URBANO', 'RURAL']),
+            'Sistema': [300, 100, 500, 200, 400],
+        })
+        with tempfile.TemporaryDirectory() as tmp:
+            ruta = os.path.join(tmp, 'res.parquet')
+            df.to_parquet(ruta, index=False)
+            res = consultar_resultados(ruta, pagina=2, por_pagina=2, orden='Sistema', descendente=True)
+            self.assertEqual((res['total'], res['paginas']), (5, 3))
+            self.assertEqual([f['Sistema'] for f in res['filas']], [300, 200])
+
+            res = consultar_resultados(ruta, filtros={'Estado': ['OK'], 'Zona': ['URBANO']}, orden='Sistema')
+            self.assertEqual([f['Sistema'] for f in res['filas']], [200, 300])
+            res = consultar_resultados(ruta, busqueda='0004', pagina=9)
+            self.assertEqual((res['total'], res['pagina']), (1, 1))
+
+    def test_paginas_con_varios_grupos_de_filas(self):
+        rng = np.random.default_rng(5)
+        n = 500
+        df = pd.DataFrame({
+            'Predial_Nacional': [f"70215{z}{i:023d}" for i, z in enumerate(rng.choice(['00', '01'], n))],
+            'Estado': pd.Categorical(rng.choice(['OK', 'NUEVO', 'INCONSISTENCIA'], n)),
+            'Sistema': np.where(rng.random(n) < 0.1, np.nan, rng.integers(0, 50, n) * 1000.0),
+            'Cambios': rng.integers(0, 4, n).astype(np.uint8),
+        })
+        with tempfile.TemporaryDirectory() as tmp:
+            ruta = os.path.join(tmp, 'res.parquet')
+            df.to_parquet(ruta, index=False, row_group_size=37)
+            esperado = df[df['Estado'].isin(['OK', 'NUEVO']) & df['Predial_Nacional'].str.contains('7021501')]
+            esperado = esperado.sort_values('Sistema', ascending=False, kind='stable', na_position='last')
+            for pagina in [1, 3, 7]:
+                res = consultar_resultados(ruta, pagina=pagina, por_pagina=25, orden='Sistema', descendente=True,
+                                           filtros={'Estado': ['OK', 'NUEVO']}, busqueda='7021501')
+                self.assertEqual(res['total'], len(esperado))
+                bloque = esperado.iloc[(pagina - 1) * 25:pagina * 25]
+                self.assertEqual([f['Predial_Nacional'] for f in res['filas']], bloque['Predial_Nacional'].tolist())
+            # Sin filtros ni orden: el orden del archivo
+            res = consultar_resultados(ruta, pagina=2, por_pagina=50)
+            self.assertEqual([f['Predial_Nacional'] for f in res['filas']], df['Predial_Nacional'].iloc[50:100].tolist())
+
+    def test_exportacion_por_lotes(self):
+        df = pd.DataFrame({
+            'Predial_Nacional': [f"70215{z}{i:023d}" for i, z in enumerate(['01', '00', '02', '01', '00'])],
+            'Estado': pd.Categorical(['OK', 'NUEVO', 'OK', 'OK', 'OK']),
+            'Sistema': [300, 100, 500, 200, 400],
+        })
+        with tempfile.TemporaryDirectory() as tmp:
+            ruta = os.path.join(tmp, 'res.parquet')
+            df.to_parquet(ruta, index=False)
+            # Un lote por cada dos filas: el CSV llega en varios bloques con un solo encabezado
+            bloques = list(exportar_csv(ruta, 'URBANO', filas_lote=2))
+            self.assertGreater(len(bloques), 1)
+            csv = pd.read_csv(io.BytesIO(b''.join(bloques)), dtype={'Predial_Nacional': str})
+            self.assertEqual(csv['Sistema'].tolist(), [300, 200])
+
+            salida = os.path.join(tmp, 'corr.parquet')
+            self.assertEqual(exportar_resultados(ruta, 'parquet', salida, 'CORREG', filas_lote=2), 1)
+            self.assertEqual(pd.read_parquet(salida)['Sistema'].tolist(), [500])
+            salida = os.path.join(tmp, 'todo.xlsx')
+            self.assertEqual(exportar_resultados(ruta, 'xlsx', salida, filas_lote=2), 5)
+            self.assertEqual(pd.read_excel(salida)['Estado'].tolist(), df['Estado'].tolist())
+
+
+class TestBarridoIncrementos(unittest.TestCase):
+    def test_conteos_y_totales_por_escenario(self):
+        df_final = pd.DataFrame({
+            'Predial_Nacional': ['70215' + z + '0' * 23 for z in ['01', '00', '00', '01']],
+            '_merge': ['both', 'both', 'left_only', 'right_only'],
+            'Avaluo_pre': [100000.0, 1000.0, 50000.0, 0.0],
+            'Avaluo_post': [110000.0, 2000.0, 0.0, 7000.0],
+        })
+        # bloque=1: una fila por bloque, el resultado no depende del tamaño del bloque
+        res = barrido_incrementos(df_final, [(10, 5), (0, 0)], bloque=1)
+        self.assertEqual([(r['ok'], r['sin_aumento'], r['inconsistencias']) for r in res], [(1, 1, 0), (0, 2, 0)])
+        self.assertEqual([r['total_calculado'] for r in res], [164000, 151000])
+        self.assertEqual([r['total_diferencia'] for r in res], [-47000, -54000])
+        self.assertEqual((res[0]['nuevos'], res[0]['desaparecidos']), (1, 1))
+
+    def test_porcentajes_no_finitos(self):
+        with self.assertRaises(ValueError):
+            grilla_escenarios([float('nan')], [5.0])
+        with self.assertRaises(ValueError):
+            grilla_escenarios([3.0], [-100.0])
+        with self.assertRaises(ValueError):
+            grilla_escenarios([1.0] * 10000, [2.0] * 10000)
+
+        from flask import Flask
+        from blueprints.tools import tools_bp
+        app = Flask(__name__)
+        app.secret_key = 'test'
+        app.register_blueprint(tools_bp)
+        with tempfile.TemporaryDirectory() as tmp:
+            pre = escribir_csv(os.path.join(tmp, 'pre.csv'), '215', [1000])
+            cliente = app.test_client()
+            with cliente.session_transaction() as sesion:
+                sesion['path_pre'] = sesion['path_post'] = pre
+            for valor in ['nan', 'inf', '-inf', '-100']:
+                r = cliente.post('/avaluos/barrido', data={'pcts_urbano': valor, 'pcts_rural': '5'})
+                self.assertEqual(r.status_code, 400, valor)
+                self.assertIn('Escenarios inválidos', r.get_json()['error'])
+            # Un error al cargar los archivos no se reporta como escenario inválido
+            with cliente.session_transaction() as sesion:
+                sesion['path_pre'] = sesion['path_post'] = tmp
+            r = cliente.post('/avaluos/barrido', data={'pcts_urbano': '3', 'pcts_rural': '5'})
+            self.assertEqual(r.status_code, 500)
+            self.assertIn('Error en barrido', r.get_json()['error'])
+
+
+class TestOutliers(unittest.TestCase):
+    def test_limites_por_grupo(self):
+        # Urbano sube ~10% y rural ~3%: un 10% rural es atípico en su grupo aunque no en el global
+        pct = [0.10, 0.101, 0.099, 0.102, 0.098, 0.10, 0.03, 0.031, 0.029, 0.032, 0.028, 0.10, 0.5]
+        zonas = ['01'] * 6 + ['00'] * 6 + ['02']
+        df = pd.DataFrame({
+            'Predial_Nacional': [f"70215{z}{i:023d}" for i, z in enumerate(zonas)],
+            'Nombre': 'X', 'Zona': 'URBANO', 'Destino': 'A', 'Municipio': '215',
+            'Avaluo_pre': 1000.0, 'Pct_Real': pct,
+        })
+        df['Avaluo_post'] = df['Avaluo_pre'] * (1 + df['Pct_Real'])
+        top, grupos = detectar_outliers(df)
+        self.assertEqual([o['Predial_Nacional'][-2:] for o in top], ['11'])
+        self.assertEqual(top[0]['Tipo_Zona'], 'RURAL')
+        # El corregimiento (un predio) no alcanza el mínimo para estimar cuartiles
+        self.assertEqual([(g['Tipo_Zona'], g['Predios'], g['Outliers']) for g in grupos], [('URBANO', 6, 0), ('RURAL', 6, 1)])
+        self.assertEqual(len(grupos[1]['Top']), 1)
+
+
+def escribir_csv(ruta, municipio, avaluos, nombres=None, destinos=None, areas=None):
+    """CSV con las 16 primeras columnas del R1 (hasta Avaluo), un predio por avalúo."""
+    n = len(avaluos)
+    nombres = nombres or [f"PREDIO {i}" for i in range(n)]
+    destinos = destinos or ['A'] * n
+    areas = areas or ['100'] * n
+    filas = [';'.join(['70', municipio, f"01{i:023d}", '1', '001', '001', nombres[i], 'S', 'C', str(i),
+                       'CALLE', '0', destinos[i], areas[i], '50', str(v)]) for i, v in enumerate(avaluos)]
+    with open(ruta, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(['x;' * 15 + 'x'] + filas))
+    return ruta
+
+
+class TestFiltroZonal(unittest.TestCase):
+    def test_zona_en_la_lectura(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            ruta = escribir_csv(os.path.join(tmp, 'pre.csv'), '215', [1000, 2000])
+            self.assertEqual(len(cargar_snc(ruta, 'URBANO')), 2)
+            self.assertEqual(len(cargar_snc(ruta, 'CORREG')), 0)
+            # La zona forma parte de la llave de la caché
+            cache = os.path.join(tmp, 'cache')
+            self.assertEqual(len(cargar_snc_cache(ruta, cache, 'URBANO')), 2)
+            self.assertEqual(len(cargar_snc_cache(ruta, cache, 'RURAL')), 0)
+            self.assertEqual(len(os.listdir(cache)), 2)
+
+
+class TestCambios(unittest.TestCase):
+    def test_mascara_conteos_y_filtro(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            r = lambda n: os.path.join(tmp, n)
+            pre = escribir_csv(r('pre.csv'), '215', [10000] * 4)
+            post = escribir_csv(r('post.csv'), '215', [11000] * 3, nombres=['PREDIO 0', 'OTRO DUEÑO', 'PREDIO 2'],
+                                destinos=['A', 'B', 'A'], areas=['100', '100', '120'])
+            res = procesar_incremento_web(pre, post, 10, 10, directorio_resultados=tmp)
+            self.assertEqual(res['stats']['cambios'], {'Nombre': 1, 'Destino': 1, 'AreaTerreno': 1, 'AreaConstruida': 0})
+            self.assertEqual(res['stats']['predios_con_cambios'], 2)
+
+            ruta = ruta_resultados(tmp, res['resultado_id'])
+            filas = consultar_resultados(ruta, cambio='CUALQUIERA', orden='Predial_Nacional')['filas']
+            self.assertEqual([f['Cambios'] for f in filas], [0b011, 0b100])
+            self.assertEqual(consultar_resultados(ruta, cambio='AreaTerreno')['total'], 1)
+            with self.assertRaises(ValueError):
+                consultar_resultados(ruta, cambio='Avaluo')
+
+
+class TestDepartamento(unittest.TestCase):
+    def test_consolidado_y_desglose(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            r = lambda n: os.path.join(tmp, n)
+            pares = [
+                ('001.csv', escribir_csv(r('pre1.csv'), '001', [10000, 20000, 30000]), escribir_csv(r('post1.csv'), '001', [11000, 22000, 99000])),
+                ('215.csv', escribir_csv(r('pre2.csv'), '215', [50000, 50000]), escribir_csv(r('post2.csv'), '215', [55000])),
+                ('110.csv', r('no_existe.csv'), r('no_existe.csv')),
+            ]
+            res = procesar_departamento(pares, 10, 10, max_workers=1)
+        municipios = {m['codigo']: m for m in res['municipios']}
+        self.assertEqual((municipios['70001']['ok'], municipios['70001']['inconsistencias']), (2, 1))
+        self.assertEqual(municipios['70001']['nombre'], 'Sincelejo (Capital)')
+        self.assertEqual((municipios['70215']['ok'], municipios['70215']['desaparecidos']), (1, 1))
+        self.assertEqual((res['stats']['total_registros_universo'], res['stats']['inconsistencias']), (5, 1))
+        self.assertEqual([a['estado'] for a in res['archivos']], ['OK', 'OK', 'ERROR'])
+
+    def test_zip_con_nombres_repetidos_en_carpetas(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            zips = []
+            for raiz, factor in [('base', 1), ('sistema', 1.1)]:
+                zips.append(io.BytesIO())
+                with zipfile.ZipFile(zips[-1], 'w') as zf:
+                    for mun, avaluos in [('001', [10000, 20000]), ('215', [50000, 50000, 50000])]:
+                        ruta = escribir_csv(os.path.join(tmp, f"{raiz}_{mun}.csv"), mun, [int(v * factor) for v in avaluos])
+                        zf.write(ruta, f"{raiz}/mun_{mun}/R1.csv")
+                    if raiz == 'base':
+                        zf.write(ruta, f"{raiz}/mun_215/R1.csv")
+            res = procesar_departamento_zip(zips[0], zips[1], 10, 10, directorio_trabajo=tmp, max_workers=1)
+        # Ambos municipios se procesan (antes el segundo R1.csv reemplazaba al primero)
+        self.assertEqual(sorted(a['archivo'] for a in res['archivos']), ['mun_001/R1.csv', 'mun_215/R1.csv'])
+        self.assertEqual(res['stats']['total_registros_universo'], 5)
+        self.assertEqual((res['sin_pareja'], res['repetidos']), ([], ['base/mun_215/R1.csv']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+import sys
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+
+# Add modules to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from modules.avaluo_analisis import procesar_incremento_web, ruta_resultados, LAYOUT_R1, COLS_R1
+from modules.avaluo_streaming import procesar_incremento_streaming, lotes_snc, SketchCuantiles
+
+
+def linea_r1(campos):
+    """Registro R1 de ancho fijo con los campos dados (los demás en blanco)."""
+    linea = [' '] * LAYOUT_R1.colspecs[COLS_R1.index('Avaluo')][1]
+    for campo, valor in campos.items():
+        inicio, fin = LAYOUT_R1.colspecs[COLS_R1.index(campo)]
+        linea[inicio:fin] = str(valor).rjust(fin - inicio) if campo == 'Avaluo' else str(valor).ljust(fin - inicio)
+    return ''.join(linea)
+
+
+def escribir_r1(ruta, predios):
+    """`predios`: {consecutivo: (zona, avalúo, nombre)}; el archivo queda ordenado por NPN."""
+    lineas = [linea_r1({'Departamento': '70', 'Municipio': '215', 'NoPredial': f"{zona}{i:023d}", 'Nombre': nombre,
+                        'DestinoEconomico': 'A', 'AreaTerreno': '100', 'AreaConstruida': '50', 'Avaluo': avaluo})
+              for i, (zona, avaluo, nombre) in sorted(predios.items(), key=lambda p: (p[1][0], p[0]))]
+    with open(ruta, 'w', encoding='latin-1') as f:
+        f.write('\n'.join(lineas) + '\n')
+    return ruta
+
+
+class TestCruceOrdenado(unittest.TestCase):
+    def test_igual_al_cruce_en_memoria(self):
+        rng = np.random.default_rng(7)
+        zonas = rng.choice(['00', '01', '02'], 300)
+        base = {i: (zonas[i], int(v), f"PREDIO {i}") for i, v in enumerate(rng.integers(1, 500, 300) * 1000)}
+        sistema = {i: (z, int(v * 1.1), 'OTRO' if i % 7 == 0 else n) for i, (z, v, n) in base.items() if i % 10}
+        sistema.update({i: ('01', 5000, 'NUEVO') for i in range(300, 320)})
+        # Mismos predios en ambos archivos: Base y Sistema sin faltantes quedan enteros, como en memoria
+        completo = {i: (z, int(v * 1.1), n) for i, (z, v, n) in base.items()}
+        with tempfile.TemporaryDirectory() as tmp:
+            pre = escribir_r1(os.path.join(tmp, 'pre.txt'), base)
+            for zona, post in [('TODOS', escribir_r1(os.path.join(tmp, 'post.txt'), sistema)), ('CORREG', os.path.join(tmp, 'post.txt')),
+                               ('TODOS', escribir_r1(os.path.join(tmp, 'completo.txt'), completo))]:
+                esperado = procesar_incremento_web(pre, post, 10, 5, zona_filter=zona, directorio_resultados=tmp)
+                # Bloques de ~20 registros: la frontera del cruce cae en medio de ambos archivos
+                res = procesar_incremento_streaming(pre, post, 10, 5, zona_filter=zona, directorio_resultados=tmp, bytes_bloque=6000)
+                for k in ['total_registros_universo', 'ok', 'nuevos', 'desaparecidos', 'inconsistencias', 'total_monto',
+                          'cambios', 'predios_con_cambios', 'mode']:
+                    self.assertEqual(res['stats'][k], esperado['stats'][k], k)
+                for k in ['mean', 'std']:
+                    self.assertAlmostEqual(res['stats'][k], esperado['stats'][k], places=4)
+                self.assertLess(abs(res['stats']['median'] / esperado['stats']['median'] - 1), 0.01)
+                self.assertEqual(res['opciones_filtro'], esperado['opciones_filtro'])
+
+                columnas = ['Predial_Nacional', 'Estado', 'Base', 'Calculado', 'Sistema', 'Diferencia', 'Cambios']
+                a, b = [pd.read_parquet(ruta_resultados(tmp, r['resultado_id']))[columnas].sort_values('Predial_Nacional')
+                        for r in (esperado, res)]
+                # Mismo esquema que en memoria (montos enteros o float64 según haya faltantes), no solo los mismos valores
+                pd.testing.assert_frame_equal(b.reset_index(drop=True), a.reset_index(drop=True), check_categorical=False)
+
+    def test_archivo_desordenado(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            ruta = os.path.join(tmp, 'pre.txt')
+            escribir_r1(ruta, {i: ('01', 1000, 'X') for i in range(50)})
+            with open(ruta) as f:
+                lineas = f.readlines()
+            with open(ruta, 'w') as f:
+                f.writelines(lineas[25:] + lineas[:25])
+            with self.assertRaises(ValueError):
+                list(lotes_snc(ruta, bytes_bloque=3000))
+
+    def test_sketch_cuantiles(self):
+        valores = np.random.default_rng(1).lognormal(18, 1, 10001)
+        sketch = SketchCuantiles()
+        for parte in np.array_split(np.concatenate([valores, np.zeros(10)]), 7):
+            sketch.agregar(parte)
+        self.assertEqual(len(sketch), 10011)
+        self.assertLess(abs(sketch.cuantil(0.5) / np.median(np.concatenate([valores, np.zeros(10)])) - 1), 0.005)
+        self.assertEqual(sketch.cuantil(0), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import sys
+import os
+import tempfile
+import pandas as pd
+
+# Add modules to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from modules.cache_parquet import cargar_con_cache, limpiar_cache
+from modules.tipos_compactos import compactar_dataframe
+
+
+class TestCacheParquet(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = os.path.join(self.tmp.name, 'cache')
+        self.llamadas = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def escribir(self, nombre, contenido):
+        ruta = os.path.join(self.tmp.name, nombre)
+        with open(ruta, 'w') as f:
+            f.write(contenido)
+        return ruta
+
+    def cargar(self, ruta):
+        self.llamadas.append(ruta)
+        with open(ruta) as f:
+            valores = f.read().split()
+        df = pd.DataFrame({'NPN': valores, 'Municipio': ['215'] * len(valores), 'Avaluo': [1000.0] * len(valores)})
+        return compactar_dataframe(df, categoricas=['Municipio'], textos=['NPN'], numericas=['Avaluo'])
+
+    def test_segunda_carga_desde_cache(self):
+        ruta = self.escribir('pre.txt', 'A B C')
+        primero = cargar_con_cache(ruta, self.cargar, self.cache, 'prueba')
+        segundo = cargar_con_cache(ruta, self.cargar, self.cache, 'prueba')
+        self.assertEqual(len(self.llamadas), 1)
+        pd.testing.assert_frame_equal(primero.reset_index(drop=True), segundo)
+
+        # Mismo contenido con otro nombre: misma llave; otro contenido: se parsea de nuevo
+        cargar_con_cache(self.escribir('copia.txt', 'A B C'), self.cargar, self.cache, 'prueba')
+        cargar_con_cache(self.escribir('post.txt', 'A B D'), self.cargar, self.cache, 'prueba')
+        self.assertEqual(len(self.llamadas), 2)
+
+    def test_limpieza_por_uso(self):
+        for i in range(4):
+            cargar_con_cache(self.escribir(f'f{i}.txt', str(i)), self.cargar, self.cache, 'prueba')
+        limpiar_cache(self.cache, max_archivos=2)
+        self.assertEqual(len(os.listdir(self.cache)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
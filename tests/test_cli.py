@@ -0,0 +1,73 @@
+import unittest
+import json
+import sys
+import os
+import tempfile
+
+# Add modules to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import cli
+from test_snc_processor import linea_resolucion
+from test_avaluo_analisis import escribir_csv
+from test_avaluo_streaming import escribir_r1
+
+
+class TestCLI(unittest.TestCase):
+    def test_snc_carpeta_con_tiempos(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            entrada = os.path.join(tmp, 'entrada')
+            os.makedirs(entrada)
+            for i in range(2):
+                with open(os.path.join(entrada, f"RESO_{i}.txt"), 'wb') as f:
+                    f.write("\r\n".join(linea_resolucion(j, '123'[j % 3]) for j in range(6)).encode('latin-1'))
+            with open(os.path.join(entrada, "LEEME.md"), 'w') as f:
+                f.write("no se procesa")
+
+            salida = os.path.join(tmp, 'salida')
+            codigo = cli.main(['snc', entrada, '--opcion', '6', '--formato', 'parquet', '--salida', salida])
+
+            self.assertEqual(codigo, 0)
+            with open(os.path.join(salida, 'tiempos.json'), encoding='utf-8') as f:
+                tiempos = json.load(f)
+            self.assertEqual(tiempos['tareas'], 2)
+            self.assertEqual([d['filas'] for d in tiempos['detalle']], [6, 6])
+            self.assertTrue(os.path.exists(os.path.join(salida, 'RESO_0_resoluciones.zip')))
+
+    def test_snc_nombres_repetidos_no_se_sobrescriben(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            entradas = []
+            for carpeta, filas in [('mun_a', 3), ('mun_b', 6)]:
+                os.makedirs(os.path.join(tmp, carpeta))
+                entradas.append(os.path.join(tmp, carpeta, 'RESO.txt'))
+                with open(entradas[-1], 'wb') as f:
+                    f.write("\r\n".join(linea_resolucion(j, '1') for j in range(filas)).encode('latin-1'))
+
+            salida = os.path.join(tmp, 'salida')
+            self.assertEqual(cli.main(['snc', *entradas, '--opcion', '6', '--formato', 'parquet', '--salida', salida]), 0)
+            with open(os.path.join(salida, 'tiempos.json'), encoding='utf-8') as f:
+                detalle = json.load(f)['detalle']
+            destinos = [d['salidas'][0] for d in detalle]
+            self.assertEqual(sorted(os.path.basename(d) for d in destinos), ['mun_a_RESO_resoluciones.zip', 'mun_b_RESO_resoluciones.zip'])
+            self.assertTrue(all(os.path.exists(d) for d in destinos))
+            self.assertEqual(cli.prefijos_salida(['a/x/R1.txt', 'b/x/R1.txt', 'c/R2.txt']), ['x_', 'x_2_', ''])
+            # La salida no lleva la extensión de la entrada: R1.txt y R1.prn también chocan
+            self.assertEqual(cli.prefijos_salida(['x/R1.txt', 'x/R1.prn']), ['x_', 'x_2_'])
+
+    def test_avaluos_misma_base_distinta_extension(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for carpeta, factor in [('base', 1), ('sistema', 1.1)]:
+                os.makedirs(os.path.join(tmp, carpeta))
+                escribir_csv(os.path.join(tmp, carpeta, 'MUN.csv'), '215', [int(1000 * factor)] * 3)
+                escribir_r1(os.path.join(tmp, carpeta, 'MUN.txt'), {i: ('01', int(2000 * factor), 'X') for i in range(5)})
+
+            salida = os.path.join(tmp, 'salida')
+            self.assertEqual(cli.main(['avaluos', os.path.join(tmp, 'base'), os.path.join(tmp, 'sistema'), '--salida', salida]), 0)
+            with open(os.path.join(salida, 'tiempos.json'), encoding='utf-8') as f:
+                detalle = json.load(f)['detalle']
+            self.assertEqual(sorted(os.path.basename(d['salidas'][0]) for d in detalle),
+                             ['sistema_2_MUN_avaluos.json', 'sistema_MUN_avaluos.json'])
+            self.assertEqual(sorted(d['filas'] for d in detalle), [3, 5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+import sys
+import os
+
+# Add modules to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from modules.layouts_snc import LayoutSNC, LAYOUTS, obtener_layout
+from modules.lector_fwf import RegistrosFWF
+
+
+class TestLayoutsSNC(unittest.TestCase):
+    def test_opciones_y_nombres(self):
+        self.assertIs(obtener_layout('1'), LAYOUTS['R1'])
+        self.assertIs(obtener_layout('t2'), LAYOUTS['T2'])
+        with self.assertRaises(ValueError):
+            obtener_layout('9')
+
+    def test_precompilado_r1(self):
+        r1 = LAYOUTS['R1']
+        self.assertEqual(r1.colspecs[0], (0, 2))
+        self.assertEqual(r1.colspecs[-1], (312, None))
+        self.assertEqual(r1.longitud, 312)
+        self.assertIn('Avaluo ($)', r1.numericas)
+        self.assertEqual(r1.tipos['NoPredial'], 'texto')
+        self.assertIn('AreaTerreno', r1.columnas_cortas)
+
+    def test_validacion(self):
+        with self.assertRaises(ValueError):
+            LayoutSNC('X', 'cortes desordenados', ['A', 'B'], [0, 0])
+        with self.assertRaises(ValueError):
+            LayoutSNC('X', 'faltan columnas', ['A'], [0, 5])
+
+    def test_filtro_tipo_sobre_bytes(self):
+        lineas = [f"{'7021500000000001'.ljust(62)}{t}".ljust(70) for t in '1213']
+        registros = RegistrosFWF.desde_fuente("\n".join(lineas).encode('latin-1'), encoding='latin-1')
+        df = LAYOUTS['T1'].dataframe(registros)
+        self.assertEqual(len(df), 2)
+        self.assertEqual(list(df['TipoRegistro']), ['1', '1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+import io
+import sys
+import os
+import tempfile
+import pandas as pd
+
+# Add modules to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from modules.lector_fwf import leer_fwf, RegistrosFWF, detectar_encoding, detectar_encoding_archivo
+from modules.layouts_snc import generar_colspecs
+
+
+class TestLectorFWF(unittest.TestCase):
+    def setUp(self):
+        self.colspecs = generar_colspecs([0, 2, 5, 30, 31, 34, 37, 137])
+        predial = "0100000000010001000000000"
+        nombre = "MUÑOZ PEREZ ANA".ljust(100)
+        self.lineas = [
+            f"70215{predial}1001002{nombre}",
+            f"70215{predial}1002002{'NA'.ljust(100)}",
+            "   ",                                   # Línea en blanco: se omite
+            f"70215{predial}1  1  2",                # Registro corto
+            f"70215{predial}1001001{nombre}EXTRA",   # Registro largo (última columna hasta el final)
+        ]
+
+    def comparar(self, data, encoding):
+        esperado = pd.read_fwf(io.BytesIO(data), colspecs=self.colspecs, header=None, encoding=encoding, dtype=str)
+        obtenido = leer_fwf(io.BytesIO(data), self.colspecs, encoding=encoding)
+        pd.testing.assert_frame_equal(esperado, obtenido)
+
+    def test_equivalente_read_fwf_latin1_crlf(self):
+        self.comparar(("\r\n".join(self.lineas) + "\r\n").encode('latin-1'), 'latin-1')
+
+    def test_equivalente_read_fwf_utf8_multibyte(self):
+        self.comparar("\n".join(self.lineas).encode('utf-8'), 'utf-8')
+
+    def test_registros_uniformes(self):
+        lineas = [self.lineas[0], self.lineas[1], self.lineas[0]]
+        self.comparar("\r\n".join(lineas).encode('latin-1'), 'latin-1')
+
+    def test_utf8_invalido_falla(self):
+        with self.assertRaises(UnicodeDecodeError):
+            leer_fwf("\n".join(self.lineas).encode('latin-1'), self.colspecs, encoding='utf-8')
+
+    def test_ruta_mapeada_igual_a_bytes(self):
+        data = ("\r\n".join(self.lineas) + "\r\n").encode('latin-1')
+        with tempfile.TemporaryDirectory() as tmp:
+            ruta = os.path.join(tmp, 'R1.txt')
+            with open(ruta, 'wb') as f:
+                f.write(data)
+            pd.testing.assert_frame_equal(leer_fwf(ruta, self.colspecs, encoding='latin-1'),
+                                          leer_fwf(data, self.colspecs, encoding='latin-1'))
+            with open(ruta, 'rb') as f:
+                pd.testing.assert_frame_equal(leer_fwf(f, self.colspecs, encoding='latin-1'),
+                                              leer_fwf(data, self.colspecs, encoding='latin-1'))
+
+    def test_columna_por_tramos(self):
+        registros = RegistrosFWF.desde_fuente("\n".join(self.lineas * 5).encode('latin-1'), encoding='latin-1')
+        for a, b in self.colspecs:
+            completa = registros.columna(a, b)
+            por_tramos = registros.columna(a, b, filas_bloque=3)
+            self.assertEqual(pd.Series(completa).fillna('<NA>').tolist(), pd.Series(por_tramos).fillna('<NA>').tolist())
+
+    def test_detectar_encoding(self):
+        texto = "\n".join(self.lineas)
+        self.assertEqual(detectar_encoding(b"70215 ASCII"), 'utf-8')
+        self.assertEqual(detectar_encoding(texto.encode('utf-8')), 'utf-8')
+        self.assertEqual(detectar_encoding(texto.encode('utf-8-sig')), 'utf-8-sig')
+        self.assertEqual(detectar_encoding(texto.encode('latin-1')), 'latin-1')
+        self.assertEqual(detectar_encoding((texto + "\u2013").encode('cp1252')), 'cp1252')
+        # Multibyte partido entre bloques del validador incremental
+        self.assertEqual(detectar_encoding("ÑÑÑ".encode('utf-8'), bytes_bloque=3), 'utf-8')
+
+    def test_detectar_encoding_archivo_por_bloques(self):
+        # El primer byte no ASCII aparece después del primer bloque: un prefijo no bastaría
+        texto = "70215 ASCII\n" * 50 + "\n".join(self.lineas)
+        with tempfile.TemporaryDirectory() as tmp:
+            for contenido in [texto.encode('utf-8'), texto.encode('utf-8-sig'), texto.encode('latin-1'),
+                              (texto + "\u2013").encode('cp1252'), b"70215 ASCII"]:
+                ruta = os.path.join(tmp, 'r1.txt')
+                with open(ruta, 'wb') as f:
+                    f.write(contenido)
+                self.assertEqual(detectar_encoding_archivo(ruta, bytes_bloque=7), detectar_encoding(contenido))
+
+    def test_encoding_auto_parsea_una_vez(self):
+        data = "\r\n".join(self.lineas).encode('latin-1')
+        df = leer_fwf(data, self.colspecs, encoding='auto')
+        self.assertEqual(df.attrs['encoding'], 'latin-1')
+        pd.testing.assert_frame_equal(df, leer_fwf(data, self.colspecs, encoding='latin-1'))
+
+    def test_filtro_sobre_bytes_crudos(self):
+        lineas = [self.lineas[0], self.lineas[0].replace('70215010', '70215000', 1), self.lineas[3]]
+        for encoding, data in [('latin-1', "\n".join(lineas).encode('latin-1')), ('utf-8', "\n".join(lineas).encode('utf-8'))]:
+            registros = RegistrosFWF.desde_fuente(data, encoding=encoding)
+            self.assertEqual(registros.campo_en(5, 7, ['01']).tolist(), [True, False, True])
+            self.assertEqual(registros.campo_numerico(0, 31).tolist(), [True, True, True])
+            df = leer_fwf(data, self.colspecs, encoding=encoding, filtro=lambda r: r.campo_en(5, 7, ['00']))
+            pd.testing.assert_frame_equal(df, leer_fwf(data, self.colspecs, encoding=encoding).iloc[[1]].reset_index(drop=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+import sys
+import os
+import pandas as pd
+
+# Add modules to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from modules.llave_npn import codificar_npn, decodificar_npn, cruzar_por_npn, agregar_llave, duplicados_npn
+
+
+class TestLlaveNPN(unittest.TestCase):
+    def setUp(self):
+        self.npns = ['702150100000000010001000000000', '702150000000000000000000000999', '999999999999999999999999999999']
+
+    def test_ida_y_vuelta_y_orden(self):
+        alta, baja, validos = codificar_npn(pd.Series(self.npns + ['70215', None, 'A' * 30]))
+        self.assertEqual(validos.tolist(), [True, True, True, False, False, False])
+        self.assertEqual(decodificar_npn(alta[:3], baja[:3]).tolist(), self.npns)
+        # El orden de (alta, baja) es el orden del texto
+        orden = sorted(range(3), key=lambda i: (alta[i], baja[i]))
+        self.assertEqual([self.npns[i] for i in orden], sorted(self.npns))
+        self.assertEqual(duplicados_npn(pd.Series(self.npns + self.npns[:1])).tolist(), [False, False, False, True])
+
+    def test_cruce_igual_al_de_texto(self):
+        pre = pd.DataFrame({'NPN': self.npns[:2], 'Base': [1, 2]})
+        post = pd.DataFrame({'NPN': self.npns[1:], 'Sistema': [3, 4]})
+        esperado = pd.merge(pre, post, on='NPN', how='outer', indicator=True)
+        self.assertEqual(agregar_llave(pre, 'NPN'), ['NPN_Alta', 'NPN_Baja'])
+        agregar_llave(post, 'NPN')
+        pd.testing.assert_frame_equal(cruzar_por_npn(pre, post, 'NPN', how='outer', indicator=True), esperado)
+
+        # Un valor que no es NPN: se cruza por texto
+        invalido = pd.DataFrame({'NPN': ['X'], 'Sistema': [5]})
+        self.assertEqual(agregar_llave(invalido, 'NPN'), ['NPN'])
+        self.assertEqual(len(cruzar_por_npn(pre, invalido, 'NPN', how='outer')), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+import sys
+import os
+import numpy as np
+
+# Add modules to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from modules.redondeo import redondear_miles, redondear_miles_decimal
+
+
+class TestRedondeoMiles(unittest.TestCase):
+    def test_igual_a_decimal(self):
+        rng = np.random.default_rng(3)
+        bases = np.concatenate([rng.integers(0, 5_000_000_000, 2000).astype(float), rng.integers(1, 5000, 500) * 500.0,
+                                np.round(rng.random(500) * 1e6, 2), [np.nan, 0, -1500, -2500, 0.1, 1 / 3, 1e17]])
+        for pct in [3, 4.5, 0.01, -10, 12.345, 0]:
+            esperado = [redondear_miles_decimal(b, pct) for b in bases.tolist()]
+            self.assertEqual(redondear_miles(bases, pct).tolist(), esperado, pct)
+
+    def test_mitad_exacta(self):
+        # En float 500000 * 1.045 = 522499.99999999994 y floor(x / 1000 + 0.5) daba 522000
+        self.assertEqual(redondear_miles([500000, 900000], 4.5).tolist(), [523000, 941000])
+        self.assertEqual(redondear_miles([-1500, 1500, 1499.99], 0).tolist(), [-2000, 2000, 1000])
+
+    def test_porcentaje_no_finito(self):
+        for pct in [np.nan, np.inf, -np.inf, [3, np.nan]]:
+            with self.assertRaises(ValueError):
+                redondear_miles([500000, 900000], pct)
+
+    def test_difusion_por_escenarios(self):
+        bases = np.array([[500000.0], [1234567.0]])
+        pcts = np.array([[4.5, 0, 10]])
+        obtenido = redondear_miles(bases, pcts)
+        self.assertEqual(obtenido.shape, (2, 3))
+        self.assertEqual(obtenido.tolist(), [[redondear_miles_decimal(b, p) for p in pcts[0]] for b in bases[:, 0]])
+
+
+if __name__ == '__main__':
+    unittest.main()
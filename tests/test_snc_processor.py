@@ -0,0 +1,166 @@
+import unittest
+import io
+import json
+import sys
+import os
+import tempfile
+import zipfile
+import pandas as pd
+
+# Add modules to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from modules.snc_processor import procesar_dataframe, procesar_csv_streaming, procesar_lote_zip, procesar_predios
+from modules.layouts_snc import LAYOUTS
+
+
+def linea_resolucion(i, tipo):
+    """Registro de resolución de 410 posiciones con TipoRegistro en la posición 62."""
+    return (f"70215{i // 3:013d}{i:015d}011{i:025d}I{tipo}{'':3}{i % 3 + 1:03d}003" + f"PREDIO {i}".ljust(100)).ljust(410)
+
+
+def armar_linea(layout, valores):
+    """Registro de ancho fijo con los valores dados en sus posiciones (el resto en blanco)."""
+    linea = [' '] * layout.longitud
+    for col, valor in valores.items():
+        inicio, fin = layout.posicion[col]
+        linea[inicio:fin] = str(valor).rjust(fin - inicio)
+    return ''.join(linea)
+
+
+class TestResolucionCompleta(unittest.TestCase):
+    def setUp(self):
+        self.tipos = '1231321'
+        lineas = [linea_resolucion(i, t) for i, t in enumerate(self.tipos)]
+        self.data = ("\r\n".join(lineas) + "\r\n").encode('latin-1')
+
+    def test_una_hoja_por_tipo(self):
+        output, nombre = procesar_dataframe(io.BytesIO(self.data), '6', 'RESO.txt')
+        hojas = pd.read_excel(output, sheet_name=None)
+        self.assertEqual(nombre, 'RESO.xlsx')
+        self.assertEqual(list(hojas), ['T1', 'T2', 'T3'])
+        self.assertEqual([len(h) for h in hojas.values()], [self.tipos.count(t) for t in '123'])
+
+    def test_zip_columnar_igual_a_opciones_separadas(self):
+        output, nombre = procesar_dataframe(io.BytesIO(self.data), '6', 'RESO.txt', formato='parquet')
+        self.assertEqual(nombre, 'RESO_resoluciones.zip')
+        with zipfile.ZipFile(output) as zf:
+            for opcion, tipo in [('3', 'T1'), ('4', 'T2'), ('5', 'T3')]:
+                separado, _ = procesar_dataframe(io.BytesIO(self.data), opcion, 'RESO.txt', formato='parquet')
+                pd.testing.assert_frame_equal(
+                    pd.read_parquet(io.BytesIO(zf.read(f'RESO_{tipo}.parquet'))), pd.read_parquet(separado))
+
+    def test_csv_streaming_igual_al_normal(self):
+        lineas = [linea_resolucion(i, '1') for i in range(60)]
+        data = ("\r\n".join(lineas) + "\r\n").encode('latin-1')
+        bloques, nombre = procesar_csv_streaming(io.BytesIO(data), '3', 'RESO.txt', bytes_bloque=2000)
+        self.assertEqual(nombre, 'RESO.csv.gz')
+        partes = list(bloques)
+        self.assertGreater(len(partes), 2)
+        normal, _ = procesar_dataframe(io.BytesIO(data), '3', 'RESO.txt', formato='csv.gz')
+        pd.testing.assert_frame_equal(pd.read_csv(io.BytesIO(b''.join(partes)), compression='gzip'),
+                                      pd.read_csv(normal, compression='gzip'))
+        # Un CSV tiene un solo encabezado: la resolución completa no se admite
+        with self.assertRaises(ValueError):
+            procesar_csv_streaming(io.BytesIO(self.data), '6', 'RESO.txt')
+
+
+class TestIntegridad(unittest.TestCase):
+    def setUp(self):
+        r1 = LAYOUTS['R1']
+        base = {'Departamento': '70', 'Municipio': '215', 'TipoRegistro': '1'}
+        predio_a, predio_b = '0100000000010001000000000', '0100000000010002000000000'
+        lineas = [
+            armar_linea(r1, {**base, 'NoPredial': predio_a, 'NoOrden': '001', 'TotalRegistro': '002'}),
+            armar_linea(r1, {**base, 'NoPredial': predio_a, 'NoOrden': '002', 'TotalRegistro': '002'}),
+            # Predio B declara 3 registros, trae 2 y repite el NoOrden 001
+            armar_linea(r1, {**base, 'NoPredial': predio_b, 'NoOrden': '001', 'TotalRegistro': '003'}),
+            armar_linea(r1, {**base, 'NoPredial': predio_b, 'NoOrden': '001', 'TotalRegistro': '003'})[:300],
+        ]
+        self.data = "\r\n".join(lineas).encode('latin-1')
+
+    def test_reporte_json_en_zip(self):
+        output, nombre = procesar_dataframe(io.BytesIO(self.data), '1', 'R1.txt', formato='parquet', integridad=True)
+        self.assertEqual(nombre, 'R1.zip')
+        with zipfile.ZipFile(output) as zf:
+            self.assertEqual(len(pd.read_parquet(io.BytesIO(zf.read('R1.parquet')))), 4)
+            reporte = json.loads(zf.read('R1_INTEGRIDAD.json'))
+        self.assertEqual(reporte['anomalias_longitud'], 1)
+        self.assertEqual(reporte['ejemplos_longitud'], [{'registro': 4, 'longitud': 300}])
+        self.assertEqual(reporte['por_tipo_registro'], {'1': 4})
+        r1 = reporte['layouts']['R1']
+        self.assertEqual((r1['predios'], r1['predios_inconsistentes'], r1['duplicados']), (2, 1, 1))
+        self.assertEqual(r1['ejemplos_duplicados'], [{'predio': '702150100000000010002000000000', 'no_orden': 1}])
+
+    def test_hoja_integridad_en_excel(self):
+        output, _ = procesar_dataframe(io.BytesIO(self.data), '1', 'R1.txt', integridad=True)
+        hojas = pd.read_excel(output, sheet_name=None)
+        self.assertEqual(list(hojas), ['Datos', 'INTEGRIDAD'])
+        self.assertIn('Predios inconsistentes (NoOrden/TotalRegistro)', set(hojas['INTEGRIDAD']['Indicador']))
+
+
+class TestLoteZip(unittest.TestCase):
+    def test_lote_con_resumen_y_rechazos(self):
+        entrada = io.BytesIO()
+        with zipfile.ZipFile(entrada, 'w') as zf:
+            for i in range(3):
+                lineas = [linea_resolucion(j, '1') for j in range(i + 2)]
+                zf.writestr(f"SUCRE/RESO_{i}.txt", "\r\n".join(lineas).encode('latin-1'))
+            zf.writestr("SUCRE/RESO_corto.txt", linea_resolucion(0, '1')[:300].encode('latin-1'))
+            zf.writestr("LEEME.pdf", b"%PDF")
+        with tempfile.TemporaryDirectory() as tmp:
+            ruta = os.path.join(tmp, 'salida.zip')
+            resumen = pd.DataFrame(procesar_lote_zip(entrada, '3', ruta, formato='csv.gz', max_workers=2)).set_index('archivo')
+            with zipfile.ZipFile(ruta) as zf:
+                nombres = zf.namelist()
+        self.assertEqual(list(resumen.loc[[f"SUCRE/RESO_{i}.txt" for i in range(3)], 'filas']), [2, 3, 4])
+        self.assertEqual(resumen.loc["SUCRE/RESO_corto.txt", 'anomalias_longitud'], 1)
+        self.assertEqual(resumen.loc["LEEME.pdf", 'estado'], 'RECHAZADO')
+        self.assertIn('SUCRE/RESO_0.csv.gz', nombres)
+        self.assertIn('RESUMEN_LOTE.csv', nombres)
+
+    def test_nombres_de_salida_repetidos(self):
+        entrada = io.BytesIO()
+        datos = "\r\n".join(linea_resolucion(j, '1') for j in range(2)).encode('latin-1')
+        with zipfile.ZipFile(entrada, 'w') as zf:
+            for nombre in ["RESO.txt", "RESO.prn", "reso.TXT", "a/RESO.txt", "b/RESO.txt"]:
+                zf.writestr(nombre, datos)
+        with tempfile.TemporaryDirectory() as tmp:
+            ruta = os.path.join(tmp, 'salida.zip')
+            resumen = procesar_lote_zip(entrada, '3', ruta, formato='csv.gz', max_workers=1)
+            with zipfile.ZipFile(ruta) as zf:
+                nombres = zf.namelist()
+        self.assertEqual(len(nombres), len(set(n.lower() for n in nombres)))
+        self.assertEqual(sorted(r['salida'] for r in resumen),
+                         ['RESO.csv.gz', 'RESO_2.csv.gz', 'a/RESO.csv.gz', 'b/RESO.csv.gz', 'reso_3.csv.gz'])
+        self.assertEqual(len(nombres), 6)
+
+
+class TestPrediosR1R2(unittest.TestCase):
+    def test_una_fila_por_predio(self):
+        r1, r2 = LAYOUTS['R1'], LAYOUTS['R2']
+        base = {'Departamento': '70', 'Municipio': '215'}
+        lineas_r1 = [
+            armar_linea(r1, {**base, 'NoPredial': '0100000000010001000000000', 'NoOrden': '001', 'Nombre': 'ANA', 'TipoDocumento': 'C', 'NoDocumento': '11', 'Avaluo ($)': '1000'}),
+            armar_linea(r1, {**base, 'NoPredial': '0100000000010001000000000', 'NoOrden': '002', 'Nombre': 'LUIS', 'TipoDocumento': 'C', 'NoDocumento': '22', 'Avaluo ($)': '1000'}),
+            armar_linea(r1, {**base, 'NoPredial': '0100000000010002000000000', 'NoOrden': '001', 'Nombre': 'EVA', 'TipoDocumento': 'C', 'NoDocumento': '33', 'Avaluo ($)': '500'}),
+        ]
+        lineas_r2 = [
+            armar_linea(r2, {**base, 'NoPredial': '0100000000010001000000000', 'NoOrden': '001', 'AreaConstruida_1 (m2)': '80', 'AreaConstruida_2 (m2)': '20'}),
+            armar_linea(r2, {**base, 'NoPredial': '0100000000010001000000000', 'NoOrden': '002', 'AreaConstruida_1 (m2)': '50'}),
+            armar_linea(r2, {**base, 'NoPredial': '0000000000010009000000000', 'NoOrden': '001', 'AreaConstruida_1 (m2)': '10'}),
+        ]
+        output, nombre = procesar_predios("\r\n".join(lineas_r1).encode('latin-1'), "\r\n".join(lineas_r2).encode('latin-1'), 'R1_70215.txt')
+        df = pd.read_parquet(output).set_index('Predial_Nacional')
+
+        self.assertEqual(nombre, 'R1_70215_PREDIOS.parquet')
+        self.assertEqual(len(df), 3)
+        predio = df.loc['702150100000000010001000000000']
+        self.assertEqual(predio['Propietarios'], 'ANA (C 11) | LUIS (C 22)')
+        self.assertEqual(predio['NumPropietarios'], 2)
+        self.assertEqual(predio['AreaConstruida_R2 (m2)'], 150)
+        self.assertEqual(predio['Construcciones'], 3)
+        self.assertEqual(df['Fuente'].value_counts().to_dict(), {'AMBOS': 1, 'SOLO_R1': 1, 'SOLO_R2': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
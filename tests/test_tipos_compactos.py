@@ -0,0 +1,51 @@
+import unittest
+import io
+import sys
+import os
+import numpy as np
+import pandas as pd
+
+# Add modules to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from modules.tipos_compactos import compactar_dataframe, reducir_numerica, combinar_columnas
+from modules.renumeracion_auditor import AuditoriaSNC
+
+
+class TestTiposCompactos(unittest.TestCase):
+    def test_reduccion_sin_perdida(self):
+        self.assertEqual(reducir_numerica(pd.Series([1000.0, 2500000.0])).dtype, np.int32)
+        self.assertEqual(reducir_numerica(pd.Series([3_000_000_000, 1])).dtype, np.int64)
+        self.assertEqual(reducir_numerica(pd.Series([0.5, np.nan])).dtype, np.float32)
+        # 0.1 no es exacto en float32: se conserva float64
+        self.assertEqual(reducir_numerica(pd.Series([0.1, 2.0])).dtype, np.float64)
+
+    def test_compactar_y_combinar(self):
+        df = pd.DataFrame({'Municipio': ['215', '215', '001'], 'NPN': ['70215' + '0' * 25] * 3, 'Avaluo': [1.0, 2.0, 3.0]})
+        compactar_dataframe(df, categoricas=['Municipio'], textos=['NPN'], numericas=['Avaluo'])
+        self.assertIsInstance(df['Municipio'].dtype, pd.CategoricalDtype)
+        self.assertEqual(df['NPN'].iloc[0], '70215' + '0' * 25)
+        self.assertEqual(df['Avaluo'].dtype, np.int32)
+
+        pre = pd.Series(['A', None, None], dtype='category')
+        post = pd.Series(['B', 'C', None], dtype='category')
+        combinado = combinar_columnas(pre, post, '-')
+        self.assertIsInstance(combinado.dtype, pd.CategoricalDtype)
+        self.assertEqual(list(combinado), ['A', 'C', '-'])
+
+    def test_renumeracion_no_toca_columnas_desconocidas(self):
+        # OBSERVACION tiene un solo valor: con el umbral automático quedaba categórica y
+        # asignarle un texto nuevo fallaba con TypeError
+        df = pd.DataFrame({'NÚMERO_PREDIAL_CICA': ['70215' + '0' * 25] * 40, 'NÚMERO_PREDIAL_SNC': ['70215' + '1' * 25] * 40,
+                           'ESTADO': ['ACTIVO'] * 40, 'OBSERVACION': ['SIN NOVEDAD'] * 40})
+        buffer = io.BytesIO()
+        df.to_excel(buffer, index=False)
+        buffer.seek(0)
+        motor = AuditoriaSNC()
+        self.assertTrue(motor.cargar_datos(buffer, '1'))
+        self.assertIsInstance(motor.df['ESTADO'].dtype, pd.CategoricalDtype)
+        self.assertNotIsInstance(motor.df['OBSERVACION'].dtype, pd.CategoricalDtype)
+        motor.df.loc[0, 'OBSERVACION'] = 'REVISAR'
+
+
+if __name__ == '__main__':
+    unittest.main()